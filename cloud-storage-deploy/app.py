@@ -1,13 +1,28 @@
 from flask import Flask, render_template
 from models.db import db
+from models.schema import ensure_schema
 from routes.auth_routes import auth_bp
 from routes.file_routes import file_bp
 from routes.share_routes import share_bp
 from routes.analytics_routes import analytics_bp
 from routes.folder_routes import folder_bp
 from routes.preview_routes import preview_bp
+from routes.admin_routes import admin_bp
+from routes.storage_routes import storage_bp
+from routes.metrics_routes import metrics_bp
+from routes.export_routes import export_bp
+from routes.asset_routes import assets_bp
+from routes.sync_routes import sync_bp
+from routes.version_routes import version_bp
+from utils.job_queue import job_queue
+from utils.tasks import register_schedules
+from utils.rate_limit import rate_limiter
+from utils import instrumentation, compression, assets, sessions
 from config import config
 import os
+import logging
+
+logger = logging.getLogger(__name__)
 
 def create_app(config_name=None):
     app = Flask(__name__, static_folder='static', static_url_path='/static')
@@ -17,11 +32,14 @@ def create_app(config_name=None):
         config_name = os.environ.get('FLASK_CONFIG', 'default')
     
     app.config.from_object(config[config_name])
+    logging.basicConfig(level=app.config['LOG_LEVEL'],
+                        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
     
     # Initialize database
     if not db.connect():
-        print("Failed to connect to database")
+        logger.error("Failed to connect to database")
         return None
+    ensure_schema()
     
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/')
@@ -30,6 +48,30 @@ def create_app(config_name=None):
     app.register_blueprint(analytics_bp, url_prefix='/')
     app.register_blueprint(folder_bp, url_prefix='/')
     app.register_blueprint(preview_bp, url_prefix='/')
+    app.register_blueprint(admin_bp, url_prefix='/')
+    app.register_blueprint(storage_bp, url_prefix='/')
+    app.register_blueprint(metrics_bp, url_prefix='/')
+    app.register_blueprint(export_bp, url_prefix='/')
+    app.register_blueprint(assets_bp, url_prefix='/')
+    app.register_blueprint(sync_bp, url_prefix='/')
+    app.register_blueprint(version_bp, url_prefix='/')
+    
+    # Request timing, query counting and the sampling profiler
+    instrumentation.init_app(app)
+    
+    # Brotli/gzip for text responses, fingerprinted static assets
+    compression.init_app(app)
+    assets.init_app(app)
+    
+    # Server-side sessions
+    sessions.init_app(app)
+    
+    # Token-bucket limits on share links and auth (store chosen by RATE_LIMIT_STORE)
+    rate_limiter.init_app(app)
+    
+    # Background jobs (workers start with the first request)
+    job_queue.init_app(app)
+    register_schedules()
     
     # Add template context processor
     @app.context_processor
@@ -108,4 +150,4 @@ if __name__ == '__main__':
             debug=True  # Enable debug mode
         )
     else:
-        print("Failed to create application")
+        logger.error("Failed to create application")
@@ -0,0 +1,225 @@
+"""ASGI entry point for serving I/O-bound routes on an event loop.
+
+    uvicorn --factory asgi:create_asgi_app --host 0.0.0.0 --port 8000
+
+The Flask app from ``create_app()`` is mounted behind ``PooledWsgiToAsgi``
+and still serves every route. Plain ``WsgiToAsgi`` runs every WSGI request
+on one shared thread, so one slow request (an event stream, a long-poll, a
+large upload) would stall the whole process; here they run on a pool of
+ASGI_WSGI_THREADS threads instead. A few hot GET paths are answered here first:
+
+    /share/<token>, /download/<id>, /api/preview-info/<id>, /api/folder_tree
+
+Their database lookups are awaited on a pooled aiomysql connection, so a
+single process can hold thousands of them open while MySQL or storage is
+slow. The response itself is then built by the same view helpers inside a
+Flask request context on a small thread pool, so templates, flashes,
+compression, sessions and metrics behave exactly as under WSGI.
+
+A handler that cannot answer on its own (no session, a server-side session
+backend other than sqlite, folder aggregates that need rebuilding) returns
+None and the request falls through to the Flask app unchanged.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from flask import Response, jsonify
+from werkzeug.datastructures import Headers
+from werkzeug.sansio.request import Request
+from app import create_app
+from config import Config
+from models.async_db import async_db
+from models.file_model import File
+from models.folder_model import Folder
+from models.share_model import ShareLink
+from routes.file_routes import redirect_to_download
+from routes.folder_routes import folder_tree_args, folder_tree_response
+from routes.preview_routes import preview_info_payload
+from routes.share_routes import render_shared_file
+from utils.change_feed import event_bus
+from utils.instrumentation import begin_async_request
+from utils.listing_cache import listing_cache
+from utils.rate_limit import rate_limiter, too_many_requests
+from utils.sessions import SQLiteSessionInterface
+
+logger = logging.getLogger(__name__)
+
+class PooledWsgiInstance(WsgiToAsgiInstance):
+    """One WSGI request, run on the adapter's thread pool"""
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        # The undecorated method, which asgiref would pin to its single sync thread
+        run = functools.partial(WsgiToAsgiInstance.run_wsgi_app.__wrapped__, self)
+        return await sync_to_async(run, thread_sensitive=False, executor=self.executor)(body)
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """``WsgiToAsgi`` that runs requests concurrently on ``executor``.
+
+    asgiref's adapter runs them thread-sensitively, i.e. one at a time on a
+    single thread per process; the Flask app is thread-safe, so it can have
+    as many as the pool holds.
+    """
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        await PooledWsgiInstance(self.wsgi_application, self.executor)(scope, receive, send)
+
+class AsyncApp:
+    """ASGI application: async hot paths with the Flask app as fallback"""
+
+    def __init__(self, flask_app, render_threads=8, wsgi_threads=32):
+        self.flask_app = flask_app
+        self.wsgi_executor = ThreadPoolExecutor(max_workers=wsgi_threads, thread_name_prefix='asgi-wsgi')
+        self.wsgi = PooledWsgiToAsgi(flask_app, self.wsgi_executor)
+        self.executor = ThreadPoolExecutor(max_workers=render_threads, thread_name_prefix='asgi-render')
+        self.routes = [
+            (re.compile(r'/share/(?P<token>[^/]+)'), self.shared_file),
+            (re.compile(r'/download/(?P<file_id>\d+)'), self.download_file),
+            (re.compile(r'/api/preview-info/(?P<file_id>\d+)'), self.preview_info),
+            (re.compile(r'/api/folder_tree'), self.folder_tree),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            for pattern, handler in self.routes:
+                match = pattern.fullmatch(scope['path'])
+                if match:
+                    begin_async_request()
+                    request = self._request(scope)
+                    build = await handler(request, **match.groupdict())
+                    if build is not None:
+                        response = await self.run_sync(self._finish, scope, request, build)
+                        return await self._send(send, scope, response)
+                    break
+        return await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_db.close()
+                self.executor.shutdown(wait=False)
+                self.wsgi_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def run_sync(self, func, *args):
+        """Run blocking ``func`` on the render pool, keeping context variables"""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, functools.partial(context.run, func, *args))
+
+    def _request(self, scope):
+        headers = Headers([(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope['headers']])
+        client = scope.get('client')
+        return Request(scope['method'], scope.get('scheme', 'http'), scope.get('server'),
+                       scope.get('root_path', ''), scope['path'], scope.get('query_string', b''),
+                       headers, client[0] if client else None)
+
+    def _finish(self, scope, request, build):
+        """Build and post-process the response inside a Flask request context"""
+        app = self.flask_app
+        with app.test_request_context(
+                request.path, method=request.method, query_string=scope.get('query_string', b''),
+                headers=list(request.headers.items()),
+                base_url=f"{request.scheme}://{request.host}{request.root_path}",
+                environ_base={'REMOTE_ADDR': request.remote_addr}):
+            rv = app.preprocess_request()
+            if rv is None:
+                rv = build()
+            return app.process_response(app.make_response(rv))
+
+    async def _send(self, send, scope, response):
+        body = b'' if scope['method'] == 'HEAD' else response.get_data()
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                        for k, v in response.headers.to_wsgi_list()],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def user_id(self, request):
+        """Logged-in user from the SQLite session store, or None to fall back to Flask"""
+        interface = self.flask_app.session_interface
+        if not isinstance(interface, SQLiteSessionInterface):
+            return None
+        cookie = request.cookies.get(interface.get_cookie_name(self.flask_app))
+        sid = interface.sid_from_cookie(self.flask_app, cookie)
+        if not sid:
+            return None
+        data = await self.run_sync(interface.store.load, sid)
+        return (data or {}).get('user_id')
+
+    async def shared_file(self, request, token):
+        if self.flask_app.config.get('RATE_LIMIT_ENABLED', True):
+            for rule, limit, value in (('share-ip', Config.SHARE_RATE_LIMIT_PER_IP, request.remote_addr or 'unknown'),
+                                       ('share-token', Config.SHARE_RATE_LIMIT_PER_TOKEN, token)):
+                retry_after = await self.run_sync(rate_limiter.check, rule, limit, value)
+                if retry_after is not None:
+                    return lambda: too_many_requests(retry_after)
+        file_info = await async_db.fetch_one(ShareLink.FILE_INFO_QUERY, (token,))
+        return lambda: render_shared_file(file_info, token)
+
+    async def download_file(self, request, file_id):
+        user_id = await self.user_id(request)
+        if user_id is None:
+            return None
+        file_details = await async_db.fetch_one(File.OWNED_QUERY, (int(file_id), user_id))
+        return lambda: redirect_to_download(file_details)
+
+    async def preview_info(self, request, file_id):
+        user_id = await self.user_id(request)
+        if user_id is None:
+            return None
+        file_details = await async_db.fetch_one(File.OWNED_QUERY, (int(file_id), user_id))
+        if not file_details:
+            return lambda: (jsonify({'error': 'Unauthorized access'}), 403)
+        return lambda: jsonify(preview_info_payload(file_details))
+
+    async def folder_tree(self, request):
+        user_id = await self.user_id(request)
+        if user_id is None:
+            return None
+        parent_id, limit, offset = folder_tree_args(request.args)
+
+        etag = await self.run_sync(listing_cache.etag, user_id, f"tree:{parent_id}:{limit}:{offset}")
+        if etag in request.if_none_match:
+            return lambda: Response(status=304, headers={'ETag': f'"{etag}"'})
+
+        if parent_id is not None and not await async_db.fetch_one(Folder.OWNED_QUERY, (parent_id, user_id)):
+            return lambda: (jsonify({'error': 'Folder not found'}), 404)
+
+        query, params = Folder.children_page_query(user_id, parent_id, limit, offset)
+        rows = await async_db.fetch_query(query, params)
+        if rows is None or Folder.needs_stats_rebuild(rows):
+            # Rebuilding aggregates is a write-heavy path; leave it to the Flask view
+            return None
+        folders, has_more = Folder.finish_children_page(list(rows), limit)
+        return lambda: folder_tree_response(etag, parent_id, folders, has_more, limit, offset)
+
+def create_asgi_app(config_name=None):
+    flask_app = create_app(config_name)
+    if flask_app is None:
+        raise RuntimeError("Failed to create the Flask app")
+    wsgi_threads = flask_app.config.get('ASGI_WSGI_THREADS', 32)
+    # Streams and long-polls hold a WSGI thread each; leave at least half for other requests
+    event_bus.max_subscribers = max(1, min(event_bus.max_subscribers, wsgi_threads // 2))
+    return AsyncApp(flask_app, render_threads=flask_app.config.get('ASGI_RENDER_THREADS', 8),
+                    wsgi_threads=wsgi_threads)
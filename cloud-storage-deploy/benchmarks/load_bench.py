@@ -0,0 +1,216 @@
+"""End-to-end load benchmark for the Flask app.
+
+Drives ``create_app()`` in-process through the Flask test client with
+scripted workloads and reports throughput and p50/p95/p99 latency per
+endpoint. S3 is replaced by the in-memory stand-in (utils/fake_s3.py) with
+configurable latency and failure rate; the database is the one configured
+in config.py, so point it at a scratch MySQL schema.
+
+Usage (from the cloud-storage-deploy directory):
+
+    python benchmarks/load_bench.py --users 8 --rounds 20 --s3-latency 0.05
+    python benchmarks/load_bench.py --workloads dashboard,share --json results.json
+"""
+import argparse
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKLOADS = ('login', 'upload', 'dashboard', 'share', 'analytics')
+
+class Recorder:
+    """Collects per-endpoint latencies from all benchmark threads"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def timed(self, endpoint, func, ok_status=(200, 302, 304)):
+        start = time.perf_counter()
+        response = func()
+        self.record(endpoint, time.perf_counter() - start, response.status_code in ok_status)
+        return response
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def summarize(recorder, wall_seconds):
+    rows = []
+    for endpoint, values in sorted(recorder.samples.items()):
+        values = sorted(values)
+        rows.append({
+            'endpoint': endpoint,
+            'requests': len(values),
+            'errors': recorder.errors.get(endpoint, 0),
+            'throughput_rps': len(values) / wall_seconds if wall_seconds else 0.0,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+            'max_ms': values[-1] * 1000,
+        })
+    return rows
+
+def print_report(rows, wall_seconds):
+    header = f"{'endpoint':<28}{'reqs':>7}{'errs':>6}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        print(f"{row['endpoint']:<28}{row['requests']:>7}{row['errors']:>6}{row['throughput_rps']:>9.1f}"
+              f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}")
+    total = sum(row['requests'] for row in rows)
+    print(f"\n{total} requests in {wall_seconds:.2f}s ({total / wall_seconds:.1f} req/s overall)")
+
+class VirtualUser:
+    """One simulated browser session running the selected workloads"""
+
+    def __init__(self, app, recorder, args, index):
+        self.app = app
+        self.client = app.test_client()
+        self.recorder = recorder
+        self.args = args
+        self.email = f"bench-{args.run_id}-{index}@example.com"
+        self.password = 'benchmark-password'
+        self.file_ids = []
+        self.share_tokens = []
+
+    def setup(self):
+        self.client.post('/register', data={
+            'name': f'Bench {self.email}', 'email': self.email,
+            'password': self.password, 'confirm_password': self.password
+        })
+        self.login()
+
+    def login(self):
+        return self.recorder.timed('POST /login', lambda: self.client.post('/login', data={
+            'email': self.email, 'password': self.password
+        }))
+
+    def upload(self):
+        files = [(io.BytesIO(os.urandom(self.args.file_size)), f"bench_{uuid.uuid4().hex[:8]}.txt")
+                 for _ in range(self.args.files_per_upload)]
+        data = {'files': files, 'folder_id': ''}
+        if self.args.async_upload:
+            data['async'] = '1'
+        return self.recorder.timed('POST /upload', lambda: self.client.post(
+            '/upload', data=data, content_type='multipart/form-data'), ok_status=(200, 202, 302))
+
+    def refresh_file_ids(self):
+        from models.file_model import File
+        from models.user_model import User
+        with self.app.app_context():
+            user = User.get_by_email(self.email)
+            self.file_ids = [f['id'] for f in File.get_by_user(user['id'])] if user else []
+
+    def dashboard(self):
+        self.recorder.timed('GET /dashboard', lambda: self.client.get('/dashboard'))
+        self.recorder.timed('GET /api/folder_tree', lambda: self.client.get('/api/folder_tree'))
+        for file_id in self.file_ids[:3]:
+            self.recorder.timed('GET /api/preview-info', lambda: self.client.get(f'/api/preview-info/{file_id}'))
+            self.recorder.timed('GET /download', lambda: self.client.get(f'/download/{file_id}'))
+
+    def create_shares(self):
+        for file_id in self.file_ids[:2]:
+            response = self.recorder.timed('GET /generate-share', lambda: self.client.get(f'/generate-share/{file_id}'))
+            match = re.search(rb'/share/([A-Za-z0-9]{32})', response.data)
+            if match:
+                self.share_tokens.append(match.group(1).decode())
+
+    def share_storm(self):
+        # Share links are public, so the storm runs without the session cookie
+        anonymous = self.app.test_client()
+        for token in self.share_tokens:
+            for _ in range(self.args.share_hits):
+                self.recorder.timed('GET /share/<token>', lambda: anonymous.get(f'/share/{token}'))
+
+    def analytics(self):
+        self.recorder.timed('GET /analytics', lambda: self.client.get('/analytics'))
+        self.recorder.timed('GET /analytics/api/storage', lambda: self.client.get('/analytics/api/storage-chart'))
+        self.recorder.timed('GET /analytics/api/activity', lambda: self.client.get('/analytics/api/activity-chart'))
+
+    def run(self):
+        from models.db import db
+        # Each thread handles its own requests, so give it its own connection
+        db.use_dedicated_connection()
+        self.setup()
+        workloads = self.args.workloads
+        for _ in range(self.args.rounds):
+            if 'login' in workloads:
+                self.login()
+            if 'upload' in workloads:
+                self.upload()
+            if not self.file_ids or 'upload' in workloads:
+                self.refresh_file_ids()
+            if 'dashboard' in workloads:
+                self.dashboard()
+            if 'share' in workloads:
+                if not self.share_tokens:
+                    self.create_shares()
+                self.share_storm()
+            if 'analytics' in workloads:
+                self.analytics()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=4, help='concurrent virtual users')
+    parser.add_argument('--rounds', type=int, default=10, help='workload rounds per user')
+    parser.add_argument('--workloads', default=','.join(WORKLOADS), help='comma separated subset of ' + ','.join(WORKLOADS))
+    parser.add_argument('--files-per-upload', type=int, default=3)
+    parser.add_argument('--file-size', type=int, default=64 * 1024, help='bytes per uploaded file')
+    parser.add_argument('--share-hits', type=int, default=20, help='requests per share link per round')
+    parser.add_argument('--async-upload', action='store_true', help='use the accept-then-process upload mode')
+    parser.add_argument('--s3-latency', type=float, default=0.0, help='seconds added to each S3 call')
+    parser.add_argument('--s3-failure-rate', type=float, default=0.0, help='probability an S3 call fails')
+    parser.add_argument('--rate-limit', action='store_true', help='keep rate limiting on (off by default)')
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args()
+    args.workloads = set(w.strip() for w in args.workloads.split(',') if w.strip())
+    args.run_id = uuid.uuid4().hex[:8]
+
+    from utils.fake_s3 import InMemoryS3Client
+    from utils.s3_service import s3_service
+    s3_service.s3_client = InMemoryS3Client(latency=args.s3_latency, failure_rate=args.s3_failure_rate)
+
+    from app import create_app
+    app = create_app()
+    if app is None:
+        sys.exit('Could not create the app (is the database reachable?)')
+    app.config['TESTING'] = True
+    app.config['RATE_LIMIT_ENABLED'] = args.rate_limit
+
+    recorder = Recorder()
+    users = [VirtualUser(app, recorder, args, i) for i in range(args.users)]
+    threads = [threading.Thread(target=user.run, name=f'bench-user-{i}') for i, user in enumerate(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - start
+
+    rows = summarize(recorder, wall_seconds)
+    print_report(rows, wall_seconds)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'wall_seconds': wall_seconds, 'args': {k: (sorted(v) if isinstance(v, set) else v)
+                                                              for k, v in vars(args).items()},
+                       'endpoints': rows}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Memory benchmark for large file listings.
+
+Compares the retained and peak memory of the ways a listing can be
+materialized: dictionary-cursor rows from ``SELECT *`` (the old path),
+dicts with only the listing columns, compact ``FileRow`` objects, and
+streaming through a generator in ``fetchmany`` batches.
+
+By default rows are synthesized in-process, so no database is needed.
+With ``--user-id`` the same comparison runs against the configured MySQL
+database using the real query paths.
+
+Usage (from the cloud-storage-deploy directory):
+
+    python benchmarks/memory_bench.py --rows 100000
+    python benchmarks/memory_bench.py --user-id 42
+"""
+import argparse
+import datetime
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.rows import FileRow
+
+ALL_COLUMNS = FileRow.__slots__
+LISTING_COLUMNS = ('id', 'folder_id', 'file_name', 'file_size', 'created_at')
+
+def synthetic_values(count, columns):
+    """Yield row tuples shaped like the driver's output for ``columns``"""
+    base = datetime.datetime(2024, 1, 1)
+    for i in range(count):
+        record = {
+            'id': i + 1,
+            'user_id': 7,
+            'folder_id': i % 50 or None,
+            'file_name': f"report_{i:07d}.pdf",
+            'file_size': 1024 + i,
+            's3_key': f"uploads/7/7_{i:032x}.pdf",
+            's3_url': f"https://bucket.s3.us-east-1.amazonaws.com/uploads/7/7_{i:032x}.pdf",
+            'is_public': 0,
+            'created_at': base + datetime.timedelta(seconds=i),
+            'codec': None,
+            'storage_tier': 'standard',
+            'tier_changed_at': None,
+        }
+        yield tuple(record[c] for c in columns)
+
+def measure(label, build):
+    """Run ``build`` under tracemalloc and report what it retains and its peak"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rows = result if isinstance(result, int) else len(result)
+    del result
+    return {'variant': label, 'rows': rows, 'retained_mb': current / 1e6, 'peak_mb': peak / 1e6,
+            'bytes_per_row': current / rows if rows else 0}
+
+def consume(iterator):
+    count = 0
+    for _ in iterator:
+        count += 1
+    return count
+
+def synthetic_variants(count, batch_size):
+    def stream():
+        # Mirrors Database.stream_query: only one fetchmany batch is alive at a time
+        values = synthetic_values(count, ALL_COLUMNS)
+        while True:
+            batch = [v for _, v in zip(range(batch_size), values)]
+            if not batch:
+                return
+            for v in batch:
+                yield FileRow.from_values(ALL_COLUMNS, v)
+
+    return [
+        ('dict rows, SELECT *', lambda: [dict(zip(ALL_COLUMNS, v)) for v in synthetic_values(count, ALL_COLUMNS)]),
+        ('dict rows, projected', lambda: [dict(zip(LISTING_COLUMNS, v)) for v in synthetic_values(count, LISTING_COLUMNS)]),
+        ('FileRow, SELECT *', lambda: [FileRow.from_values(ALL_COLUMNS, v) for v in synthetic_values(count, ALL_COLUMNS)]),
+        ('FileRow, projected', lambda: [FileRow.from_values(LISTING_COLUMNS, v) for v in synthetic_values(count, LISTING_COLUMNS)]),
+        ('streamed FileRow', lambda: consume(stream())),
+    ]
+
+def database_variants(user_id, batch_size):
+    from models.db import db
+    from models.file_model import File
+    if not db.connect():
+        sys.exit('Could not connect to the database')
+    select = ', '.join(LISTING_COLUMNS)
+    return [
+        ('dict rows, SELECT *', lambda: db.fetch_query("SELECT * FROM files WHERE user_id = %s", (user_id,)) or []),
+        ('dict rows, projected', lambda: db.fetch_query(f"SELECT {select} FROM files WHERE user_id = %s", (user_id,)) or []),
+        ('FileRow, projected', lambda: db.fetch_rows(f"SELECT {select} FROM files WHERE user_id = %s", FileRow, (user_id,)) or []),
+        ('streamed FileRow', lambda: consume(File.iter_by_user(user_id, batch_size=batch_size))),
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='synthetic rows to build')
+    parser.add_argument('--user-id', type=int, help="measure this user's files in the configured database instead")
+    parser.add_argument('--batch-size', type=int, default=1000, help='fetchmany batch size for streaming')
+    args = parser.parse_args()
+
+    if args.user_id is None:
+        variants = synthetic_variants(args.rows, args.batch_size)
+    else:
+        variants = database_variants(args.user_id, args.batch_size)
+
+    results = [measure(label, build) for label, build in variants]
+    header = f"{'variant':<24}{'rows':>9}{'retained MB':>14}{'peak MB':>10}{'bytes/row':>11}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['variant']:<24}{r['rows']:>9}{r['retained_mb']:>14.1f}{r['peak_mb']:>10.1f}{r['bytes_per_row']:>11.0f}")
+
+if __name__ == '__main__':
+    main()
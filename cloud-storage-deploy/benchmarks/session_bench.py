@@ -0,0 +1,113 @@
+"""Session store benchmark under concurrent requests.
+
+Runs a minimal Flask app with each session backend and drives it from
+several threads through the test client. Each virtual user logs in once
+(creating a session) and then issues requests that mostly read the
+session and occasionally modify it, like the real app's page views and
+flash messages. Reports throughput and p50/p99 latency per backend.
+
+Backends: ``sqlite`` (utils/sessions.py), ``filesystem`` (Flask-Session,
+the previous configuration) and ``cookie`` (Flask's signed-cookie default).
+
+Usage (from the cloud-storage-deploy directory):
+
+    python benchmarks/session_bench.py --users 16 --requests 500 --write-ratio 0.1
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, session
+from load_bench import percentile
+
+BACKENDS = ('sqlite', 'filesystem', 'cookie')
+
+def make_app(backend, workdir):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'session-bench'
+    if backend == 'sqlite':
+        from utils.sessions import SQLiteSessionInterface, SQLiteSessionStore
+        store = SQLiteSessionStore(os.path.join(workdir, 'sessions.db'))
+        app.session_interface = SQLiteSessionInterface(store)
+    elif backend == 'filesystem':
+        from flask_session import Session
+        app.config['SESSION_TYPE'] = 'filesystem'
+        app.config['SESSION_FILE_DIR'] = os.path.join(workdir, 'flask_session')
+        app.config['SESSION_USE_SIGNER'] = True
+        Session(app)
+
+    @app.route('/login/<int:user_id>')
+    def login(user_id):
+        session['user_id'] = user_id
+        session['user_name'] = f'User {user_id}'
+        return 'ok'
+
+    @app.route('/page')
+    def page():
+        return str(session.get('user_id'))
+
+    @app.route('/flash')
+    def flash_message():
+        session['notices'] = session.get('notices', 0) + 1
+        return 'ok'
+
+    return app
+
+def run_backend(backend, args):
+    workdir = tempfile.mkdtemp(prefix=f'session-bench-{backend}-')
+    try:
+        app = make_app(backend, workdir)
+        latencies = []
+        lock = threading.Lock()
+
+        def user(index):
+            client = app.test_client()
+            client.get(f'/login/{index}')
+            rng = random.Random(index)
+            samples = []
+            for _ in range(args.requests):
+                path = '/flash' if rng.random() < args.write_ratio else '/page'
+                start = time.perf_counter()
+                client.get(path)
+                samples.append(time.perf_counter() - start)
+            with lock:
+                latencies.extend(samples)
+
+        threads = [threading.Thread(target=user, args=(i,)) for i in range(args.users)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies.sort()
+    return {'backend': backend, 'requests': len(latencies), 'rps': len(latencies) / wall,
+            'p50_ms': percentile(latencies, 50) * 1000, 'p99_ms': percentile(latencies, 99) * 1000}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=300, help='requests per client')
+    parser.add_argument('--write-ratio', type=float, default=0.1, help='fraction of requests that modify the session')
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    args = parser.parse_args()
+
+    header = f"{'backend':<12}{'reqs':>8}{'rps':>10}{'p50 ms':>9}{'p99 ms':>9}"
+    print(header)
+    print('-' * len(header))
+    for backend in (b.strip() for b in args.backends.split(',') if b.strip()):
+        row = run_backend(backend, args)
+        print(f"{row['backend']:<12}{row['requests']:>8}{row['rps']:>10.1f}{row['p50_ms']:>9.2f}{row['p99_ms']:>9.2f}")
+
+if __name__ == '__main__':
+    main()
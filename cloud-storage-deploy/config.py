@@ -16,15 +16,86 @@ class Config:
     AWS_SECRET_ACCESS_KEY = 'your_actual_aws_secret_key'
     AWS_REGION = 'us-east-1'
     S3_BUCKET_NAME = 'your-unique-bucket-name'
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # S3-compatible server, e.g. MinIO
+    
+    # In-memory S3 stand-in for offline development and benchmarks
+    S3_STANDIN = os.environ.get('S3_STANDIN') == '1'
+    S3_STANDIN_LATENCY = float(os.environ.get('S3_STANDIN_LATENCY', '0'))  # Seconds per call
+    S3_STANDIN_FAILURE_RATE = float(os.environ.get('S3_STANDIN_FAILURE_RATE', '0'))
 
     
+    # Storage Backend Configuration
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 's3')  # 's3' or 'local'
+    LOCAL_STORAGE_ROOT = 'storage/local'  # Sharded local object store
+    LOCAL_STORAGE_FSYNC = 'file'  # 'always' (file and directory), 'file' or 'never'
+    LOCAL_COLD_STORAGE_ROOT = os.environ.get('LOCAL_COLD_STORAGE_ROOT')  # Archive directory for local files (unset: none)
+    PRESIGNED_URL_EXPIRY = 3600  # Seconds
+    PREVIEW_MAX_BYTES = 1024 * 1024  # Leading bytes fetched for text previews
+    
+    # Read-through Disk Cache for S3 Objects (per process)
+    BLOB_CACHE_DIR = 'storage/blob_cache'
+    BLOB_CACHE_MAX_BYTES = int(os.environ.get('BLOB_CACHE_MAX_BYTES', str(1024 ** 3)))  # 0 disables the cache
+    BLOB_CACHE_BLOCK_SIZE = 1024 * 1024  # Objects are cached and fetched in blocks of this size
+    
+    # Compression at Rest (needs the zstandard package)
+    BLOB_COMPRESSION = os.environ.get('BLOB_COMPRESSION', '1') == '1'
+    BLOB_COMPRESS_LEVEL = 3  # zstd level used for stored blobs
+    BLOB_COMPRESS_SAMPLE_BYTES = 128 * 1024  # Leading bytes test-compressed to decide eligibility
+    BLOB_COMPRESS_MIN_SIZE = 4096  # Smaller files are stored as uploaded
+    BLOB_COMPRESS_MAX_RATIO = 0.8  # Compress only when the sample shrinks to this fraction or less
+    
+    # Storage Tiering (cold files move to cheaper storage classes)
+    TIERING_ENABLED = os.environ.get('TIERING_ENABLED', '0') == '1'
+    TIERING_INTERVAL = 24 * 3600  # Seconds between tiering passes
+    TIERING_BATCH_SIZE = 500  # Files examined per query
+    TIERING_TIME_BUDGET = 120  # Seconds a tiering job runs before handing the rest to a follow-up job
+    TIER_INFREQUENT_DAYS = 30  # Days without access before a file moves to the infrequent-access class
+    TIER_ARCHIVE_DAYS = 180  # Days without access before a file is archived
+    TIER_HOT_ACCESSES = 3  # Accesses within TIER_INFREQUENT_DAYS that bring a cold file back to standard
+    TIER_MIN_SIZE = 128 * 1024  # Smaller files stay standard (S3 bills infrequent-access objects at 128KB minimum)
+    TIER_MIN_RESIDENCY_DAYS = 30  # Days a file stays in a tier before it may move again
+    TIER_INFREQUENT_CLASS = 'STANDARD_IA'
+    TIER_ARCHIVE_CLASS = 'GLACIER'  # 'GLACIER' and 'DEEP_ARCHIVE' need a restore before reads; 'GLACIER_IR' does not
+    TIER_RESTORE_SPEED = 'Standard'  # Archive retrieval tier: 'Expedited', 'Standard' or 'Bulk'
+    TIER_RESTORE_DAYS = 7  # Days a restored copy stays readable
+    TIER_RESTORE_ETA = 4 * 3600  # Seconds clients are told to wait while a restore runs
+    TIER_RESTORE_POLL_INTERVAL = 900  # Seconds before checking whether a restore has finished
+    
+    # File Versioning (re-uploading a name into the same folder adds a version)
+    FILE_VERSIONING = os.environ.get('FILE_VERSIONING', '1') == '1'
+    FILE_VERSIONS_KEEP = 20  # Older versions of a file beyond this many are discarded
+    CHUNK_MIN_SIZE = 256 * 1024  # Content-defined chunk bounds; changing them stops new chunks matching old ones
+    CHUNK_AVG_SIZE = 1024 * 1024  # Target chunk size, a power of two
+    CHUNK_MAX_SIZE = 4 * 1024 * 1024
+    CHUNK_GC_INTERVAL = 3600  # Seconds between chunk collector runs
+    CHUNK_GC_GRACE_HOURS = 24  # Unreferenced chunks are kept this long before their blobs are deleted
+    
+    # Trash (deleted files are kept and can be restored until purged)
+    TRASH_RETENTION_DAYS = 30  # Days a deleted file stays restorable
+    TRASH_PURGE_INTERVAL = 3600  # Seconds between purge passes
+    TRASH_PURGE_BATCH_SIZE = 1000  # Files per batch (one S3 DeleteObjects call holds up to 1000 keys)
+    TRASH_DELETE_CHUNK_SIZE = 200  # Rows per DELETE statement
+    TRASH_PURGE_PAUSE = 1.0  # Seconds between batches, to cap the load on storage and MySQL
+    TRASH_PURGE_TIME_BUDGET = 120  # Seconds a purge job runs before handing the rest to a follow-up job
+    
+    # Analytics Storage (raw analytics tables are partitioned by month)
+    ANALYTICS_PARTITIONING = os.environ.get('ANALYTICS_PARTITIONING', '0') == '1'  # First run rebuilds each table once
+    ANALYTICS_MAINTENANCE_INTERVAL = 24 * 3600  # Seconds between partition maintenance runs
+    ANALYTICS_PARTITIONS_AHEAD = 2  # Empty future months kept ready so inserts never land in pmax
+    ANALYTICS_RAW_MONTHS = 3  # Months of raw rows kept besides the current one; keep above TIER_INFREQUENT_DAYS
+    ANALYTICS_ROLLUP_RETENTION_MONTHS = 24  # Months of daily totals kept for compacted data (0 keeps them forever)
+    ANALYTICS_ROLLUP_PRUNE_BATCH_SIZE = 5000  # Rollup rows per DELETE statement
+    ANALYTICS_MAINTENANCE_TIME_BUDGET = 300  # Seconds a run works before handing the rest to a follow-up job
+    
     # Flask Configuration
     SECRET_KEY = 'your_secret_key_here_change_in_production'
     UPLOAD_FOLDER = 'static/temp_uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     
     # Session Configuration
-    SESSION_TYPE = 'filesystem'
+    SESSION_TYPE = os.environ.get('SESSION_TYPE', 'sqlite')  # 'sqlite' or any Flask-Session type
+    SESSION_DB = 'sessions.db'  # SQLite WAL file shared by the host's workers
+    SESSION_SWEEP_INTERVAL = 3600  # Seconds between expired-session sweeps
     SESSION_PERMANENT = False
     SESSION_USE_SIGNER = True
     SESSION_KEY_PREFIX = 'cloud_storage_'
@@ -34,6 +105,96 @@ class Config:
     
     # Share Link Configuration
     DEFAULT_SHARE_EXPIRY_HOURS = 24
+    SHARE_LINK_RETENTION_DAYS = 7  # Expired links and their access analytics are kept this long for reports
+    SHARE_SWEEP_INTERVAL = 3600  # Seconds between expiry sweeps
+    SHARE_SWEEP_BATCH_SIZE = 500  # Expired links deleted per batch
+    SHARE_SWEEP_ANALYTICS_BATCH_SIZE = 5000  # share_analytics rows per DELETE statement
+    SHARE_SWEEP_PAUSE = 0.2  # Seconds between batches so the sweep never holds locks for long
+    SHARE_SWEEP_TIME_BUDGET = 60  # Seconds a sweep runs before handing the rest to a follow-up job
+    
+    # Folder Tree API Configuration
+    FOLDER_TREE_PAGE_SIZE = 100  # Folders per level returned by default
+    FOLDER_TREE_MAX_PAGE_SIZE = 500  # Hard cap on folders per response
+    
+    # Change Feed Configuration (/api/changes)
+    CHANGES_PAGE_SIZE = 500  # Journal rows read per response
+    CHANGES_LONG_POLL_TIMEOUT = 25  # Longest a request may wait for changes, in seconds
+    CHANGES_POLL_INTERVAL = 2  # Seconds between journal checks while waiting (changes from other workers)
+    CHANGES_SETTLE_SECONDS = 2  # Journal rows younger than this are held back until earlier ids have committed
+    CHANGES_RETENTION_DAYS = 30  # Older journal rows are pruned; older cursors must resync
+    CHANGES_PRUNE_INTERVAL = 24 * 3600
+    
+    # Live Event Streams (/api/events, per worker process; long-polls count too)
+    EVENT_STREAMS_MAX = 16  # Open streams and long-polls per process; each holds a worker thread, so keep well under the server's threads
+    EVENT_STREAMS_PER_USER = 4  # Per user (roughly one per open tab)
+    EVENT_STREAM_HEARTBEAT = 15  # Seconds between keep-alive comments on an idle stream
+    EVENT_STREAM_MAX_DURATION = 300  # Streams end after this; browsers reconnect with Last-Event-ID
+    EVENT_STREAM_RETRY_MS = 3000  # Reconnect delay suggested to the browser
+    
+    # Listing Cache Configuration (entries per worker process, generations per host)
+    LISTING_CACHE_MAX_ENTRIES = 1024  # Cached (user, folder) listings
+    LISTING_CACHE_DB = 'listing.db'  # SQLite WAL file holding the per-user generations shared by the host's workers
+    
+    # Background Job Queue Configuration
+    JOB_QUEUE_DB = 'jobs.db'  # SQLite file shared by worker processes on this host
+    JOB_QUEUE_WORKERS = 2  # Worker threads per process (0 disables processing)
+    JOB_QUEUE_VISIBILITY_TIMEOUT = 300  # Seconds before a claimed job is retried
+    JOB_QUEUE_RETRY_BASE = 5  # Seconds before the first retry, doubled per attempt
+    JOB_QUEUE_RETENTION = 24 * 3600  # Seconds finished jobs are kept
+    TEMP_UPLOAD_CLEANUP_INTERVAL = 3600
+    TEMP_UPLOAD_MAX_AGE = 6 * 3600  # Temp files older than this are orphans
+    STORAGE_RECONCILE_INTERVAL = 24 * 3600
+    UPLOAD_BATCH_RETENTION_HOURS = 24  # Status of async uploads is kept this long
+    
+    # Direct-to-S3 Browser Uploads (S3 backend only)
+    DIRECT_UPLOADS = os.environ.get('DIRECT_UPLOADS') == '1'  # Browser uploads straight to the bucket
+    DIRECT_UPLOAD_MAX_SIZE = 5 * 1024 ** 3  # Bytes per file in direct mode
+    DIRECT_UPLOAD_PART_SIZE = 16 * 1024 * 1024  # Multipart part size; smaller files use one presigned POST
+    DIRECT_UPLOAD_CONCURRENCY = 4  # Parts each browser sends in parallel
+    DIRECT_UPLOAD_URL_EXPIRY = 3600  # Seconds presigned POST policies and part URLs stay valid
+    DIRECT_UPLOAD_ABANDON_HOURS = 24  # Unfinished direct uploads are aborted after this
+    DIRECT_UPLOAD_SWEEP_INTERVAL = 3600
+    
+    # Administration
+    ADMIN_EMAILS = set(filter(None, os.environ.get('ADMIN_EMAILS', '').split(',')))
+    
+    # Logging and Instrumentation
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')  # DEBUG also logs every SQL statement
+    N_PLUS_ONE_THRESHOLD = 5  # Warn when one statement repeats more often in a request
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))  # Fraction of requests run under cProfile
+    PROFILE_DIR = 'profiles'  # Where sampled .prof files are written
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Bearer token required by /metrics when set
+    
+    # Response Compression and Static Assets
+    COMPRESS_MIN_SIZE = 1024  # Bytes; smaller text responses are sent as-is
+    COMPRESS_LEVEL = 6  # gzip level for dynamic responses
+    BROTLI_QUALITY = 5  # brotli quality for dynamic responses (static variants use the maximum)
+    ASSET_BUILD_DIR = 'build/assets'  # Fingerprinted and precompressed CSS/JS, rebuilt at startup
+    
+    # Rate Limiting (token buckets: (tokens per second, burst))
+    RATE_LIMIT_ENABLED = True
+    RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'memory')  # 'memory' (per process) or 'sqlite' (per host)
+    RATE_LIMIT_DB = 'ratelimit.db'
+    SHARE_RATE_LIMIT_PER_IP = (2.0, 60)  # Share page views from one client
+    SHARE_RATE_LIMIT_PER_TOKEN = (10.0, 100)  # Views of one share link from everywhere
+    LOGIN_RATE_LIMIT_PER_IP = (10 / 60, 20)  # Login attempts from one client
+    LOGIN_RATE_LIMIT_PER_ACCOUNT = (5 / 60, 10)  # Login attempts against one email
+    REGISTER_RATE_LIMIT_PER_IP = (1 / 60, 5)
+    SHARE_CREATE_RATE_LIMIT_PER_USER = (0.5, 30)  # Share links one user may create
+    DIRECT_UPLOAD_RATE_LIMIT_PER_USER = (2.0, 60)  # Direct-upload start, presign and complete calls from one user
+    EXPORT_RATE_LIMIT_PER_USER = (1 / 60, 5)  # Dataset exports (each streams a full table scan)
+    
+    # Password Hashing
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:600000'  # Changing this rehashes each user at their next login
+    PASSWORD_HASH_WORKERS = 2  # Hashing processes per app process (0 hashes in the request thread)
+    PASSWORD_HASH_MAX_PENDING = 32  # Queued hash operations before logins get a 503
+    PASSWORD_HASH_TIMEOUT = 10  # Seconds to wait for a hash result
+    
+    # ASGI Serving Mode (asgi.py)
+    ASYNC_DB_POOL_MIN = 1
+    ASYNC_DB_POOL_MAX = 20  # MySQL connections shared by all in-flight async requests
+    ASGI_RENDER_THREADS = 8  # Threads for template rendering and other sync work
+    ASGI_WSGI_THREADS = 32  # Threads for routes served by the Flask app (streams and long-polls hold one each)
     
     @staticmethod
     def init_app(app):
@@ -1,7 +1,158 @@
 from models.db import db
 import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+def add_months(month, count):
+    """First day of the month ``count`` months after (or before) ``month``"""
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+def rollup_before(table):
+    """SQL for the first day ``table`` still holds raw rows for.
+
+    A month is compacted into daily totals before its partition is dropped,
+    so reports read rollup days only before this point; until the drop the
+    raw rows are counted instead of their totals.
+    """
+    return (f"(SELECT COALESCE(MAX(raw_since), '9999-12-31') FROM analytics_compaction "
+            f"WHERE table_name = '{table}')")
+
+class AnalyticsPartitions:
+    """Monthly RANGE partitions of the raw analytics tables.
+
+    Partition ``pYYYYMM`` holds the rows of that month and ``pmax`` catches
+    anything past the newest one. Queries that filter on the time column
+    read only the partitions in their window, and expired months are
+    removed with DROP PARTITION instead of row-by-row DELETEs.
+    """
+    LOCK_NAME = 'analytics_partitions'
+
+    @staticmethod
+    def partition_name(month):
+        return f"p{month:%Y%m}"
+
+    @staticmethod
+    def _definitions(months):
+        definitions = [
+            f"PARTITION {AnalyticsPartitions.partition_name(month)} "
+            f"VALUES LESS THAN (UNIX_TIMESTAMP('{add_months(month, 1):%Y-%m-%d}'))"
+            for month in months
+        ]
+        definitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+        return ', '.join(definitions)
+
+    @staticmethod
+    def get_months(table):
+        """Months that have a partition, oldest first; None if ``table`` is not partitioned.
+
+        Raises if the partition layout cannot be read, so a failed lookup is
+        never mistaken for an unpartitioned table.
+        """
+        query = """
+        SELECT PARTITION_NAME AS name FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        ORDER BY PARTITION_ORDINAL_POSITION
+        """
+        rows = db.fetch_query(query, (table,))
+        if not rows:
+            raise RuntimeError(f"Failed to read the partitions of {table}")
+        names = [row['name'] for row in rows if row['name']]
+        if not names:
+            return None
+        return [datetime.date(int(name[1:5]), int(name[5:7]), 1) for name in names if name != 'pmax']
+
+    @staticmethod
+    def get_oldest(table, column):
+        """Time of the oldest row in ``table``, None if it is empty"""
+        result = db.fetch_one(f"SELECT MIN({column}) AS oldest FROM {table}")
+        if result is None:
+            raise RuntimeError(f"Failed to read the oldest row of {table}")
+        return result['oldest']
+
+    @staticmethod
+    def partition(table, column, months):
+        """Rebuild an unpartitioned table with one partition per month in ``months``.
+
+        Partitioning needs the time column in the primary key, and InnoDB
+        does not allow foreign keys on partitioned tables, so those are
+        dropped first. This copies the whole table once.
+        """
+        query = """
+        SELECT CONSTRAINT_NAME AS name FROM information_schema.TABLE_CONSTRAINTS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND CONSTRAINT_TYPE = 'FOREIGN KEY'
+        """
+        foreign_keys = db.fetch_query(query, (table,))
+        if foreign_keys is None:
+            return False
+        if foreign_keys:
+            drops = ', '.join(f"DROP FOREIGN KEY {row['name']}" for row in foreign_keys)
+            if db.execute_query(f"ALTER TABLE {table} {drops}") is None:
+                return False
+        query = f"""
+        ALTER TABLE {table}
+            MODIFY {column} TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            DROP PRIMARY KEY, ADD PRIMARY KEY (id, {column})
+        PARTITION BY RANGE (UNIX_TIMESTAMP({column})) ({AnalyticsPartitions._definitions(months)})
+        """
+        return db.execute_query(query) is not None
+
+    @staticmethod
+    def extend(table, months):
+        """Split partitions for ``months``, all newer than the existing ones, out of pmax"""
+        if not months:
+            return True
+        query = f"""
+        ALTER TABLE {table} REORGANIZE PARTITION pmax
+        INTO ({AnalyticsPartitions._definitions(months)})
+        """
+        return db.execute_query(query) is not None
+
+    @staticmethod
+    def drop_month(table, month):
+        query = f"ALTER TABLE {table} DROP PARTITION {AnalyticsPartitions.partition_name(month)}"
+        return db.execute_query(query) is not None
+
+    @staticmethod
+    def prune_rollups(table, before, batch_size):
+        """Delete rollup rows for days before ``before``, ``batch_size`` rows per statement; returns rows deleted"""
+        query = f"DELETE FROM {table} WHERE day < %s LIMIT %s"
+        deleted = 0
+        while True:
+            cursor = db.execute_query(query, (before, batch_size))
+            if cursor is None:
+                raise RuntimeError(f"Failed to prune {table}")
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return deleted
+
+    @staticmethod
+    def set_raw_since(table, month):
+        """Record ``month`` as the oldest month ``table`` still holds raw"""
+        query = """
+        INSERT INTO analytics_compaction (table_name, raw_since) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE raw_since = VALUES(raw_since)
+        """
+        return db.execute_query(query, (table, month)) is not None
+
+    @staticmethod
+    def lock():
+        """Take the maintenance lock on this connection; False if another worker holds it"""
+        result = db.fetch_one("SELECT GET_LOCK(%s, 0) AS locked", (AnalyticsPartitions.LOCK_NAME,))
+        return bool(result and result['locked'])
+
+    @staticmethod
+    def unlock():
+        db.fetch_one("SELECT RELEASE_LOCK(%s) AS released", (AnalyticsPartitions.LOCK_NAME,))
 
 class ShareAnalytics:
+    """Share link visits. Months older than ANALYTICS_RAW_MONTHS are kept only as
+    daily totals in share_analytics_daily, so reports read both tables."""
+    TABLE = 'share_analytics'
+    TIME_COLUMN = 'access_time'
+    ROLLUP_TABLE = 'share_analytics_daily'
+
     def __init__(self, share_link_id=None, ip_address=None, user_agent=None):
         self.share_link_id = share_link_id
         self.ip_address = ip_address
@@ -18,30 +169,81 @@ class ShareAnalytics:
     
     @staticmethod
     def get_share_stats(share_link_id):
-        query = """
-        SELECT COUNT(*) as total_accesses, 
-               COUNT(DISTINCT ip_address) as unique_visitors,
-               MIN(access_time) as first_access,
-               MAX(access_time) as last_access
-        FROM share_analytics 
-        WHERE share_link_id = %s
-        """
-        result = db.fetch_one(query, (share_link_id,))
+        """Totals for a link; visitors in compacted months are counted once per day"""
+        query = f"""
+        SELECT CAST(SUM(accesses) AS UNSIGNED) as total_accesses,
+               CAST(SUM(visitors) AS UNSIGNED) as unique_visitors,
+               MIN(first_access) as first_access,
+               MAX(last_access) as last_access
+        FROM (
+            SELECT COUNT(*) AS accesses, COUNT(DISTINCT ip_address) AS visitors,
+                   MIN(access_time) AS first_access, MAX(access_time) AS last_access
+            FROM share_analytics
+            WHERE share_link_id = %s
+            UNION ALL
+            SELECT SUM(accesses), SUM(unique_visitors), MIN(first_at), MAX(last_at)
+            FROM share_analytics_daily
+            WHERE share_link_id = %s AND day < {rollup_before('share_analytics')}
+        ) stats
+        """
+        result = db.fetch_one(query, (share_link_id, share_link_id))
         return result
     
     @staticmethod
     def get_access_timeline(share_link_id, days=7):
-        query = """
-        SELECT DATE(access_time) as date, COUNT(*) as accesses
-        FROM share_analytics 
-        WHERE share_link_id = %s 
-        AND access_time >= DATE_SUB(NOW(), INTERVAL %s DAY)
-        GROUP BY DATE(access_time)
+        query = f"""
+        SELECT date, CAST(SUM(accesses) AS UNSIGNED) as accesses
+        FROM (
+            SELECT DATE(access_time) AS date, COUNT(*) AS accesses
+            FROM share_analytics
+            WHERE share_link_id = %s
+            AND access_time >= DATE_SUB(NOW(), INTERVAL %s DAY)
+            GROUP BY DATE(access_time)
+            UNION ALL
+            SELECT day, accesses FROM share_analytics_daily
+            WHERE share_link_id = %s
+            AND day >= DATE(DATE_SUB(NOW(), INTERVAL %s DAY)) AND day < {rollup_before('share_analytics')}
+        ) timeline
+        GROUP BY date
         ORDER BY date
         """
-        return db.fetch_query(query, (share_link_id, days))
+        return db.fetch_query(query, (share_link_id, days, share_link_id, days))
+    
+    @staticmethod
+    def compact_day(day):
+        """Total one day of raw visits into share_analytics_daily; safe to repeat"""
+        query = """
+        INSERT INTO share_analytics_daily (share_link_id, day, accesses, unique_visitors, first_at, last_at)
+        SELECT share_link_id, %s, COUNT(*), COUNT(DISTINCT ip_address), MIN(access_time), MAX(access_time)
+        FROM share_analytics
+        WHERE access_time >= %s AND access_time < %s
+        GROUP BY share_link_id
+        ON DUPLICATE KEY UPDATE
+            accesses = VALUES(accesses), unique_visitors = VALUES(unique_visitors),
+            first_at = VALUES(first_at), last_at = VALUES(last_at)
+        """
+        return db.execute_query(query, (day, day, day + datetime.timedelta(days=1))) is not None
+    
+    @staticmethod
+    def iter_by_owner(user_id, batch_size=1000):
+        """Stream every access to the user's share links, oldest first"""
+        query = """
+        SELECT sa.id, sa.share_link_id, sl.file_id, f.file_name, sa.ip_address, sa.user_agent, sa.access_time
+        FROM share_analytics sa
+        JOIN shared_links sl ON sa.share_link_id = sl.id
+        JOIN files f ON sl.file_id = f.id
+        WHERE f.user_id = %s
+        ORDER BY sa.id
+        """
+        return db.stream_query(query, (user_id,), batch_size=batch_size)
 
 class UserAnalytics:
+    """Actions users take. Months older than ANALYTICS_RAW_MONTHS are kept only as
+    daily counts in user_analytics_daily, so reports read both tables."""
+    TABLE = 'user_analytics'
+    TIME_COLUMN = 'timestamp'
+    ROLLUP_TABLE = 'user_analytics_daily'
+
     def __init__(self, user_id=None, action_type=None, details=None):
         self.user_id = user_id
         self.action_type = action_type
@@ -58,57 +260,101 @@ class UserAnalytics:
     
     @staticmethod
     def get_user_activity(user_id, days=30):
-        query = """
-        SELECT action_type, COUNT(*) as count, DATE(timestamp) as date
-        FROM user_analytics 
-        WHERE user_id = %s 
-        AND timestamp >= DATE_SUB(NOW(), INTERVAL %s DAY)
-        GROUP BY action_type, DATE(timestamp)
+        query = f"""
+        SELECT action_type, CAST(SUM(count) AS UNSIGNED) as count, date
+        FROM (
+            SELECT action_type, COUNT(*) AS count, DATE(timestamp) AS date
+            FROM user_analytics
+            WHERE user_id = %s
+            AND timestamp >= DATE_SUB(NOW(), INTERVAL %s DAY)
+            GROUP BY action_type, DATE(timestamp)
+            UNION ALL
+            SELECT action_type, count, day FROM user_analytics_daily
+            WHERE user_id = %s
+            AND day >= DATE(DATE_SUB(NOW(), INTERVAL %s DAY)) AND day < {rollup_before('user_analytics')}
+        ) activity
+        GROUP BY action_type, date
         ORDER BY date DESC, count DESC
         """
         try:
-            result = db.fetch_query(query, (user_id, days))
+            result = db.fetch_query(query, (user_id, days, user_id, days))
             return result if result else []
         except Exception as e:
-            print(f"Error in get_user_activity: {e}")
+            logger.error("Error in get_user_activity: %s", e)
             return []
     
     @staticmethod
     def get_login_frequency(user_id, days=30):
-        query = """
-        SELECT DATE(timestamp) as date, COUNT(*) as logins
-        FROM user_analytics 
-        WHERE user_id = %s 
-        AND action_type = 'login'
-        AND timestamp >= DATE_SUB(NOW(), INTERVAL %s DAY)
-        GROUP BY DATE(timestamp)
+        query = f"""
+        SELECT date, CAST(SUM(logins) AS UNSIGNED) as logins
+        FROM (
+            SELECT DATE(timestamp) AS date, COUNT(*) AS logins
+            FROM user_analytics
+            WHERE user_id = %s
+            AND action_type = 'login'
+            AND timestamp >= DATE_SUB(NOW(), INTERVAL %s DAY)
+            GROUP BY DATE(timestamp)
+            UNION ALL
+            SELECT day, count FROM user_analytics_daily
+            WHERE user_id = %s
+            AND action_type = 'login'
+            AND day >= DATE(DATE_SUB(NOW(), INTERVAL %s DAY)) AND day < {rollup_before('user_analytics')}
+        ) logins
+        GROUP BY date
         ORDER BY date DESC
         """
         try:
-            result = db.fetch_query(query, (user_id, days))
+            result = db.fetch_query(query, (user_id, days, user_id, days))
             return result if result else []
         except Exception as e:
-            print(f"Error in get_login_frequency: {e}")
+            logger.error("Error in get_login_frequency: %s", e)
             return []
     
     @staticmethod
     def get_action_summary(user_id, days=30):
-        query = """
-        SELECT action_type, COUNT(*) as total
-        FROM user_analytics 
-        WHERE user_id = %s 
-        AND timestamp >= DATE_SUB(NOW(), INTERVAL %s DAY)
+        query = f"""
+        SELECT action_type, CAST(SUM(total) AS UNSIGNED) as total
+        FROM (
+            SELECT action_type, COUNT(*) AS total
+            FROM user_analytics
+            WHERE user_id = %s
+            AND timestamp >= DATE_SUB(NOW(), INTERVAL %s DAY)
+            GROUP BY action_type
+            UNION ALL
+            SELECT action_type, count FROM user_analytics_daily
+            WHERE user_id = %s
+            AND day >= DATE(DATE_SUB(NOW(), INTERVAL %s DAY)) AND day < {rollup_before('user_analytics')}
+        ) actions
         GROUP BY action_type
         ORDER BY total DESC
         """
         try:
-            result = db.fetch_query(query, (user_id, days))
+            result = db.fetch_query(query, (user_id, days, user_id, days))
             return result if result else []
         except Exception as e:
-            print(f"Error in get_action_summary: {e}")
+            logger.error("Error in get_action_summary: %s", e)
             return []
+    
+    @staticmethod
+    def compact_day(day):
+        """Count one day of raw actions into user_analytics_daily; safe to repeat"""
+        query = """
+        INSERT INTO user_analytics_daily (user_id, day, action_type, count)
+        SELECT user_id, %s, action_type, COUNT(*)
+        FROM user_analytics
+        WHERE timestamp >= %s AND timestamp < %s
+        GROUP BY user_id, action_type
+        ON DUPLICATE KEY UPDATE count = VALUES(count)
+        """
+        return db.execute_query(query, (day, day, day + datetime.timedelta(days=1))) is not None
 
 class FileAnalytics:
+    """Actions on files. Months older than ANALYTICS_RAW_MONTHS are kept only as
+    daily counts in file_analytics_daily, so reports read both tables."""
+    TABLE = 'file_analytics'
+    TIME_COLUMN = 'timestamp'
+    ROLLUP_TABLE = 'file_analytics_daily'
+
     def __init__(self, file_id=None, action_type=None, user_id=None, ip_address=None):
         self.file_id = file_id
         self.action_type = action_type
@@ -126,45 +372,79 @@ class FileAnalytics:
     
     @staticmethod
     def get_popular_files(user_id=None, limit=10):
+        owner_filter = "WHERE f.user_id = %s" if user_id else ""
+        rollup_owner_filter = "AND f.user_id = %s" if user_id else ""
+        query = f"""
+        SELECT file_name, CAST(SUM(access_count) AS UNSIGNED) as access_count,
+               CAST(SUM(downloads) AS UNSIGNED) as downloads
+        FROM (
+            SELECT fa.file_id, f.file_name, COUNT(fa.action_type) AS access_count,
+                   SUM(CASE WHEN fa.action_type = 'download' THEN 1 ELSE 0 END) AS downloads
+            FROM file_analytics fa
+            JOIN files f ON fa.file_id = f.id
+            {owner_filter}
+            GROUP BY fa.file_id, f.file_name
+            UNION ALL
+            SELECT fd.file_id, f.file_name, SUM(fd.count),
+                   SUM(CASE WHEN fd.action_type = 'download' THEN fd.count ELSE 0 END)
+            FROM file_analytics_daily fd
+            JOIN files f ON fd.file_id = f.id
+            WHERE fd.day < {rollup_before('file_analytics')} {rollup_owner_filter}
+            GROUP BY fd.file_id, f.file_name
+        ) file_accesses
+        GROUP BY file_id, file_name
+        ORDER BY access_count DESC
+        LIMIT %s
+        """
+        params = (user_id, user_id, limit) if user_id else (limit,)
         try:
-            if user_id:
-                query = """
-                SELECT f.file_name, COUNT(fa.action_type) as access_count,
-                       SUM(CASE WHEN fa.action_type = 'download' THEN 1 ELSE 0 END) as downloads
-                FROM file_analytics fa
-                JOIN files f ON fa.file_id = f.id
-                WHERE f.user_id = %s
-                GROUP BY fa.file_id, f.file_name
-                ORDER BY access_count DESC
-                LIMIT %s
-                """
-                result = db.fetch_query(query, (user_id, limit))
-                return result if result else []
-            else:
-                query = """
-                SELECT f.file_name, COUNT(fa.action_type) as access_count,
-                       SUM(CASE WHEN fa.action_type = 'download' THEN 1 ELSE 0 END) as downloads
-                FROM file_analytics fa
-                JOIN files f ON fa.file_id = f.id
-                GROUP BY fa.file_id, f.file_name
-                ORDER BY access_count DESC
-                LIMIT %s
-                """
-                result = db.fetch_query(query, (limit,))
-                return result if result else []
+            result = db.fetch_query(query, params)
+            return result if result else []
         except Exception as e:
-            print(f"Error in get_popular_files: {e}")
+            logger.error("Error in get_popular_files: %s", e)
             return []
     
     @staticmethod
     def get_file_stats(file_id):
-        query = """
-        SELECT action_type, COUNT(*) as count
-        FROM file_analytics 
-        WHERE file_id = %s
+        query = f"""
+        SELECT action_type, CAST(SUM(count) AS UNSIGNED) as count
+        FROM (
+            SELECT action_type, COUNT(*) AS count
+            FROM file_analytics
+            WHERE file_id = %s
+            GROUP BY action_type
+            UNION ALL
+            SELECT action_type, count FROM file_analytics_daily
+            WHERE file_id = %s AND day < {rollup_before('file_analytics')}
+        ) stats
         GROUP BY action_type
         """
-        return db.fetch_query(query, (file_id,))
+        return db.fetch_query(query, (file_id, file_id))
+    
+    @staticmethod
+    def compact_day(day):
+        """Count one day of raw actions into file_analytics_daily; safe to repeat"""
+        query = """
+        INSERT INTO file_analytics_daily (file_id, day, action_type, count, last_at)
+        SELECT file_id, %s, action_type, COUNT(*), MAX(timestamp)
+        FROM file_analytics
+        WHERE timestamp >= %s AND timestamp < %s
+        GROUP BY file_id, action_type
+        ON DUPLICATE KEY UPDATE count = VALUES(count), last_at = VALUES(last_at)
+        """
+        return db.execute_query(query, (day, day, day + datetime.timedelta(days=1))) is not None
+    
+    @staticmethod
+    def iter_by_owner(user_id, batch_size=1000):
+        """Stream every recorded action on the user's files, oldest first"""
+        query = """
+        SELECT fa.id, fa.file_id, f.file_name, fa.action_type, fa.user_id, fa.ip_address, fa.timestamp
+        FROM file_analytics fa
+        JOIN files f ON fa.file_id = f.id
+        WHERE f.user_id = %s
+        ORDER BY fa.id
+        """
+        return db.stream_query(query, (user_id,), batch_size=batch_size)
 
 class StorageStats:
     def __init__(self, user_id=None, total_files=0, total_size=0):
@@ -178,9 +458,9 @@ class StorageStats:
     def update_user_storage(user_id):
         # Calculate current storage usage
         query = """
-        SELECT COUNT(*) as file_count, COALESCE(SUM(s3_url), 0) as total_size
+        SELECT COUNT(*) as file_count, COALESCE(SUM(file_size), 0) as total_size
         FROM files 
-        WHERE user_id = %s
+        WHERE user_id = %s AND deleted_at IS NULL
         """
         result = db.fetch_one(query, (user_id,))
         
@@ -206,7 +486,7 @@ class StorageStats:
             result = db.fetch_one(query, (user_id,))
             return result
         except Exception as e:
-            print(f"Error in get_storage_usage: {e}")
+            logger.error("Error in get_storage_usage: %s", e)
             return None
     
     @staticmethod
@@ -0,0 +1,86 @@
+import asyncio
+import time
+import aiomysql
+from config import Config
+from utils.instrumentation import record_query
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AsyncDatabase:
+    """Pooled aiomysql access for the ASGI serving mode.
+
+    Mirrors the read side of ``Database`` (dict rows, same ``%s`` SQL, same
+    query metrics) so the models' queries can be reused unchanged. The pool
+    is created on first use inside the running event loop.
+    """
+
+    def __init__(self, minsize=1, maxsize=20):
+        self.config = Config()
+        self.minsize = minsize
+        self.maxsize = maxsize
+        self._pool = None
+        self._lock = None
+
+    async def pool(self):
+        if self._pool is None:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self._pool is None:
+                    self._pool = await aiomysql.create_pool(
+                        host=self.config.DB_HOST,
+                        port=self.config.DB_PORT,
+                        user=self.config.DB_USER,
+                        password=self.config.DB_PASSWORD or '',
+                        db=self.config.DB_NAME,
+                        minsize=self.minsize,
+                        maxsize=self.maxsize,
+                        autocommit=True
+                    )
+                    logger.info("Async MySQL pool opened (max %d connections)", self.maxsize)
+        return self._pool
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+            logger.info("Async MySQL pool closed")
+
+    async def _run(self, query, params, operation, fetch):
+        pool = await self.pool()
+        async with pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                start = time.perf_counter()
+                await cursor.execute(query, params)
+                result = await fetch(cursor)
+                record_query(query, time.perf_counter() - start, operation)
+                return result
+
+    async def fetch_query(self, query, params=None):
+        try:
+            return await self._run(query, params, 'fetch', lambda cursor: cursor.fetchall())
+        except aiomysql.Error as e:
+            logger.error("Error fetching data: %s", e)
+            return None
+
+    async def fetch_one(self, query, params=None):
+        try:
+            return await self._run(query, params, 'fetch_one', lambda cursor: cursor.fetchone())
+        except aiomysql.Error as e:
+            logger.error("Error fetching data: %s", e)
+            return None
+
+    async def execute_query(self, query, params=None):
+        """Run a statement; returns the affected row count, or None on error"""
+        async def rowcount(cursor):
+            return cursor.rowcount
+        try:
+            return await self._run(query, params, 'execute', rowcount)
+        except aiomysql.Error as e:
+            logger.error("Error executing query: %s", e)
+            return None
+
+# Async database instance
+async_db = AsyncDatabase(Config.ASYNC_DB_POOL_MIN, Config.ASYNC_DB_POOL_MAX)
@@ -0,0 +1,87 @@
+from models.db import db
+from utils.change_feed import event_bus
+
+class ChangeLog:
+    """Per-user journal of file and folder mutations, read by sync clients.
+
+    Each row carries the entity's state after the change (parent, name,
+    size), so replaying only the last row per entity is enough. Row ids
+    increase monotonically and serve as sync cursors.
+
+    AUTO_INCREMENT ids are handed out in insert order but committed in any
+    order, so a reader could see id N+1 before N commits and move its
+    cursor past N. Readers therefore stop at the first row younger than
+    ``settle`` seconds, by which time every earlier id has committed.
+    """
+    COLUMNS = ('id', 'entity', 'entity_id', 'action', 'parent_id', 'name', 'size')
+
+    @staticmethod
+    def record(user_id, entity, entity_id, action, parent_id=None, name=None, size=None):
+        return ChangeLog.record_many(user_id, [(entity, entity_id, action, parent_id, name, size)])
+
+    @staticmethod
+    def record_many(user_id, changes):
+        """Append (entity, entity_id, action, parent_id, name, size) tuples in one INSERT"""
+        if not changes:
+            return True
+        placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(changes))
+        params = [value for change in changes for value in (user_id, *change)]
+        query = f"""
+        INSERT INTO changes (user_id, entity, entity_id, action, parent_id, name, size)
+        VALUES {placeholders}
+        """
+        cursor = db.execute_query(query, params)
+        event_bus.publish(user_id)
+        return cursor is not None
+
+    @staticmethod
+    def get_since(user_id, cursor, limit, settle=0):
+        """Up to ``limit`` rows after ``cursor``, ending before the first unsettled one"""
+        query = f"""
+        SELECT {', '.join(ChangeLog.COLUMNS)}, created_at < NOW() - INTERVAL %s SECOND AS settled
+        FROM changes
+        WHERE user_id = %s AND id > %s
+        ORDER BY id
+        LIMIT %s
+        """
+        rows = db.fetch_query(query, (settle, user_id, cursor, limit)) or []
+        for i, row in enumerate(rows):
+            if not row.pop('settled'):
+                return rows[:i]
+        return rows
+
+    @staticmethod
+    def latest_cursor(user_id, settle=0):
+        """Cursor to sync from after a full listing: the user's newest settled row.
+
+        Without one, the cursor just below the retained journal, so it is
+        never mistaken for an expired one.
+        """
+        query = """
+        SELECT id FROM changes
+        WHERE user_id = %s AND created_at < NOW() - INTERVAL %s SECOND
+        ORDER BY id DESC LIMIT 1
+        """
+        result = db.fetch_one(query, (user_id, settle))
+        if result:
+            return result['id']
+        oldest = ChangeLog.oldest_retained()
+        return oldest - 1 if oldest else 0
+
+    @staticmethod
+    def oldest_retained():
+        """Smallest id still in the journal; cursors below it may have missed pruned changes"""
+        result = db.fetch_one("SELECT MIN(id) AS oldest FROM changes")
+        return result['oldest'] if result else None
+
+    @staticmethod
+    def prune(older_than_days, batch_size=5000):
+        """Delete journal rows older than ``older_than_days`` in bounded batches"""
+        query = """
+        DELETE FROM changes WHERE created_at < DATE_SUB(NOW(), INTERVAL %s DAY)
+        ORDER BY id LIMIT %s
+        """
+        while True:
+            cursor = db.execute_query(query, (older_than_days, batch_size))
+            if cursor is None or cursor.rowcount < batch_size:
+                return cursor is not None
@@ -1,48 +1,81 @@
 import mysql.connector
 from mysql.connector import Error
 import sqlite3
+import threading
+import time
 from config import Config
+from utils.instrumentation import record_query
+import logging
+
+logger = logging.getLogger(__name__)
 
 class Database:
     def __init__(self):
         self.config = Config()
-        self.connection = None
+        self._connection = None
+        self._local = threading.local()
+    
+    @property
+    def connection(self):
+        if getattr(self._local, 'dedicated', False):
+            return getattr(self._local, 'connection', None)
+        return self._connection
+    
+    @connection.setter
+    def connection(self, value):
+        if getattr(self._local, 'dedicated', False):
+            self._local.connection = value
+        else:
+            self._connection = value
+    
+    def use_dedicated_connection(self):
+        """Give the calling thread its own connection instead of the shared one.
+        
+        Background threads call this before their first query so they never
+        interleave statements with request handlers on the same connection.
+        """
+        self._local.dedicated = True
+    
+    def _open_connection(self):
+        return mysql.connector.connect(
+            host=self.config.DB_HOST,
+            user=self.config.DB_USER,
+            password=self.config.DB_PASSWORD,
+            database=self.config.DB_NAME
+        )
     
     def connect(self):
         # Use MySQL directly
         try:
-            self.connection = mysql.connector.connect(
-                host=self.config.DB_HOST,
-                user=self.config.DB_USER,
-                password=self.config.DB_PASSWORD,
-                database=self.config.DB_NAME
-            )
+            self.connection = self._open_connection()
             if self.connection.is_connected():
-                print("Connected to MySQL database")
+                logger.info("Connected to MySQL database")
                 return True
         except Error as e:
-            print(f"Error connecting to MySQL database: {e}")
+            logger.error("Error connecting to MySQL database: %s", e)
             return False
     
     def disconnect(self):
         if self.connection and self.connection.is_connected():
             self.connection.close()
-            print("MySQL connection closed")
+            logger.info("MySQL connection closed")
     
     def execute_query(self, query, params=None):
         if not self.connection or not self.connection.is_connected():
             if not self.connect():
                 return None
         cursor = self.connection.cursor()
+        start = time.perf_counter()
         try:
             if params:
                 cursor.execute(query, params)
             else:
                 cursor.execute(query)
             self.connection.commit()
+            record_query(query, time.perf_counter() - start, 'execute')
             return cursor
         except Error as e:
-            print(f"Error executing query: {e}")
+            logger.error("Error executing query: %s", e)
             self.connection.rollback()
             return None
     
@@ -51,15 +84,17 @@ class Database:
             if not self.connect():
                 return None
         cursor = self.connection.cursor(dictionary=True)
+        start = time.perf_counter()
         try:
             if params:
                 cursor.execute(query, params)
             else:
                 cursor.execute(query)
             result = cursor.fetchall()
+            record_query(query, time.perf_counter() - start, 'fetch')
             return result
         except Error as e:
-            print(f"Error fetching query: {e}")
+            logger.error("Error fetching query: %s", e)
             return None
         finally:
             cursor.close()
@@ -69,18 +104,70 @@ class Database:
             if not self.connect():
                 return None
         cursor = self.connection.cursor(dictionary=True)
+        start = time.perf_counter()
         try:
             if params:
                 cursor.execute(query, params)
             else:
                 cursor.execute(query)
             result = cursor.fetchone()
+            record_query(query, time.perf_counter() - start, 'fetch_one')
             return result
         except Error as e:
-            print(f"Error fetching one: {e}")
+            logger.error("Error fetching one: %s", e)
             return None
         finally:
             cursor.close()
+    
+    def fetch_rows(self, query, row_class, params=None):
+        """Like fetch_query, but build compact ``row_class`` instances instead of dicts"""
+        if not self.connection or not self.connection.is_connected():
+            if not self.connect():
+                return None
+        cursor = self.connection.cursor()
+        start = time.perf_counter()
+        try:
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            columns = cursor.column_names
+            result = [row_class.from_values(columns, values) for values in cursor.fetchall()]
+            record_query(query, time.perf_counter() - start, 'fetch')
+            return result
+        except Error as e:
+            logger.error("Error fetching rows: %s", e)
+            return None
+        finally:
+            cursor.close()
+    
+    def stream_query(self, query, params=None, row_class=None, batch_size=1000):
+        """Yield rows in fetchmany batches without materializing the result set.
+        
+        Runs on its own connection with an unbuffered cursor, so MySQL sends
+        rows as they are consumed and the shared connection stays free for
+        other queries while the caller iterates. Rows are ``row_class``
+        instances, or dicts when no class is given.
+        """
+        connection = self._open_connection()
+        cursor = connection.cursor()
+        start = time.perf_counter()
+        try:
+            cursor.execute(query, params or ())
+            columns = cursor.column_names
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                for values in batch:
+                    if row_class is None:
+                        yield dict(zip(columns, values))
+                    else:
+                        yield row_class.from_values(columns, values)
+            record_query(query, time.perf_counter() - start, 'stream')
+        finally:
+            # Closing the connection also discards any unread rows if the caller stopped early
+            connection.close()
 
 # Database instance
 db = Database()
@@ -1,8 +1,22 @@
 from models.db import db
+from models.folder_model import FolderStats
+from models.change_model import ChangeLog
+from utils.listing_cache import listing_cache
+from utils.identity_map import identity_map
+from models.rows import FileRow
 import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 class File:
-    def __init__(self, user_id=None, file_name=None, file_size=0, folder_id=None, s3_key=None, s3_url=None, is_public=False):
+    # Columns the dashboard listing renders
+    LISTING_COLUMNS = ('id', 'folder_id', 'file_name', 'file_size', 'created_at')
+    # Shared with the async serving mode (asgi.py)
+    OWNED_QUERY = "SELECT * FROM files WHERE id = %s AND user_id = %s AND deleted_at IS NULL"
+    
+    def __init__(self, user_id=None, file_name=None, file_size=0, folder_id=None, s3_key=None, s3_url=None, is_public=False,
+                 codec=None):
         self.user_id = user_id
         self.file_name = file_name
         self.file_size = file_size
@@ -10,41 +24,233 @@ class File:
         self.s3_key = s3_key
         self.s3_url = s3_url
         self.is_public = is_public
+        self.codec = codec
         self.id = None
         self.created_at = None
     
     def create(self):
-        query = "INSERT INTO files (user_id, file_name, file_size, folder_id, s3_key, s3_url, is_public) VALUES (%s, %s, %s, %s, %s, %s, %s)"
-        params = (self.user_id, self.file_name, self.file_size, self.folder_id, self.s3_key, self.s3_url, self.is_public)
+        query = "INSERT INTO files (user_id, file_name, file_size, folder_id, s3_key, s3_url, is_public, codec) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
+        params = (self.user_id, self.file_name, self.file_size, self.folder_id, self.s3_key, self.s3_url, self.is_public, self.codec)
         
         cursor = db.execute_query(query, params)
         if cursor:
             self.id = cursor.lastrowid
+            listing_cache.bump(self.user_id)
+            ChangeLog.record(self.user_id, 'file', self.id, 'created', self.folder_id, self.file_name, self.file_size)
+            if self.folder_id:
+                FolderStats.adjust(self.folder_id, self.user_id, file_delta=1, bytes_delta=self.file_size or 0)
             return True
         return False
     
     @staticmethod
-    def get_by_user(user_id, folder_id=None):
+    def get_by_user(user_id, folder_id=None, columns=LISTING_COLUMNS):
+        """Get a user's files in one folder (root when folder_id is None) as compact FileRows, trash excluded"""
+        select = ', '.join(columns)
         if folder_id is None:
-            query = "SELECT * FROM files WHERE user_id = %s AND folder_id IS NULL ORDER BY created_at DESC"
-            result = db.fetch_query(query, (user_id,))
+            query = f"SELECT {select} FROM files WHERE user_id = %s AND folder_id IS NULL AND deleted_at IS NULL ORDER BY created_at DESC"
+            result = db.fetch_rows(query, FileRow, (user_id,))
         else:
-            query = "SELECT * FROM files WHERE user_id = %s AND folder_id = %s ORDER BY created_at DESC"
-            result = db.fetch_query(query, (user_id, folder_id))
+            query = f"SELECT {select} FROM files WHERE user_id = %s AND folder_id = %s AND deleted_at IS NULL ORDER BY created_at DESC"
+            result = db.fetch_rows(query, FileRow, (user_id, folder_id))
         return result if result else []
     
+    @staticmethod
+    def iter_by_user(user_id, columns=FileRow.__slots__, batch_size=1000):
+        """Stream every file a user owns, across all folders, without loading them all at once"""
+        query = f"SELECT {', '.join(columns)} FROM files WHERE user_id = %s AND deleted_at IS NULL ORDER BY id"
+        return db.stream_query(query, (user_id,), row_class=FileRow, batch_size=batch_size)
+    
     @staticmethod
     def get_by_id(file_id):
-        query = "SELECT * FROM files WHERE id = %s"
-        result = db.fetch_one(query, (file_id,))
+        result = identity_map.get('file', file_id)
+        if result is None:
+            query = "SELECT * FROM files WHERE id = %s"
+            result = identity_map.put('file', file_id, db.fetch_one(query, (file_id,)))
+        return result
+    
+    @staticmethod
+    def get_owned(file_id, user_id):
+        """Get a file only if it belongs to the user, in a single query.
+        
+        Returns None for missing and trashed files and for files owned by
+        someone else. The row is kept in the request's identity map, so later
+        lookups of the same file in this request cost nothing.
+        """
+        result = identity_map.get('file', file_id)
+        if result is None:
+            result = identity_map.put('file', file_id, db.fetch_one(File.OWNED_QUERY, (file_id, user_id)))
+        if result is None or result['user_id'] != user_id or result.get('deleted_at') is not None:
+            return None
         return result
     
     @staticmethod
-    def delete(file_id, user_id):
-        query = "DELETE FROM files WHERE id = %s AND user_id = %s"
-        cursor = db.execute_query(query, (file_id, user_id))
+    def get_by_s3_key(s3_key):
+        """The file whose current content is the blob at ``s3_key``, trashed or not"""
+        query = "SELECT * FROM files WHERE s3_key = %s"
+        return db.fetch_one(query, (s3_key,))
+    
+    @staticmethod
+    def get_by_name(user_id, folder_id, file_name):
+        """The user's file called ``file_name`` in a folder (root when folder_id is None), if any"""
+        query = """
+        SELECT * FROM files WHERE user_id = %s AND folder_id <=> %s AND file_name = %s AND deleted_at IS NULL
+        ORDER BY id DESC LIMIT 1
+        """
+        return db.fetch_one(query, (user_id, folder_id, file_name))
+    
+    @staticmethod
+    def get_owned_many(file_ids, user_id):
+        """Get the files among file_ids owned by the user as {id: row}, in at most one query"""
+        owned = {}
+        missing = []
+        for file_id in set(int(file_id) for file_id in file_ids):
+            row = identity_map.get('file', file_id)
+            if row is None:
+                missing.append(file_id)
+            elif row['user_id'] == user_id and row.get('deleted_at') is None:
+                owned[file_id] = row
+        
+        if missing:
+            placeholders = ', '.join(['%s'] * len(missing))
+            query = f"SELECT * FROM files WHERE user_id = %s AND deleted_at IS NULL AND id IN ({placeholders})"
+            for row in db.fetch_query(query, (user_id, *missing)) or []:
+                owned[row['id']] = identity_map.put('file', row['id'], row)
+        return owned
+    
+    @staticmethod
+    def trash(file_ids, user_id):
+        """Move the user's files to the trash with one UPDATE; returns the ids trashed.
+        
+        Trashed files leave listings, folder aggregates and storage totals
+        at once. Their blobs stay until the trash purger deletes them.
+        """
+        owned = File.get_owned_many(file_ids, user_id)
+        if not owned:
+            return []
+        placeholders = ', '.join(['%s'] * len(owned))
+        query = f"""
+        UPDATE files SET deleted_at = NOW()
+        WHERE user_id = %s AND deleted_at IS NULL AND id IN ({placeholders})
+        """
+        cursor = db.execute_query(query, (user_id, *owned))
+        if cursor is None:
+            return []
+        for file_id in owned:
+            identity_map.discard('file', file_id)
+        listing_cache.bump(user_id)
+        ChangeLog.record_many(user_id, [('file', file_id, 'deleted', None, None, None) for file_id in owned])
+        
+        totals = {}
+        for row in owned.values():
+            if row['folder_id']:
+                count, size = totals.get(row['folder_id'], (0, 0))
+                totals[row['folder_id']] = (count + 1, size + (row['file_size'] or 0))
+        for folder_id, (count, size) in totals.items():
+            FolderStats.adjust(folder_id, user_id, file_delta=-count, bytes_delta=-size)
+        return list(owned)
+    
+    @staticmethod
+    def get_trashed(file_id, user_id):
+        query = "SELECT * FROM files WHERE id = %s AND user_id = %s AND deleted_at IS NOT NULL"
+        return db.fetch_one(query, (file_id, user_id))
+    
+    @staticmethod
+    def get_trash(user_id):
+        """A user's trashed files, most recently deleted first"""
+        query = """
+        SELECT id, folder_id, file_name, file_size, deleted_at FROM files
+        WHERE user_id = %s AND deleted_at IS NOT NULL
+        ORDER BY deleted_at DESC
+        """
+        result = db.fetch_query(query, (user_id,))
+        return result if result else []
+    
+    @staticmethod
+    def restore(file_id, user_id, retention_days):
+        """Take a file out of the trash, back into its folder.
+        
+        False if it is not in the trash, or was trashed over
+        ``retention_days`` ago and may already be being purged.
+        """
+        row = File.get_trashed(file_id, user_id)
+        if not row:
+            return False
+        query = """
+        UPDATE files SET deleted_at = NULL
+        WHERE id = %s AND user_id = %s AND deleted_at >= DATE_SUB(NOW(), INTERVAL %s DAY)
+        """
+        cursor = db.execute_query(query, (file_id, user_id, retention_days))
+        if cursor is None or cursor.rowcount != 1:
+            return False
+        identity_map.discard('file', file_id)
+        listing_cache.bump(user_id)
+        ChangeLog.record(user_id, 'file', file_id, 'created', row['folder_id'], row['file_name'], row['file_size'])
+        if row['folder_id']:
+            FolderStats.adjust(row['folder_id'], user_id, file_delta=1, bytes_delta=row['file_size'] or 0)
+        return True
+    
+    @staticmethod
+    def expire_trash(user_id, retention_days):
+        """Empty a user's trash: backdate it past ``retention_days`` so the next purge removes it"""
+        query = """
+        UPDATE files SET deleted_at = DATE_SUB(NOW(), INTERVAL %s DAY)
+        WHERE user_id = %s AND deleted_at IS NOT NULL
+        """
+        cursor = db.execute_query(query, (retention_days + 1, user_id))
         return cursor is not None
     
+    @staticmethod
+    def get_purge_batch(after_id, retention_days, limit):
+        """Files after ``after_id`` trashed more than ``retention_days`` ago, in id order"""
+        query = """
+        SELECT id, user_id, s3_key FROM files
+        WHERE deleted_at < DATE_SUB(NOW(), INTERVAL %s DAY) AND id > %s
+        ORDER BY id
+        LIMIT %s
+        """
+        result = db.fetch_query(query, (retention_days, after_id, limit))
+        return result if result else []
+    
+    @staticmethod
+    def purge(file_ids, chunk_size=500):
+        """Delete trashed file rows for good, ``chunk_size`` rows per statement"""
+        file_ids = list(file_ids)
+        for i in range(0, len(file_ids), chunk_size):
+            chunk = file_ids[i:i + chunk_size]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            query = f"DELETE FROM files WHERE deleted_at IS NOT NULL AND id IN ({placeholders})"
+            if db.execute_query(query, tuple(chunk)) is None:
+                return False
+            for file_id in chunk:
+                identity_map.discard('file', file_id)
+        return True
+    
+    @staticmethod
+    def replace_content(file_row, s3_key, s3_url, codec, file_size):
+        """Point a file at a new blob as its next version.
+        
+        Returns False if the file was replaced concurrently since
+        ``file_row`` was read; the caller keeps the old content as a
+        FileVersion before calling this.
+        """
+        query = """
+        UPDATE files SET s3_key = %s, s3_url = %s, codec = %s, file_size = %s, version = version + 1,
+                         storage_tier = 'standard', tier_changed_at = NULL
+        WHERE id = %s AND version = %s
+        """
+        params = (s3_key, s3_url, codec, file_size, file_row['id'], file_row.get('version') or 1)
+        cursor = db.execute_query(query, params)
+        if cursor is None or cursor.rowcount != 1:
+            return False
+        identity_map.discard('file', file_row['id'])
+        listing_cache.bump(file_row['user_id'])
+        ChangeLog.record(file_row['user_id'], 'file', file_row['id'], 'updated', file_row['folder_id'],
+                         file_row['file_name'], file_size)
+        if file_row['folder_id']:
+            FolderStats.adjust(file_row['folder_id'], file_row['user_id'],
+                               bytes_delta=(file_size or 0) - (file_row['file_size'] or 0))
+        return True
+    
     @staticmethod
     def get_file_owner(file_id):
         query = "SELECT user_id FROM files WHERE id = %s"
@@ -87,19 +293,81 @@ class File:
                 if new_file.create():
                     created_files.append(new_file)
             except Exception as e:
-                print(f"Error creating file record: {e}")
+                logger.error("Error creating file record: %s", e)
         
         return created_files
     
     @staticmethod
     def move_to_folder(file_id, folder_id, user_id):
         """Move a file to a different folder"""
-        query = "UPDATE files SET folder_id = %s WHERE id = %s AND user_id = %s"
+        placement = File.get_owned(file_id, user_id)
+        query = "UPDATE files SET folder_id = %s WHERE id = %s AND user_id = %s AND deleted_at IS NULL"
         cursor = db.execute_query(query, (folder_id, file_id, user_id))
-        return cursor is not None
+        if cursor is None:
+            return False
+        identity_map.discard('file', file_id)
+        listing_cache.bump(user_id)
+        ChangeLog.record(user_id, 'file', file_id, 'moved', folder_id,
+                         placement['file_name'] if placement else None, placement['file_size'] if placement else None)
+        if placement:
+            size = placement['file_size'] or 0
+            if placement['folder_id']:
+                FolderStats.adjust(placement['folder_id'], user_id, file_delta=-1, bytes_delta=-size)
+            if folder_id:
+                FolderStats.adjust(folder_id, user_id, file_delta=1, bytes_delta=size)
+        return True
+    
+    @staticmethod
+    def get_tiering_batch(after_id, limit, window_days):
+        """Files after ``after_id`` with their last access and access count over ``window_days``.
+        
+        Accesses are owner actions from file_analytics plus visits to the
+        file's share links; a file never accessed counts from its upload.
+        Last accesses in compacted months come from the daily rollups.
+        """
+        query = """
+        SELECT f.id, f.s3_key, f.file_size, f.created_at, f.storage_tier, f.tier_changed_at,
+               GREATEST(
+                   COALESCE((SELECT MAX(fa.timestamp) FROM file_analytics fa WHERE fa.file_id = f.id),
+                            (SELECT MAX(fd.last_at) FROM file_analytics_daily fd WHERE fd.file_id = f.id),
+                            f.created_at),
+                   COALESCE((SELECT MAX(sa.access_time) FROM share_analytics sa
+                             JOIN shared_links sl ON sa.share_link_id = sl.id
+                             WHERE sl.file_id = f.id),
+                            (SELECT MAX(sd.last_at) FROM share_analytics_daily sd
+                             JOIN shared_links sl ON sd.share_link_id = sl.id
+                             WHERE sl.file_id = f.id),
+                            f.created_at)
+               ) AS last_access,
+               (SELECT COUNT(*) FROM file_analytics fa
+                WHERE fa.file_id = f.id AND fa.timestamp >= DATE_SUB(NOW(), INTERVAL %s DAY))
+               + (SELECT COUNT(*) FROM share_analytics sa
+                  JOIN shared_links sl ON sa.share_link_id = sl.id
+                  WHERE sl.file_id = f.id AND sa.access_time >= DATE_SUB(NOW(), INTERVAL %s DAY)) AS recent_accesses
+        FROM files f
+        WHERE f.id > %s AND f.deleted_at IS NULL
+        ORDER BY f.id
+        LIMIT %s
+        """
+        result = db.fetch_query(query, (window_days, window_days, after_id, limit))
+        return result if result else []
+    
+    @staticmethod
+    def set_tier(file_ids, tier):
+        """Record that the blobs of ``file_ids`` now sit in ``tier``"""
+        if not file_ids:
+            return True
+        placeholders = ', '.join(['%s'] * len(file_ids))
+        query = f"UPDATE files SET storage_tier = %s, tier_changed_at = NOW() WHERE id IN ({placeholders})"
+        cursor = db.execute_query(query, (tier, *file_ids))
+        if cursor is None:
+            return False
+        for file_id in file_ids:
+            identity_map.discard('file', file_id)
+        return True
     
     @staticmethod
     def file_exists(file_id):
-        query = "SELECT id FROM files WHERE id = %s"
+        query = "SELECT id FROM files WHERE id = %s AND deleted_at IS NULL"
         result = db.fetch_one(query, (file_id,))
         return result is not None
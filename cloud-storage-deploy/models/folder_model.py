@@ -1,7 +1,17 @@
 from models.db import db
+from models.change_model import ChangeLog
+from utils.listing_cache import listing_cache
+from utils.identity_map import identity_map
+from models.rows import FolderRow
 import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 class Folder:
+    # Shared with the async serving mode (asgi.py)
+    OWNED_QUERY = "SELECT * FROM folders WHERE id = %s AND user_id = %s"
+    
     def __init__(self, user_id=None, name=None, parent_id=None):
         self.user_id = user_id
         self.name = name
@@ -16,6 +26,11 @@ class Folder:
         cursor = db.execute_query(query, params)
         if cursor:
             self.id = cursor.lastrowid
+            listing_cache.bump(self.user_id)
+            ChangeLog.record(self.user_id, 'folder', self.id, 'created', self.parent_id, self.name)
+            FolderStats.adjust(self.id, self.user_id)
+            if self.parent_id:
+                FolderStats.adjust(self.parent_id, self.user_id, child_delta=1)
             return True
         return False
     
@@ -27,20 +42,32 @@ class Folder:
     
     @staticmethod
     def get_by_id(folder_id):
-        query = "SELECT * FROM folders WHERE id = %s"
-        result = db.fetch_one(query, (folder_id,))
+        result = identity_map.get('folder', folder_id)
+        if result is None:
+            query = "SELECT * FROM folders WHERE id = %s"
+            result = identity_map.put('folder', folder_id, db.fetch_one(query, (folder_id,)))
+        return result
+    
+    @staticmethod
+    def get_owned(folder_id, user_id):
+        """Get a folder only if it belongs to the user, in a single query"""
+        result = identity_map.get('folder', folder_id)
+        if result is None:
+            result = identity_map.put('folder', folder_id, db.fetch_one(Folder.OWNED_QUERY, (folder_id, user_id)))
+        if result is None or result['user_id'] != user_id:
+            return None
         return result
     
     @staticmethod
     def get_root_folders(user_id):
-        query = "SELECT * FROM folders WHERE user_id = %s AND parent_id IS NULL ORDER BY name"
-        result = db.fetch_query(query, (user_id,))
+        query = "SELECT id, parent_id, name, created_at FROM folders WHERE user_id = %s AND parent_id IS NULL ORDER BY name"
+        result = db.fetch_rows(query, FolderRow, (user_id,))
         return result if result else []
     
     @staticmethod
     def get_child_folders(parent_id, user_id):
-        query = "SELECT * FROM folders WHERE parent_id = %s AND user_id = %s ORDER BY name"
-        result = db.fetch_query(query, (parent_id, user_id))
+        query = "SELECT id, parent_id, name, created_at FROM folders WHERE parent_id = %s AND user_id = %s ORDER BY name"
+        result = db.fetch_rows(query, FolderRow, (parent_id, user_id))
         return result if result else []
     
     @staticmethod
@@ -50,8 +77,7 @@ class Folder:
         current_folder_id = folder_id
         
         while current_folder_id:
-            query = "SELECT id, name, parent_id FROM folders WHERE id = %s"
-            folder = db.fetch_one(query, (current_folder_id,))
+            folder = Folder.get_by_id(current_folder_id)
             if folder:
                 path.append(folder)
                 current_folder_id = folder['parent_id']
@@ -64,7 +90,15 @@ class Folder:
     def delete(folder_id, user_id):
         """Delete a folder and move all files to root"""
         try:
-            # Move all files in this folder to root (folder_id = NULL)
+            folder = Folder.get_by_id(folder_id)
+            # Contents moved to root are journalled as moves
+            child_files = db.fetch_query(
+                "SELECT id, file_name, file_size FROM files WHERE folder_id = %s AND user_id = %s AND deleted_at IS NULL",
+                (folder_id, user_id)) or []
+            child_folders = db.fetch_query("SELECT id, name FROM folders WHERE parent_id = %s AND user_id = %s",
+                                           (folder_id, user_id)) or []
+            
+            # Move all files in this folder to root (folder_id = NULL), trashed ones too so they restore there
             update_query = "UPDATE files SET folder_id = NULL WHERE folder_id = %s AND user_id = %s"
             db.execute_query(update_query, (folder_id, user_id))
             
@@ -75,48 +109,76 @@ class Folder:
             # Delete the folder
             delete_query = "DELETE FROM folders WHERE id = %s AND user_id = %s"
             cursor = db.execute_query(delete_query, (folder_id, user_id))
-            return cursor is not None
+            listing_cache.bump(user_id)
+            if cursor is None:
+                return False
+            
+            identity_map.discard('folder', folder_id)
+            ChangeLog.record_many(user_id,
+                                  [('file', f['id'], 'moved', None, f['file_name'], f['file_size']) for f in child_files]
+                                  + [('folder', f['id'], 'moved', None, f['name'], None) for f in child_folders]
+                                  + [('folder', folder_id, 'deleted', None, None, None)])
+            FolderStats.remove(folder_id)
+            if folder and folder['parent_id']:
+                FolderStats.adjust(folder['parent_id'], user_id, child_delta=-1)
+            return True
         except Exception as e:
-            print(f"Error deleting folder: {e}")
+            logger.error("Error deleting folder: %s", e)
             return False
     
     @staticmethod
     def folder_exists(folder_id, user_id):
-        query = "SELECT id FROM folders WHERE id = %s AND user_id = %s"
-        result = db.fetch_one(query, (folder_id, user_id))
-        return result is not None
+        return Folder.get_owned(folder_id, user_id) is not None
     
     @staticmethod
-    def get_folder_tree(user_id):
-        """Get folder tree structure for navigation"""
-        folders = Folder.get_by_user(user_id)
-        tree = {}
-        
-        # Create a mapping of folders
-        folder_map = {}
-        for folder in folders:
-            folder_map[folder['id']] = {
-                'id': folder['id'],
-                'name': folder['name'],
-                'parent_id': folder['parent_id'],
-                'children': []
-            }
-        
-        # Build tree structure
-        for folder_id, folder_data in folder_map.items():
-            parent_id = folder_data['parent_id']
-            if parent_id is None:
-                tree[folder_id] = folder_data
-            elif parent_id in folder_map:
-                folder_map[parent_id]['children'].append(folder_data)
+    def children_page_query(user_id, parent_id, limit, offset):
+        """Build the query for get_children_page; it fetches one row beyond ``limit``"""
+        columns = """
+        SELECT fo.id, fo.name, fo.parent_id, fs.folder_id AS stats_id,
+               COALESCE(fs.child_count, 0) AS child_count,
+               COALESCE(fs.file_count, 0) AS file_count,
+               COALESCE(fs.total_bytes, 0) AS total_bytes
+        FROM folders fo
+        LEFT JOIN folder_stats fs ON fs.folder_id = fo.id
+        """
+        if parent_id is None:
+            query = columns + "WHERE fo.user_id = %s AND fo.parent_id IS NULL ORDER BY fo.name LIMIT %s OFFSET %s"
+            params = (user_id, limit + 1, offset)
+        else:
+            query = columns + "WHERE fo.user_id = %s AND fo.parent_id = %s ORDER BY fo.name LIMIT %s OFFSET %s"
+            params = (user_id, parent_id, limit + 1, offset)
+        return query, params
+    
+    @staticmethod
+    def needs_stats_rebuild(rows):
+        # Folders created before aggregates existed have no stats row yet
+        return any(row['stats_id'] is None for row in rows)
+    
+    @staticmethod
+    def finish_children_page(rows, limit):
+        for row in rows:
+            del row['stats_id']
+        return rows[:limit], len(rows) > limit
+    
+    @staticmethod
+    def get_children_page(user_id, parent_id=None, limit=200, offset=0):
+        """Get one level of the folder tree with per-folder aggregates.
         
-        return tree
+        Fetches one row beyond ``limit`` so callers can tell whether another
+        page follows without a separate COUNT query.
+        """
+        query, params = Folder.children_page_query(user_id, parent_id, limit, offset)
+        result = db.fetch_query(query, params) or []
+        if Folder.needs_stats_rebuild(result):
+            FolderStats.rebuild(user_id)
+            result = db.fetch_query(query, params) or []
+        return Folder.finish_children_page(result, limit)
     
     @staticmethod
     def get_folder_contents(folder_id, user_id):
         """Get all files and subfolders in a folder"""
         # Get files in folder
-        files_query = "SELECT * FROM files WHERE folder_id = %s AND user_id = %s ORDER BY file_name"
+        files_query = "SELECT * FROM files WHERE folder_id = %s AND user_id = %s AND deleted_at IS NULL ORDER BY file_name"
         files = db.fetch_query(files_query, (folder_id, user_id))
         
         # Get subfolders
@@ -127,3 +189,58 @@ class Folder:
             'files': files if files else [],
             'subfolders': subfolders if subfolders else []
         }
+
+class FolderStats:
+    """Precomputed per-folder aggregates (direct subfolders, direct files and their bytes)"""
+    
+    @staticmethod
+    def adjust(folder_id, user_id, child_delta=0, file_delta=0, bytes_delta=0):
+        query = """
+        INSERT INTO folder_stats (folder_id, user_id, child_count, file_count, total_bytes)
+        VALUES (%s, %s, GREATEST(%s, 0), GREATEST(%s, 0), GREATEST(%s, 0))
+        ON DUPLICATE KEY UPDATE
+        child_count = GREATEST(child_count + %s, 0),
+        file_count = GREATEST(file_count + %s, 0),
+        total_bytes = GREATEST(total_bytes + %s, 0)
+        """
+        params = (folder_id, user_id, child_delta, file_delta, bytes_delta,
+                  child_delta, file_delta, bytes_delta)
+        cursor = db.execute_query(query, params)
+        return cursor is not None
+    
+    @staticmethod
+    def remove(folder_id):
+        query = "DELETE FROM folder_stats WHERE folder_id = %s"
+        cursor = db.execute_query(query, (folder_id,))
+        return cursor is not None
+    
+    @staticmethod
+    def rebuild(user_id):
+        """Recompute every aggregate of a user from the folders and files tables.
+        
+        Rows are upserted in place, so a concurrent ``adjust`` or rebuild never
+        collides with them and readers never see the user without stats.
+        Rows of folders that no longer exist are deleted afterwards.
+        """
+        query = """
+        INSERT INTO folder_stats (folder_id, user_id, child_count, file_count, total_bytes)
+        SELECT fo.id, fo.user_id,
+               (SELECT COUNT(*) FROM folders c WHERE c.parent_id = fo.id),
+               (SELECT COUNT(*) FROM files f WHERE f.folder_id = fo.id AND f.deleted_at IS NULL),
+               (SELECT COALESCE(SUM(f.file_size), 0) FROM files f WHERE f.folder_id = fo.id AND f.deleted_at IS NULL)
+        FROM folders fo
+        WHERE fo.user_id = %s
+        ON DUPLICATE KEY UPDATE
+        child_count = VALUES(child_count),
+        file_count = VALUES(file_count),
+        total_bytes = VALUES(total_bytes)
+        """
+        if db.execute_query(query, (user_id,)) is None:
+            return False
+        query = """
+        DELETE fs FROM folder_stats fs
+        LEFT JOIN folders fo ON fo.id = fs.folder_id
+        WHERE fs.user_id = %s AND fo.id IS NULL
+        """
+        cursor = db.execute_query(query, (user_id,))
+        return cursor is not None
@@ -0,0 +1,45 @@
+class Row:
+    """Compact read-only row with dict-style access.
+    
+    Subclasses list their columns in ``__slots__``, so each row costs a
+    fraction of a dict. ``row['col']``, ``row.get('col')``, ``row.col`` and
+    ``dict(row)`` all work, so templates and callers written against the
+    dictionary cursor need no changes. Rows built from a projected query
+    only carry the selected columns.
+    """
+    __slots__ = ()
+    
+    @classmethod
+    def from_values(cls, columns, values):
+        row = cls.__new__(cls)
+        for column, value in zip(columns, values):
+            setattr(row, column, value)
+        return row
+    
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+    
+    def __contains__(self, key):
+        return hasattr(self, key)
+    
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+    
+    def keys(self):
+        return [name for name in self.__slots__ if hasattr(self, name)]
+    
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.keys()}
+    
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+class FileRow(Row):
+    __slots__ = ('id', 'user_id', 'folder_id', 'file_name', 'file_size', 's3_key', 's3_url',
+                 'is_public', 'created_at', 'codec', 'storage_tier', 'tier_changed_at')
+
+class FolderRow(Row):
+    __slots__ = ('id', 'user_id', 'parent_id', 'name', 'created_at')
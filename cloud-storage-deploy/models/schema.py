@@ -0,0 +1,194 @@
+from models.db import db
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Supporting tables that the application creates on startup if they are
+# missing. The core tables (users, files, folders, shared_links and the
+# analytics tables) are created by database/schema.sql.
+TABLES = {
+    'folder_stats': """
+    CREATE TABLE IF NOT EXISTS folder_stats (
+        folder_id INT PRIMARY KEY,
+        user_id INT NOT NULL,
+        child_count INT NOT NULL DEFAULT 0,
+        file_count INT NOT NULL DEFAULT 0,
+        total_bytes BIGINT NOT NULL DEFAULT 0,
+        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        INDEX idx_folder_stats_user (user_id)
+    )
+    """,
+    'upload_batches': """
+    CREATE TABLE IF NOT EXISTS upload_batches (
+        id CHAR(32) PRIMARY KEY,
+        user_id INT NOT NULL,
+        folder_id INT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_upload_batches_created (created_at)
+    )
+    """,
+    'upload_batch_items': """
+    CREATE TABLE IF NOT EXISTS upload_batch_items (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        batch_id CHAR(32) NOT NULL,
+        file_name VARCHAR(255) NOT NULL,
+        file_size BIGINT NOT NULL DEFAULT 0,
+        temp_path VARCHAR(512) NOT NULL,
+        status VARCHAR(16) NOT NULL DEFAULT 'queued',
+        file_id INT NULL,
+        s3_key VARCHAR(512) NULL,
+        error VARCHAR(512) NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        INDEX idx_upload_batch_items_batch (batch_id)
+    )
+    """,
+    'direct_uploads': """
+    CREATE TABLE IF NOT EXISTS direct_uploads (
+        id CHAR(32) PRIMARY KEY,
+        user_id INT NOT NULL,
+        folder_id INT NULL,
+        file_name VARCHAR(255) NOT NULL,
+        file_size BIGINT NOT NULL,
+        s3_key VARCHAR(512) NOT NULL,
+        upload_id VARCHAR(1024) NULL,
+        part_size BIGINT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_direct_uploads_created (created_at)
+    )
+    """,
+    'changes': """
+    CREATE TABLE IF NOT EXISTS changes (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL,
+        entity VARCHAR(8) NOT NULL,
+        entity_id INT NOT NULL,
+        action VARCHAR(16) NOT NULL,
+        parent_id INT NULL,
+        name VARCHAR(255) NULL,
+        size BIGINT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_changes_user_id (user_id, id),
+        INDEX idx_changes_created (created_at)
+    )
+    """,
+    'file_versions': """
+    CREATE TABLE IF NOT EXISTS file_versions (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        file_id INT NOT NULL,
+        user_id INT NOT NULL,
+        version INT NOT NULL,
+        file_name VARCHAR(255) NOT NULL,
+        file_size BIGINT NOT NULL DEFAULT 0,
+        s3_key VARCHAR(512) NULL,
+        codec VARCHAR(16) NULL,
+        manifest MEDIUMBLOB NULL,
+        replaced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE KEY uq_file_versions_file_version (file_id, version)
+    )
+    """,
+    'chunks': """
+    CREATE TABLE IF NOT EXISTS chunks (
+        hash CHAR(64) PRIMARY KEY,
+        size INT NOT NULL,
+        s3_key VARCHAR(512) NOT NULL,
+        codec VARCHAR(16) NULL,
+        refcount INT NOT NULL DEFAULT 0,
+        released_at TIMESTAMP NULL,
+        INDEX idx_chunks_released (refcount, released_at)
+    )
+    """,
+    # Daily aggregates of raw analytics months that have been compacted away
+    'user_analytics_daily': """
+    CREATE TABLE IF NOT EXISTS user_analytics_daily (
+        user_id INT NOT NULL,
+        day DATE NOT NULL,
+        action_type VARCHAR(64) NOT NULL,
+        count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day, action_type),
+        INDEX idx_user_analytics_daily_day (day)
+    )
+    """,
+    'file_analytics_daily': """
+    CREATE TABLE IF NOT EXISTS file_analytics_daily (
+        file_id INT NOT NULL,
+        day DATE NOT NULL,
+        action_type VARCHAR(64) NOT NULL,
+        count INT NOT NULL DEFAULT 0,
+        last_at TIMESTAMP NULL,
+        PRIMARY KEY (file_id, day, action_type),
+        INDEX idx_file_analytics_daily_day (day)
+    )
+    """,
+    'share_analytics_daily': """
+    CREATE TABLE IF NOT EXISTS share_analytics_daily (
+        share_link_id INT NOT NULL,
+        day DATE NOT NULL,
+        accesses INT NOT NULL DEFAULT 0,
+        unique_visitors INT NOT NULL DEFAULT 0,
+        first_at TIMESTAMP NULL,
+        last_at TIMESTAMP NULL,
+        PRIMARY KEY (share_link_id, day),
+        INDEX idx_share_analytics_daily_day (day)
+    )
+    """,
+    # Oldest month each raw analytics table still holds; rollups only count before it
+    'analytics_compaction': """
+    CREATE TABLE IF NOT EXISTS analytics_compaction (
+        table_name VARCHAR(64) PRIMARY KEY,
+        raw_since DATE NOT NULL
+    )
+    """,
+}
+
+# Columns added to core tables after they were first deployed: (table, column, definition)
+COLUMNS = [
+    ('files', 'codec', 'VARCHAR(16) NULL'),  # Storage codec of the blob, NULL when stored as uploaded
+    ('files', 'storage_tier', "VARCHAR(16) NOT NULL DEFAULT 'standard'"),  # standard, infrequent or archive
+    ('files', 'tier_changed_at', 'TIMESTAMP NULL'),
+    ('files', 'version', 'INT NOT NULL DEFAULT 1'),  # Current version number; older ones are in file_versions
+    ('files', 'deleted_at', 'TIMESTAMP NULL'),  # Set while the file is in the trash
+    ('upload_batch_items', 's3_key', 'VARCHAR(512) NULL'),  # Blob written for the item, set before it is recorded
+]
+
+# Indexes on core tables that the query paths rely on: (table, index name, columns)
+INDEXES = [
+    ('folders', 'idx_folders_user_parent_name', 'user_id, parent_id, name'),
+    ('files', 'idx_files_user_folder_name', 'user_id, folder_id, file_name'),
+    ('files', 'idx_files_user_deleted', 'user_id, deleted_at'),
+    ('files', 'idx_files_deleted_at', 'deleted_at'),
+    ('files', 'idx_files_s3_key', 's3_key(191)'),
+    ('file_analytics', 'idx_file_analytics_file_time', 'file_id, timestamp'),
+    ('share_analytics', 'idx_share_analytics_link_time', 'share_link_id, access_time'),
+    ('shared_links', 'idx_shared_links_expiry', 'expiry_date'),
+]
+
+def column_exists(table, column):
+    query = """
+    SELECT COUNT(*) AS found FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """
+    result = db.fetch_one(query, (table, column))
+    return bool(result and result['found'])
+
+def index_exists(table, index_name):
+    query = """
+    SELECT COUNT(*) AS found FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """
+    result = db.fetch_one(query, (table, index_name))
+    return bool(result and result['found'])
+
+def ensure_schema():
+    """Create supporting tables, columns and indexes that do not exist yet"""
+    for name, ddl in TABLES.items():
+        if db.execute_query(ddl) is None:
+            logger.error("Failed to create table %s", name)
+
+    for table, column, definition in COLUMNS:
+        if not column_exists(table, column):
+            if db.execute_query(f"ALTER TABLE {table} ADD COLUMN {column} {definition}") is None:
+                logger.error("Failed to add column %s.%s", table, column)
+
+    for table, index_name, columns in INDEXES:
+        if not index_exists(table, index_name):
+            db.execute_query(f"CREATE INDEX {index_name} ON {table} ({columns})")
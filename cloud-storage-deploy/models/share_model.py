@@ -2,9 +2,17 @@ from models.db import db
 import datetime
 import secrets
 import string
-from werkzeug.security import generate_password_hash, check_password_hash
+from utils.password_hasher import password_hasher
 
 class ShareLink:
+    # Shared with the async serving mode (asgi.py)
+    FILE_INFO_QUERY = """
+    SELECT f.*, sl.expiry_date, sl.id AS share_link_id
+    FROM files f 
+    JOIN shared_links sl ON f.id = sl.file_id 
+    WHERE sl.token = %s AND sl.expiry_date > NOW() AND f.deleted_at IS NULL
+    """
+    
     def __init__(self, file_id=None, token=None, expiry_date=None, password=None, max_downloads=None):
         self.file_id = file_id
         self.token = token
@@ -29,7 +37,7 @@ class ShareLink:
         # Hash password if provided
         password_hash = None
         if self.password:
-            password_hash = generate_password_hash(self.password)
+            password_hash = password_hasher.hash(self.password)
         
         query = """
         INSERT INTO shared_links 
@@ -51,7 +59,7 @@ class ShareLink:
         SELECT sl.*, f.file_name, f.s3_url 
         FROM shared_links sl 
         JOIN files f ON sl.file_id = f.id 
-        WHERE sl.token = %s AND sl.is_active = TRUE
+        WHERE sl.token = %s AND sl.is_active = TRUE AND f.deleted_at IS NULL
         """
         result = db.fetch_one(query, (token,))
         return result
@@ -60,7 +68,7 @@ class ShareLink:
     def verify_password(share_link, password):
         if not share_link.get('password_hash'):
             return True  # No password required
-        return check_password_hash(share_link['password_hash'], password)
+        return password_hasher.verify(share_link['password_hash'], password)
     
     @staticmethod
     def increment_download_count(token):
@@ -100,17 +108,69 @@ class ShareLink:
     
     @staticmethod
     def get_file_info(token):
+        result = db.fetch_one(ShareLink.FILE_INFO_QUERY, (token,))
+        return result
+    
+    @staticmethod
+    def iter_by_owner(user_id, batch_size=1000):
+        """Stream the user's share links (without password hashes), oldest first"""
         query = """
-        SELECT f.*, sl.expiry_date 
-        FROM files f 
-        JOIN shared_links sl ON f.id = sl.file_id 
-        WHERE sl.token = %s AND sl.expiry_date > NOW()
+        SELECT sl.id, sl.file_id, f.file_name, sl.token, sl.created_at, sl.expiry_date,
+               sl.max_downloads, sl.download_count, sl.is_active
+        FROM shared_links sl
+        JOIN files f ON sl.file_id = f.id
+        WHERE f.user_id = %s
+        ORDER BY sl.id
         """
-        result = db.fetch_one(query, (token,))
-        return result
+        return db.stream_query(query, (user_id,), batch_size=batch_size)
     
     @staticmethod
-    def delete_expired():
-        query = "DELETE FROM shared_links WHERE expiry_date <= NOW()"
-        cursor = db.execute_query(query)
-        return cursor is not None
+    def get_expired_ids(retention_days, limit):
+        """Ids of links expired more than ``retention_days`` ago, oldest expiry first (walks the expiry index)"""
+        query = """
+        SELECT id FROM shared_links
+        WHERE expiry_date <= DATE_SUB(NOW(), INTERVAL %s DAY)
+        ORDER BY expiry_date
+        LIMIT %s
+        """
+        return [row['id'] for row in db.fetch_query(query, (retention_days, limit)) or []]
+    
+    @staticmethod
+    def delete_analytics(link_ids, batch_size):
+        """Delete the access records and daily totals of ``link_ids``, ``batch_size`` rows per statement; returns rows deleted"""
+        if not link_ids:
+            return 0
+        placeholders = ', '.join(['%s'] * len(link_ids))
+        deleted = 0
+        for table in ('share_analytics', 'share_analytics_daily'):
+            query = f"DELETE FROM {table} WHERE share_link_id IN ({placeholders}) LIMIT %s"
+            while True:
+                cursor = db.execute_query(query, (*link_ids, batch_size))
+                if cursor is None:
+                    raise RuntimeError('Failed to delete share analytics')
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    break
+        return deleted
+    
+    @staticmethod
+    def delete_many(link_ids):
+        """Delete links by id; returns rows deleted"""
+        if not link_ids:
+            return 0
+        placeholders = ', '.join(['%s'] * len(link_ids))
+        cursor = db.execute_query(f"DELETE FROM shared_links WHERE id IN ({placeholders})", tuple(link_ids))
+        if cursor is None:
+            raise RuntimeError('Failed to delete share links')
+        return cursor.rowcount
+    
+    @staticmethod
+    def expiry_lag(retention_days):
+        """Seconds the oldest link due for sweeping has been waiting, 0 when none are"""
+        query = """
+        SELECT TIMESTAMPDIFF(SECOND, MIN(expiry_date), DATE_SUB(NOW(), INTERVAL %s DAY)) AS lag
+        FROM shared_links
+        WHERE expiry_date <= DATE_SUB(NOW(), INTERVAL %s DAY)
+        """
+        result = db.fetch_one(query, (retention_days, retention_days))
+        return (result or {}).get('lag') or 0
@@ -0,0 +1,105 @@
+from models.db import db
+import uuid
+
+class UploadBatch:
+    """A set of files accepted by an upload request and stored in the background"""
+    
+    @staticmethod
+    def create(user_id, folder_id, items):
+        """Record a batch and its files. ``items`` holds dicts with file_name, file_size and temp_path."""
+        batch_id = uuid.uuid4().hex
+        query = "INSERT INTO upload_batches (id, user_id, folder_id) VALUES (%s, %s, %s)"
+        if db.execute_query(query, (batch_id, user_id, folder_id)) is None:
+            return None
+        
+        item_query = """
+        INSERT INTO upload_batch_items (batch_id, file_name, file_size, temp_path, status)
+        VALUES (%s, %s, %s, %s, 'queued')
+        """
+        for item in items:
+            db.execute_query(item_query, (batch_id, item['file_name'], item['file_size'], item['temp_path']))
+        return batch_id
+    
+    @staticmethod
+    def get(batch_id, user_id):
+        query = "SELECT * FROM upload_batches WHERE id = %s AND user_id = %s"
+        return db.fetch_one(query, (batch_id, user_id))
+    
+    @staticmethod
+    def get_by_id(batch_id):
+        query = "SELECT * FROM upload_batches WHERE id = %s"
+        return db.fetch_one(query, (batch_id,))
+    
+    @staticmethod
+    def get_items(batch_id):
+        query = "SELECT * FROM upload_batch_items WHERE batch_id = %s ORDER BY id"
+        result = db.fetch_query(query, (batch_id,))
+        return result if result else []
+    
+    @staticmethod
+    def set_item_status(item_id, status, file_id=None, error=None):
+        query = "UPDATE upload_batch_items SET status = %s, file_id = %s, error = %s WHERE id = %s"
+        cursor = db.execute_query(query, (status, file_id, error, item_id))
+        return cursor is not None
+    
+    @staticmethod
+    def set_item_key(item_id, s3_key):
+        """Remember the blob an item was stored under, so a retry can tell whether it was recorded"""
+        query = "UPDATE upload_batch_items SET s3_key = %s WHERE id = %s"
+        cursor = db.execute_query(query, (s3_key, item_id))
+        return cursor is not None
+    
+    @staticmethod
+    def delete_finished(older_than_hours=24):
+        query = """
+        DELETE b, i FROM upload_batches b
+        LEFT JOIN upload_batch_items i ON i.batch_id = b.id
+        WHERE b.created_at < DATE_SUB(NOW(), INTERVAL %s HOUR)
+        """
+        cursor = db.execute_query(query, (older_than_hours,))
+        return cursor is not None
+
+class DirectUpload:
+    """A browser upload going straight to the bucket, between start and completion.
+    
+    ``upload_id`` is the S3 multipart upload id, or None when the file is
+    sent as a single presigned POST.
+    """
+    
+    @staticmethod
+    def create(user_id, folder_id, file_name, file_size, s3_key, upload_id=None, part_size=None):
+        upload = uuid.uuid4().hex
+        query = """
+        INSERT INTO direct_uploads (id, user_id, folder_id, file_name, file_size, s3_key, upload_id, part_size)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """
+        params = (upload, user_id, folder_id, file_name, file_size, s3_key, upload_id, part_size)
+        if db.execute_query(query, params) is None:
+            return None
+        return upload
+    
+    @staticmethod
+    def get(upload, user_id):
+        query = "SELECT * FROM direct_uploads WHERE id = %s AND user_id = %s"
+        return db.fetch_one(query, (upload, user_id))
+    
+    @staticmethod
+    def get_abandoned(older_than_hours=24, limit=500):
+        query = """
+        SELECT * FROM direct_uploads
+        WHERE created_at < DATE_SUB(NOW(), INTERVAL %s HOUR)
+        ORDER BY created_at LIMIT %s
+        """
+        result = db.fetch_query(query, (older_than_hours, limit))
+        return result if result else []
+    
+    @staticmethod
+    def delete(upload):
+        cursor = db.execute_query("DELETE FROM direct_uploads WHERE id = %s", (upload,))
+        return cursor is not None
+    
+    @staticmethod
+    def claim(upload):
+        """Delete the row if it is still there; True only for the one caller that removed it"""
+        cursor = db.execute_query("DELETE FROM direct_uploads WHERE id = %s", (upload,))
+        return cursor is not None and cursor.rowcount == 1
@@ -1,5 +1,5 @@
-from werkzeug.security import generate_password_hash, check_password_hash
 from models.db import db
+from utils.password_hasher import password_hasher, HasherBusy
 import datetime
 
 class User:
@@ -11,7 +11,7 @@ class User:
         self.created_at = None
     
     def create(self):
-        hashed_password = generate_password_hash(self.password)
+        hashed_password = password_hasher.hash(self.password)
         query = "INSERT INTO users (name, email, password) VALUES (%s, %s, %s)"
         params = (self.name, self.email, hashed_password)
         
@@ -35,10 +35,30 @@ class User:
     
     @staticmethod
     def verify_password(user, password):
+        """Check a login password, upgrading the stored hash if the configured method changed"""
         if user and 'password' in user:
-            return check_password_hash(user['password'], password)
+            if not password_hasher.verify(user['password'], password):
+                return False
+            if password_hasher.needs_rehash(user['password']):
+                try:
+                    User.set_password(user['id'], password)
+                except HasherBusy:
+                    pass  # The password checked out; the upgrade is retried at the next login
+            return True
         return False
     
+    @staticmethod
+    def set_password(user_id, password):
+        query = "UPDATE users SET password = %s WHERE id = %s"
+        cursor = db.execute_query(query, (password_hasher.hash(password), user_id))
+        return cursor is not None
+    
+    @staticmethod
+    def get_ids_after(last_id, limit=500):
+        query = "SELECT id FROM users WHERE id > %s ORDER BY id LIMIT %s"
+        result = db.fetch_query(query, (last_id, limit))
+        return [row['id'] for row in result] if result else []
+    
     @staticmethod
     def email_exists(email):
         query = "SELECT id FROM users WHERE email = %s"
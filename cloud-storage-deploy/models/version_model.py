@@ -0,0 +1,190 @@
+from models.db import db
+
+class FileVersion:
+    """A superseded version of a file.
+
+    A freshly replaced version still points at its old blob (``s3_key`` and
+    ``codec``); once it has been moved into the chunk store it carries a
+    ``manifest`` of chunk references instead and ``s3_key`` is NULL.
+    """
+    # Columns the version listing renders
+    LISTING_COLUMNS = ('id', 'version', 'file_name', 'file_size', 'replaced_at')
+
+    @staticmethod
+    def create(file_row):
+        """Record the current content of a files row as its version; returns the id or None.
+
+        The version row and the files update are separate statements, so a
+        crash between them leaves a row for the file's current version that
+        still points at its live blob. Such a row is reused rather than
+        blocking every later replacement on the unique version number.
+        """
+        existing = FileVersion.get(file_row['id'], file_row.get('version') or 1)
+        if existing is not None:
+            if existing['s3_key'] == file_row['s3_key'] and existing['manifest'] is None:
+                return existing['id']
+            return None
+        query = """
+        INSERT INTO file_versions (file_id, user_id, version, file_name, file_size, s3_key, codec)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """
+        params = (file_row['id'], file_row['user_id'], file_row.get('version') or 1, file_row['file_name'],
+                  file_row['file_size'], file_row['s3_key'], file_row.get('codec'))
+        cursor = db.execute_query(query, params)
+        return cursor.lastrowid if cursor else None
+
+    @staticmethod
+    def get_by_id(version_id):
+        query = "SELECT * FROM file_versions WHERE id = %s"
+        return db.fetch_one(query, (version_id,))
+
+    @staticmethod
+    def get(file_id, version):
+        query = "SELECT * FROM file_versions WHERE file_id = %s AND version = %s"
+        return db.fetch_one(query, (file_id, version))
+
+    @staticmethod
+    def get_by_file(file_id, columns=LISTING_COLUMNS):
+        """A file's stored versions, newest first"""
+        query = f"SELECT {', '.join(columns)} FROM file_versions WHERE file_id = %s ORDER BY version DESC"
+        result = db.fetch_query(query, (file_id,))
+        return result if result else []
+
+    @staticmethod
+    def get_by_files(file_ids):
+        """Every stored version of the given files, with what is needed to discard them"""
+        if not file_ids:
+            return []
+        placeholders = ', '.join(['%s'] * len(file_ids))
+        query = f"SELECT id, s3_key, manifest FROM file_versions WHERE file_id IN ({placeholders})"
+        result = db.fetch_query(query, tuple(file_ids))
+        return result if result else []
+
+    @staticmethod
+    def get_beyond(file_id, keep):
+        """Versions of a file older than its ``keep`` newest ones"""
+        query = """
+        SELECT id, s3_key, manifest FROM file_versions
+        WHERE file_id = %s
+        ORDER BY version DESC
+        LIMIT 18446744073709551615 OFFSET %s
+        """
+        result = db.fetch_query(query, (file_id, keep))
+        return result if result else []
+
+    @staticmethod
+    def set_manifest(version_id, manifest):
+        """Swap a version's blob for its chunk manifest; False if it is gone or already chunked"""
+        query = """
+        UPDATE file_versions SET manifest = %s, s3_key = NULL, codec = NULL
+        WHERE id = %s AND manifest IS NULL
+        """
+        cursor = db.execute_query(query, (manifest, version_id))
+        return cursor is not None and cursor.rowcount == 1
+
+    @staticmethod
+    def delete_unused(version_id):
+        """Delete a version row its file never moved past (the replacement failed).
+
+        A concurrent replacement that did succeed has bumped the file's
+        version, and its row is kept even if both callers shared it.
+        """
+        query = """
+        DELETE fv FROM file_versions fv
+        JOIN files f ON f.id = fv.file_id
+        WHERE fv.id = %s AND f.version = fv.version
+        """
+        return db.execute_query(query, (version_id,)) is not None
+
+    @staticmethod
+    def delete_many(version_ids):
+        if not version_ids:
+            return True
+        placeholders = ', '.join(['%s'] * len(version_ids))
+        cursor = db.execute_query(f"DELETE FROM file_versions WHERE id IN ({placeholders})", tuple(version_ids))
+        return cursor is not None
+
+class Chunk:
+    """A content-addressed block in the chunk store, shared by every manifest that lists it.
+
+    ``refcount`` counts manifest entries; chunks that drop to zero get a
+    ``released_at`` time and are deleted by the chunk collector after a
+    grace period.
+    """
+
+    @staticmethod
+    def get_live(hashes):
+        """{hash: row with s3_key and codec} for the chunks among ``hashes`` that are still referenced"""
+        if not hashes:
+            return {}
+        placeholders = ', '.join(['%s'] * len(hashes))
+        query = f"SELECT hash, s3_key, codec FROM chunks WHERE hash IN ({placeholders}) AND refcount > 0"
+        return {row['hash']: row for row in db.fetch_query(query, tuple(hashes)) or []}
+
+    @staticmethod
+    def get_locations(hashes):
+        """{hash: row with s3_key and codec} for the stored chunks among ``hashes``"""
+        if not hashes:
+            return {}
+        placeholders = ', '.join(['%s'] * len(hashes))
+        query = f"SELECT hash, s3_key, codec FROM chunks WHERE hash IN ({placeholders})"
+        return {row['hash']: row for row in db.fetch_query(query, tuple(hashes)) or []}
+
+    @staticmethod
+    def add_refs(entries):
+        """Add references from (hash, size, s3_key, codec, count) tuples in one statement.
+
+        Unknown chunks are inserted. A chunk that had dropped to zero
+        references takes the given s3_key, since its old blob may be about
+        to be collected; a live chunk keeps the blob it has.
+        """
+        if not entries:
+            return True
+        placeholders = ', '.join(['(%s, %s, %s, %s, %s)'] * len(entries))
+        params = [value for entry in entries for value in entry]
+        # Assignments run left to right: s3_key and codec must see the old refcount
+        query = f"""
+        INSERT INTO chunks (hash, size, s3_key, codec, refcount) VALUES {placeholders}
+        ON DUPLICATE KEY UPDATE
+            s3_key = IF(refcount > 0, s3_key, VALUES(s3_key)),
+            codec = IF(refcount > 0, codec, VALUES(codec)),
+            refcount = refcount + VALUES(refcount),
+            released_at = NULL
+        """
+        return db.execute_query(query, params) is not None
+
+    @staticmethod
+    def release(counts):
+        """Drop references given as {hash: count}, one UPDATE per distinct count"""
+        by_count = {}
+        for digest, count in counts.items():
+            by_count.setdefault(count, []).append(digest)
+        ok = True
+        for count, hashes in by_count.items():
+            placeholders = ', '.join(['%s'] * len(hashes))
+            query = f"""
+            UPDATE chunks SET refcount = refcount - %s, released_at = IF(refcount <= 0, NOW(), NULL)
+            WHERE hash IN ({placeholders})
+            """
+            ok = db.execute_query(query, (count, *hashes)) is not None and ok
+        return ok
+
+    @staticmethod
+    def get_garbage(grace_hours, limit):
+        query = """
+        SELECT hash, s3_key FROM chunks
+        WHERE refcount <= 0 AND released_at < DATE_SUB(NOW(), INTERVAL %s HOUR)
+        LIMIT %s
+        """
+        result = db.fetch_query(query, (grace_hours, limit))
+        return result if result else []
+
+    @staticmethod
+    def delete_unreferenced(rows):
+        """Delete chunk rows that are still unreferenced and still point at the same blob"""
+        if not rows:
+            return True
+        placeholders = ', '.join(['(%s, %s)'] * len(rows))
+        params = [value for row in rows for value in (row['hash'], row['s3_key'])]
+        query = f"DELETE FROM chunks WHERE refcount <= 0 AND (hash, s3_key) IN ({placeholders})"
+        return db.execute_query(query, params) is not None
@@ -0,0 +1,16 @@
+from flask import Blueprint, render_template, jsonify
+from routes.auth_routes import admin_required
+from utils.job_queue import job_queue
+
+admin_bp = Blueprint('admin', __name__)
+
+@admin_bp.route('/admin/jobs')
+@admin_required
+def jobs_dashboard():
+    stats = job_queue.stats()
+    return render_template('admin_jobs.html', stats=stats)
+
+@admin_bp.route('/admin/api/jobs')
+@admin_required
+def jobs_api():
+    return jsonify(job_queue.stats())
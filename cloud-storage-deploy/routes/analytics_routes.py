@@ -3,6 +3,9 @@ from models.analytics_model import ShareAnalytics, UserAnalytics, FileAnalytics,
 from models.file_model import File
 from models.share_model import ShareLink
 from routes.auth_routes import login_required
+import logging
+
+logger = logging.getLogger(__name__)
 
 analytics_bp = Blueprint('analytics', __name__)
 
@@ -28,7 +31,7 @@ def analytics_dashboard():
         
     except Exception as e:
         # Handle case where analytics tables don't exist yet
-        print(f"Analytics error: {e}")
+        logger.error("Analytics error: %s", e)
         user_activity = []
         login_frequency = []
         storage_stats = None
@@ -71,8 +74,7 @@ def share_analytics(token):
         flash('Share link not found', 'error')
         return redirect(url_for('analytics.analytics_dashboard'))
     
-    file_owner = File.get_file_owner(share_info['file_id'])
-    if file_owner != user_id:
+    if not File.get_owned(share_info['file_id'], user_id):
         flash('Unauthorized access', 'error')
         return redirect(url_for('analytics.analytics_dashboard'))
     
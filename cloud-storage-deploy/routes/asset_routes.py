@@ -0,0 +1,22 @@
+from flask import Blueprint, send_file, abort
+from utils.assets import asset_manifest, IMMUTABLE_MAX_AGE
+from utils.compression import choose_encoding
+
+assets_bp = Blueprint('assets', __name__)
+
+@assets_bp.route('/assets/<path:filename>')
+def asset(filename):
+    """Serve a fingerprinted asset, precompressed when the client allows it"""
+    info = asset_manifest.files.get(filename)
+    if info is None:
+        abort(404)
+    
+    variants = info['variants']
+    encoding = choose_encoding([e for e in ('br', 'gzip') if e in variants])
+    response = send_file(variants[encoding], mimetype=info['mimetype'], conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # The URL changes whenever the content does, so it never needs revalidating
+    response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return response
@@ -1,10 +1,15 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
 from models.user_model import User
 from models.db import db
+from utils.rate_limit import rate_limiter, by_ip, by_form
+from utils.password_hasher import HasherBusy
+from utils.sessions import regenerate_session
+from config import Config
 
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/register', methods=['GET', 'POST'])
+@rate_limiter.limit('register-ip', Config.REGISTER_RATE_LIMIT_PER_IP, by_ip, methods=('POST',))
 def register():
     if request.method == 'POST':
         name = request.form.get('name')
@@ -31,7 +36,12 @@ def register():
         
         # Create user
         user = User(name=name, email=email, password=password)
-        if user.create():
+        try:
+            created = user.create()
+        except HasherBusy:
+            flash('The server is busy. Please try again in a moment.', 'error')
+            return render_template('register.html'), 503, {'Retry-After': '5'}
+        if created:
             flash('Registration successful! Please login.', 'success')
             return redirect(url_for('auth.login'))
         else:
@@ -40,6 +50,8 @@ def register():
     return render_template('register.html')
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@rate_limiter.limit('login-ip', Config.LOGIN_RATE_LIMIT_PER_IP, by_ip, methods=('POST',))
+@rate_limiter.limit('login-account', Config.LOGIN_RATE_LIMIT_PER_ACCOUNT, by_form('email'), methods=('POST',))
 def login():
     if request.method == 'POST':
         email = request.form.get('email')
@@ -50,7 +62,14 @@ def login():
             return render_template('login.html')
         
         user = User.get_by_email(email)
-        if user and User.verify_password(user, password):
+        try:
+            verified = User.verify_password(user, password)
+        except HasherBusy:
+            flash('The server is busy. Please try again in a moment.', 'error')
+            return render_template('login.html'), 503, {'Retry-After': '5'}
+        if verified:
+            # A session id planted before login must not become an authenticated one
+            regenerate_session()
             session['user_id'] = user['id']
             session['user_name'] = user['name']
             session['user_email'] = user['email']
@@ -76,3 +95,16 @@ def login_required(f):
             return redirect(url_for('auth.login'))
         return f(*args, **kwargs)
     return decorated_function
+
+def admin_required(f):
+    from functools import wraps
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            flash('Please login to access this page', 'warning')
+            return redirect(url_for('auth.login'))
+        if session.get('user_email') not in Config.ADMIN_EMAILS:
+            flash('Unauthorized access', 'error')
+            return redirect(url_for('file.dashboard'))
+        return f(*args, **kwargs)
+    return decorated_function
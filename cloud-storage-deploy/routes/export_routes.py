@@ -0,0 +1,53 @@
+from flask import Blueprint, Response, session, stream_with_context, abort, request
+from models.file_model import File
+from models.share_model import ShareLink
+from models.analytics_model import ShareAnalytics, FileAnalytics
+from routes.auth_routes import login_required
+from utils.export import FORMATS, gzip_chunks
+from utils.rate_limit import rate_limiter, by_user
+from config import Config
+import datetime
+
+export_bp = Blueprint('export', __name__)
+
+# Dataset name -> (row source for a user, exported columns)
+DATASETS = {
+    'files': (File.iter_by_user,
+              ('id', 'folder_id', 'file_name', 'file_size', 's3_key', 's3_url', 'is_public', 'created_at')),
+    'share-links': (ShareLink.iter_by_owner,
+                    ('id', 'file_id', 'file_name', 'token', 'created_at', 'expiry_date',
+                     'max_downloads', 'download_count', 'is_active')),
+    'share-analytics': (ShareAnalytics.iter_by_owner,
+                        ('id', 'share_link_id', 'file_id', 'file_name', 'ip_address', 'user_agent', 'access_time')),
+    'file-analytics': (FileAnalytics.iter_by_owner,
+                       ('id', 'file_id', 'file_name', 'action_type', 'user_id', 'ip_address', 'timestamp')),
+}
+
+@export_bp.route('/export/<dataset>.<fmt>')
+@login_required
+@rate_limiter.limit('export-user', Config.EXPORT_RATE_LIMIT_PER_USER, by_user)
+def export_dataset(dataset, fmt):
+    """Stream one of the user's datasets as CSV or NDJSON.
+    
+    Rows come from a server-side cursor and are encoded as they arrive, so
+    memory stays flat regardless of row count and the response is sent
+    with chunked transfer encoding. ``?gzip=1`` compresses on the fly and
+    returns a .gz download.
+    """
+    if dataset not in DATASETS or fmt not in FORMATS:
+        abort(404)
+    source, columns = DATASETS[dataset]
+    encode, mimetype = FORMATS[fmt]
+    user_id = session['user_id']
+    
+    chunks = encode(source(user_id), columns)
+    filename = f"{dataset}-{datetime.date.today().isoformat()}.{fmt}"
+    if request.args.get('gzip') == '1':
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
@@ -1,13 +1,25 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, send_file, jsonify
-from werkzeug.utils import secure_filename
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, make_response, Response
 from models.file_model import File
 from models.folder_model import Folder
 from models.db import db
-from utils.s3_service import s3_service
+from utils.codec import presign_download, decoded_response
+from utils.tiering import ensure_available, restoring_message
+from utils.listing_cache import listing_cache
+from utils.job_queue import job_queue, PRIORITY_HIGH, PRIORITY_LOW
+from utils.upload_service import save_temp_upload, store_uploaded_file, discard_temp_upload
+from utils.direct_upload import (direct_uploads_enabled, start_direct_upload, presign_parts,
+                                 complete_direct_upload, abort_direct_upload)
+from models.upload_model import UploadBatch, DirectUpload
+from models.change_model import ChangeLog
+from werkzeug.utils import secure_filename
 from routes.auth_routes import login_required
-import os
-import shutil
+from routes.analytics_routes import record_file_action
+from utils.rate_limit import rate_limiter, by_user
 from config import Config
+import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 file_bp = Blueprint('file', __name__)
 
@@ -19,46 +31,87 @@ def allowed_file(filename):
 @login_required
 def dashboard():
     user_id = session['user_id']
-    folder_id = request.args.get('folder_id')
-    
-    # Get files in current folder or root
-    files = File.get_by_user(user_id, folder_id)
-    print(f"Debug: Retrieved {len(files) if files else 0} files for user {user_id} in folder {folder_id}")
+    folder_id = request.args.get('folder_id', type=int)
     
-    # Get folder information
-    current_folder = None
-    breadcrumb = []
-    folders = []
+    # Pages carrying flash messages differ from the plain listing and are never cached
+    has_flashes = '_flashes' in session
+    etag = listing_cache.etag(user_id, f"dashboard:{folder_id}")
+    if not has_flashes and etag in request.if_none_match:
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
     
-    if folder_id:
-        current_folder = Folder.get_by_id(folder_id)
-        if current_folder and current_folder['user_id'] == user_id:
-            breadcrumb = Folder.get_folder_path(folder_id)
-            folders = Folder.get_child_folders(folder_id, user_id)
+    listing = listing_cache.get(user_id, f"dashboard:{folder_id}")
+    if listing is None:
+        generation = listing_cache.generation(user_id)
+        # Read before the listing, so live updates replay anything that lands in between
+        changes_cursor = ChangeLog.latest_cursor(user_id, Config.CHANGES_SETTLE_SECONDS)
+        
+        # Get files in current folder or root
+        files = File.get_by_user(user_id, folder_id)
+        logger.debug("Retrieved %s files for user %s in folder %s", len(files) if files else 0, user_id, folder_id)
+        
+        # Get folder information
+        current_folder = None
+        breadcrumb = []
+        folders = []
+        
+        if folder_id:
+            current_folder = Folder.get_owned(folder_id, user_id)
+            if current_folder:
+                breadcrumb = Folder.get_folder_path(folder_id)
+                folders = Folder.get_child_folders(folder_id, user_id)
+            else:
+                # Invalid folder, redirect to root
+                return redirect(url_for('file.dashboard'))
         else:
-            # Invalid folder, redirect to root
-            return redirect(url_for('file.dashboard'))
-    else:
-        # Root folder
-        folders = Folder.get_root_folders(user_id)
+            # Root folder
+            folders = Folder.get_root_folders(user_id)
+        
+        listing = {
+            'files': files,
+            'current_folder': current_folder,
+            'breadcrumb': breadcrumb,
+            'folders': folders,
+            'changes_cursor': changes_cursor,
+            'html': None
+        }
+        listing_cache.put(user_id, f"dashboard:{folder_id}", generation, listing)
+    
+    if has_flashes:
+        return render_template('dashboard.html', 
+                             files=listing['files'], 
+                             current_folder=listing['current_folder'],
+                             breadcrumb=listing['breadcrumb'],
+                             folders=listing['folders'],
+                             changes_cursor=listing['changes_cursor'])
+    
+    if listing['html'] is None:
+        listing['html'] = render_template('dashboard.html', 
+                                          files=listing['files'], 
+                                          current_folder=listing['current_folder'],
+                                          breadcrumb=listing['breadcrumb'],
+                                          folders=listing['folders'],
+                                          changes_cursor=listing['changes_cursor'])
     
-    return render_template('dashboard.html', 
-                         files=files, 
-                         current_folder=current_folder,
-                         breadcrumb=breadcrumb,
-                         folders=folders)
+    response = make_response(listing['html'])
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 @file_bp.route('/upload', methods=['GET', 'POST'])
 @login_required
 def upload():
     if request.method == 'POST':
         if 'files' not in request.files:
+            if request.form.get('async') == '1':
+                return jsonify({'error': 'No files selected'}), 400
             flash('No files selected', 'error')
             return redirect(request.url)
         
         files = request.files.getlist('files')
         valid_files = []
         user_id = session['user_id']
+        wants_async = request.form.get('async') == '1'
         
         # Get current folder
         folder_id = request.form.get('folder_id')
@@ -74,121 +127,62 @@ def upload():
             if file.filename != '' and allowed_file(file.filename):
                 valid_files.append(file)
         
-        print(f"Debug: Found {len(valid_files)} valid files out of {len(files)} total files")
+        logger.debug("Found %s valid files out of %s total files", len(valid_files), len(files))
         
         if not valid_files:
+            if wants_async:
+                return jsonify({'error': 'No valid files selected'}), 400
             flash('No valid files selected', 'error')
             return redirect(request.url)
         
+        if wants_async:
+            # Accept the payload now and store it from a background worker
+            items = []
+            try:
+                for file in valid_files:
+                    filename, temp_path, file_size = save_temp_upload(file)
+                    items.append({'file_name': filename, 'file_size': file_size, 'temp_path': temp_path})
+                batch_id = UploadBatch.create(user_id, folder_id, items)
+            except Exception:
+                batch_id = None
+                logger.exception("Failed to queue upload batch")
+            if not batch_id:
+                # Nothing will process the saved files, so do not leave them behind
+                for item in items:
+                    discard_temp_upload(item['temp_path'])
+                return jsonify({'error': 'Failed to queue upload'}), 500
+            job_queue.enqueue('process_upload_batch', {'batch_id': batch_id}, priority=PRIORITY_HIGH)
+            
+            return jsonify({
+                'batch_id': batch_id,
+                'status_url': url_for('file.upload_status', batch_id=batch_id)
+            }), 202
+        
         # Process multiple files
         uploaded_files = []
         failed_files = []
         
         for file in valid_files:
+            temp_path = None
             try:
-                filename = secure_filename(file.filename)
-                print(f"Debug: Processing file: {filename}")
-                
-                # Create upload directories if they don't exist
-                temp_dir = Config.UPLOAD_FOLDER
-                local_dir = 'static/uploads'
-                if not os.path.exists(temp_dir):
-                    os.makedirs(temp_dir)
-                    print(f"Debug: Created temp directory: {temp_dir}")
-                if not os.path.exists(local_dir):
-                    os.makedirs(local_dir)
-                    print(f"Debug: Created local directory: {local_dir}")
-                
-                # Get file size before saving
-                file.seek(0, os.SEEK_END)
-                file_size = file.tell()
-                file.seek(0)  # Reset file pointer
-                
-                # Save file temporarily
-                temp_path = os.path.join(temp_dir, filename)
-                file.save(temp_path)
-                print(f"Debug: Saved file temporarily to: {temp_path}")
-                
-                # Try to upload to S3, but fallback to local storage if S3 fails
-                try:
-                    print(f"Debug: Attempting S3 upload for {filename}")
-                    s3_result = s3_service.upload_file(temp_path, filename, user_id)
-                    print(f"Debug: S3 upload result: {s3_result}")
-                    
-                    if s3_result['success']:
-                        print(f"Debug: S3 upload successful for {filename}")
-                        # Save file metadata to database
-                        new_file = File(
-                            user_id=user_id,
-                            file_name=filename,
-                            file_size=file_size,
-                            folder_id=folder_id,
-                            s3_key=s3_result['s3_key'],
-                            s3_url=s3_result['s3_url']
-                        )
-                        
-                        if new_file.create():
-                            uploaded_files.append(filename)
-                            print(f"Debug: Database entry created for {filename}")
-                        else:
-                            failed_files.append(filename)
-                            print(f"Debug: Failed to create database entry for {filename}")
-                    else:
-                        print(f"Debug: S3 upload failed, using local storage for {filename}")
-                        # Fallback to local storage
-                        local_path = os.path.join(local_dir, filename)
-                        # Copy from temp to local uploads
-                        shutil.copy2(temp_path, local_path)
-                        print(f"Debug: Copied file to local storage: {local_path}")
-                        
-                        local_url = f"/static/uploads/{filename}"
-                        new_file = File(
-                            user_id=user_id,
-                            file_name=filename,
-                            file_size=file_size,
-                            folder_id=folder_id,
-                            s3_key=f"local/{filename}",
-                            s3_url=local_url
-                        )
-                        
-                        if new_file.create():
-                            uploaded_files.append(filename)
-                            print(f"Debug: Local storage database entry created for {filename}")
-                        else:
-                            failed_files.append(filename)
-                            print(f"Debug: Failed to create local storage database entry for {filename}")
-                except Exception as e:
-                    print(f"Debug: S3 Upload Exception for {filename}: {e}")
-                    # Fallback to local storage
-                    local_path = os.path.join(local_dir, filename)
-                    # Copy from temp to local uploads
-                    shutil.copy2(temp_path, local_path)
-                    print(f"Debug: Exception fallback - copied file to local storage: {local_path}")
-                    
-                    local_url = f"/static/uploads/{filename}"
-                    new_file = File(
-                        user_id=user_id,
-                        file_name=filename,
-                        file_size=file_size,
-                        folder_id=folder_id,
-                        s3_key=f"local/{filename}",
-                        s3_url=local_url
-                    )
-                    
-                    if new_file.create():
-                        uploaded_files.append(filename)
-                        print(f"Debug: Exception fallback - database entry created for {filename}")
-                    else:
-                        failed_files.append(filename)
-                        print(f"Debug: Exception fallback - failed to create database entry for {filename}")
-                
-                # Clean up temporary file
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                    
+                filename, temp_path, file_size = save_temp_upload(file)
+                logger.debug("Processing file: %s", filename)
+                if store_uploaded_file(temp_path, filename, file_size, user_id, folder_id):
+                    uploaded_files.append(filename)
+                else:
+                    failed_files.append(filename)
             except Exception as e:
-                print(f"Error processing file {file.filename}: {e}")
+                logger.error("Error processing file %s: %s", file.filename, e)
                 failed_files.append(file.filename)
+            finally:
+                # Whatever happened, the upload is either stored or failed for good
+                if temp_path is not None:
+                    discard_temp_upload(temp_path)
+        
+        # Refresh storage totals off the request path
+        if uploaded_files:
+            job_queue.enqueue('reconcile_storage', {'user_id': user_id}, priority=PRIORITY_LOW,
+                              delay=30, dedupe_key=f"reconcile:{user_id}")
         
         # Show results
         if uploaded_files:
@@ -208,89 +202,231 @@ def upload():
     
     # GET request - show upload form
     folder_id = request.args.get('folder_id')
-    return render_template('upload.html', folder_id=folder_id)
+    direct = direct_uploads_enabled()
+    return render_template('upload.html', folder_id=folder_id, direct_uploads=direct,
+                           max_upload_size=Config.DIRECT_UPLOAD_MAX_SIZE if direct else Config.MAX_CONTENT_LENGTH)
+
+@file_bp.route('/api/uploads/<batch_id>')
+@login_required
+def upload_status(batch_id):
+    """Report the per-file state of an upload accepted in async mode"""
+    user_id = session['user_id']
+    batch = UploadBatch.get(batch_id, user_id)
+    if not batch:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    items = UploadBatch.get_items(batch_id)
+    files = [{
+        'file_name': item['file_name'],
+        'file_size': item['file_size'],
+        'status': item['status'],
+        'file_id': item['file_id'],
+        'error': item['error']
+    } for item in items]
+    finished = all(item['status'] in ('done', 'failed') for item in items)
+    
+    redirect_url = url_for('file.dashboard')
+    if batch['folder_id']:
+        redirect_url = f"{redirect_url}?folder_id={batch['folder_id']}"
+    
+    return jsonify({
+        'batch_id': batch_id,
+        'complete': finished,
+        'done': sum(1 for item in items if item['status'] == 'done'),
+        'failed': sum(1 for item in items if item['status'] == 'failed'),
+        'total': len(items),
+        'files': files,
+        'redirect_url': redirect_url
+    })
+
+@file_bp.route('/api/direct-uploads', methods=['POST'])
+@login_required
+@rate_limiter.limit('direct-upload-user', Config.DIRECT_UPLOAD_RATE_LIMIT_PER_USER, by_user)
+def start_direct_upload_api():
+    """Begin a browser-to-bucket upload: returns a presigned POST or a multipart plan"""
+    if not direct_uploads_enabled():
+        return jsonify({'error': 'Direct uploads are not enabled'}), 404
+    user_id = session['user_id']
+    data = request.get_json(silent=True) or {}
+    
+    file_name = secure_filename(data.get('file_name') or '')
+    file_size = data.get('file_size')
+    if not file_name or not allowed_file(file_name):
+        return jsonify({'error': 'File type not allowed'}), 400
+    if not isinstance(file_size, int) or not 0 <= file_size <= Config.DIRECT_UPLOAD_MAX_SIZE:
+        return jsonify({'error': 'File is empty or too large'}), 400
+    
+    folder_id = data.get('folder_id') or None
+    if folder_id and not Folder.folder_exists(folder_id, user_id):
+        folder_id = None
+    
+    result = start_direct_upload(user_id, folder_id, file_name, file_size,
+                                 data.get('content_type') or 'application/octet-stream')
+    if not result['success']:
+        return jsonify({'error': result['error']}), 502
+    
+    upload = result.pop('upload')
+    del result['success']
+    result.update({
+        'upload_id': upload,
+        'parts_url': url_for('file.presign_direct_upload_parts', upload_id=upload),
+        'complete_url': url_for('file.complete_direct_upload_api', upload_id=upload),
+        'abort_url': url_for('file.abort_direct_upload_api', upload_id=upload)
+    })
+    return jsonify(result), 201
+
+@file_bp.route('/api/direct-uploads/<upload_id>/parts', methods=['POST'])
+@login_required
+@rate_limiter.limit('direct-upload-user', Config.DIRECT_UPLOAD_RATE_LIMIT_PER_USER, by_user)
+def presign_direct_upload_parts(upload_id):
+    """Presigned PUT URLs for up to 100 multipart parts per call"""
+    upload = DirectUpload.get(upload_id, session['user_id'])
+    if not upload:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    part_numbers = (request.get_json(silent=True) or {}).get('part_numbers') or []
+    if len(part_numbers) > 100 or not all(isinstance(n, int) for n in part_numbers):
+        return jsonify({'error': 'Request at most 100 integer part numbers'}), 400
+    
+    result = presign_parts(upload, part_numbers)
+    if not result['success']:
+        return jsonify({'error': result['error']}), 400
+    return jsonify({'urls': result['urls']})
+
+@file_bp.route('/api/direct-uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+@rate_limiter.limit('direct-upload-user', Config.DIRECT_UPLOAD_RATE_LIMIT_PER_USER, by_user)
+def complete_direct_upload_api(upload_id):
+    """Verify the uploaded object and record the file"""
+    user_id = session['user_id']
+    upload = DirectUpload.get(upload_id, user_id)
+    if not upload:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    result = complete_direct_upload(upload)
+    if not result['success']:
+        return jsonify({'error': result['error']}), 409
+    
+    job_queue.enqueue('reconcile_storage', {'user_id': user_id}, priority=PRIORITY_LOW,
+                      delay=30, dedupe_key=f"reconcile:{user_id}")
+    redirect_url = url_for('file.dashboard')
+    if upload['folder_id']:
+        redirect_url = f"{redirect_url}?folder_id={upload['folder_id']}"
+    new_file = result['file']
+    return jsonify({'file_id': new_file.id, 'file_name': new_file.file_name, 'redirect_url': redirect_url})
+
+@file_bp.route('/api/direct-uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_direct_upload_api(upload_id):
+    upload = DirectUpload.get(upload_id, session['user_id'])
+    if not upload:
+        return jsonify({'error': 'Upload not found'}), 404
+    abort_direct_upload(upload)
+    return jsonify({'aborted': True})
 
 @file_bp.route('/delete/<int:file_id>')
 @login_required
 def delete_file(file_id):
     user_id = session['user_id']
     
-    # Verify file ownership
-    file_owner = File.get_file_owner(file_id)
-    if file_owner != user_id:
+    # Load the file with ownership verified
+    file_details = File.get_owned(file_id, user_id)
+    if not file_details:
         flash('Unauthorized access', 'error')
         return redirect(url_for('file.dashboard'))
     
-    # Get file details
-    file_details = File.get_by_id(file_id)
-    if file_details:
-        # Check if it's a local file or S3 file
-        if file_details['s3_key'].startswith('local/'):
-            # Delete local file
-            local_filename = file_details['s3_key'].replace('local/', '')
-            local_path = os.path.join('static/uploads', local_filename)
-            if os.path.exists(local_path):
-                os.remove(local_path)
-            
-            # Delete from database
-            if File.delete(file_id, user_id):
-                flash('File deleted successfully!', 'success')
-            else:
-                flash('Database deletion failed', 'error')
-        else:
-            # Delete from S3
-            try:
-                s3_result = s3_service.delete_file(file_details['s3_key'])
-                
-                if s3_result['success']:
-                    # Delete from database
-                    if File.delete(file_id, user_id):
-                        flash('File deleted successfully!', 'success')
-                    else:
-                        flash('File deleted from S3 but database deletion failed', 'error')
-                else:
-                    flash(f'Deletion failed: {s3_result["error"]}', 'error')
-            except Exception as e:
-                flash(f'Deletion failed: {str(e)}', 'error')
+    # The blob stays in storage until the trash purger removes it
+    if File.trash([file_id], user_id):
+        job_queue.enqueue('reconcile_storage', {'user_id': user_id}, priority=PRIORITY_LOW,
+                          delay=30, dedupe_key=f"reconcile:{user_id}")
+        flash(f'File moved to trash. You can restore it for {Config.TRASH_RETENTION_DAYS} days.', 'success')
     else:
-        flash('File not found', 'error')
+        flash('Deletion failed', 'error')
     
-    return redirect(url_for('file.dashboard'))
+    redirect_url = url_for('file.dashboard')
+    if file_details['folder_id']:
+        redirect_url = f"{redirect_url}?folder_id={file_details['folder_id']}"
+    return redirect(redirect_url)
+
+@file_bp.route('/trash')
+@login_required
+def trash():
+    files = File.get_trash(session['user_id'])
+    for file in files:
+        file['purge_after'] = file['deleted_at'] + datetime.timedelta(days=Config.TRASH_RETENTION_DAYS)
+    return render_template('trash.html', files=files, retention_days=Config.TRASH_RETENTION_DAYS)
+
+@file_bp.route('/trash/<int:file_id>/restore', methods=['POST'])
+@login_required
+def restore_file(file_id):
+    user_id = session['user_id']
+    if File.restore(file_id, user_id, Config.TRASH_RETENTION_DAYS):
+        job_queue.enqueue('reconcile_storage', {'user_id': user_id}, priority=PRIORITY_LOW,
+                          delay=30, dedupe_key=f"reconcile:{user_id}")
+        flash('File restored', 'success')
+    else:
+        flash('File cannot be restored', 'error')
+    return redirect(url_for('file.trash'))
+
+@file_bp.route('/trash/empty', methods=['POST'])
+@login_required
+def empty_trash():
+    """Hand everything in the trash to the purger now"""
+    if File.expire_trash(session['user_id'], Config.TRASH_RETENTION_DAYS):
+        job_queue.enqueue('purge_trash', {}, priority=PRIORITY_LOW, dedupe_key='purge_trash:0')
+        flash('Trash emptied. Files are being deleted permanently.', 'success')
+    else:
+        flash('Failed to empty trash', 'error')
+    return redirect(url_for('file.trash'))
 
 @file_bp.route('/download/<int:file_id>')
 @login_required
 def download_file(file_id):
     user_id = session['user_id']
     
-    # Verify file ownership
-    file_owner = File.get_file_owner(file_id)
-    if file_owner != user_id:
+    # Load the file with ownership verified
+    return redirect_to_download(File.get_owned(file_id, user_id))
+
+def redirect_to_download(file_details):
+    """Redirect to a presigned URL for an owned file row (None if not owned)"""
+    if not file_details:
         flash('Unauthorized access', 'error')
         return redirect(url_for('file.dashboard'))
     
-    # Get file details
-    file_details = File.get_by_id(file_id)
-    if file_details:
-        # Check if it's a local file or S3 file
-        if file_details['s3_key'].startswith('local/'):
-            # Local file download
-            local_filename = file_details['s3_key'].replace('local/', '')
-            local_path = os.path.join('static/uploads', local_filename)
-            if os.path.exists(local_path):
-                return send_file(local_path, as_attachment=True, download_name=file_details['file_name'])
-            else:
-                flash('Local file not found', 'error')
+    record_file_action(file_details['id'], 'download', file_details['user_id'], request.remote_addr)
+    try:
+        retry_after = ensure_available(file_details)
+        if retry_after is not None:
+            flash(restoring_message(retry_after), 'info')
+            return redirect(url_for('file.dashboard'))
+        
+        decoded_url = url_for('file.download_decoded', file_id=file_details['id'])
+        result = presign_download(file_details, decoded_url, Config.PRESIGNED_URL_EXPIRY)
+        if result['success']:
+            return redirect(result['url'])
         else:
-            # S3 file download
-            try:
-                s3_result = s3_service.generate_presigned_url(file_details['s3_key'])
-                if s3_result['success']:
-                    return redirect(s3_result['url'])
-                else:
-                    flash(f'Download failed: {s3_result["error"]}', 'error')
-            except Exception as e:
-                flash(f'Download failed: {str(e)}', 'error')
-    else:
-        flash('File not found', 'error')
+            flash(f'Download failed: {result["error"]}', 'error')
+    except Exception as e:
+        flash(f'Download failed: {str(e)}', 'error')
     
     return redirect(url_for('file.dashboard'))
+
+@file_bp.route('/download/<int:file_id>/decoded')
+@login_required
+def download_decoded(file_id):
+    """Serve a compressed file decompressed, for clients that cannot decode it themselves"""
+    file_details = File.get_owned(file_id, session['user_id'])
+    if not file_details:
+        flash('Unauthorized access', 'error')
+        return redirect(url_for('file.dashboard'))
+    
+    retry_after = ensure_available(file_details)
+    if retry_after is not None:
+        flash(restoring_message(retry_after), 'info')
+        return redirect(url_for('file.dashboard'))
+    
+    response = decoded_response(file_details)
+    if response is None:
+        flash('File not found', 'error')
+        return redirect(url_for('file.dashboard'))
+    return response
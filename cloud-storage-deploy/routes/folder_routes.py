@@ -1,7 +1,9 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, Response
 from models.file_model import File
 from models.folder_model import Folder
 from routes.auth_routes import login_required
+from utils.listing_cache import listing_cache
+from config import Config
 
 folder_bp = Blueprint('folder', __name__)
 
@@ -49,8 +51,7 @@ def move_to_folder(file_id):
     target_folder_id = request.form.get('target_folder_id')
     
     # Verify file ownership
-    file_owner = File.get_file_owner(file_id)
-    if file_owner != user_id:
+    if not File.get_owned(file_id, user_id):
         flash('Unauthorized access', 'error')
         return redirect(request.referrer or url_for('file.dashboard'))
     
@@ -79,8 +80,8 @@ def delete_folder(folder_id):
     user_id = session['user_id']
     
     # Verify folder ownership
-    folder = Folder.get_by_id(folder_id)
-    if not folder or folder['user_id'] != user_id:
+    folder = Folder.get_owned(folder_id, user_id)
+    if not folder:
         flash('Unauthorized access', 'error')
         return redirect(request.referrer or url_for('file.dashboard'))
     
@@ -95,7 +96,41 @@ def delete_folder(folder_id):
 @folder_bp.route('/api/folder_tree')
 @login_required
 def folder_tree_api():
-    """API endpoint to get folder tree for navigation"""
+    """API endpoint to get one level of the folder tree for navigation.
+    
+    Query parameters: ``parent_id`` (omit for root), ``limit`` and ``offset``.
+    Responses carry an ETag derived from the user's listing generation, so
+    unchanged levels revalidate with a 304 without touching the database.
+    """
     user_id = session['user_id']
-    tree = Folder.get_folder_tree(user_id)
-    return jsonify(tree)
+    parent_id, limit, offset = folder_tree_args(request.args)
+    
+    etag = listing_cache.etag(user_id, f"tree:{parent_id}:{limit}:{offset}")
+    if etag in request.if_none_match:
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
+    
+    if parent_id is not None and not Folder.folder_exists(parent_id, user_id):
+        return jsonify({'error': 'Folder not found'}), 404
+    
+    folders, has_more = Folder.get_children_page(user_id, parent_id, limit, offset)
+    return folder_tree_response(etag, parent_id, folders, has_more, limit, offset)
+
+def folder_tree_args(args):
+    """Parse and clamp (parent_id, limit, offset) from the query string"""
+    parent_id = args.get('parent_id', type=int)
+    limit = args.get('limit', Config.FOLDER_TREE_PAGE_SIZE, type=int)
+    offset = args.get('offset', 0, type=int)
+    return parent_id, max(1, min(limit, Config.FOLDER_TREE_MAX_PAGE_SIZE)), max(0, offset)
+
+def folder_tree_response(etag, parent_id, folders, has_more, limit, offset):
+    for folder in folders:
+        folder['has_children'] = folder['child_count'] > 0
+    response = jsonify({
+        'parent_id': parent_id,
+        'folders': folders,
+        'next_offset': offset + limit if has_more else None
+    })
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,26 @@
+from flask import Blueprint, Response, request, abort
+from utils.instrumentation import metrics
+from utils.job_queue import job_queue
+from config import Config
+
+metrics_bp = Blueprint('metrics', __name__)
+
+JOB_QUEUE_DEPTH = metrics.gauge('job_queue_jobs', 'Jobs in the background queue', ('kind', 'status'))
+JOB_QUEUE_LAG = metrics.gauge('job_queue_lag_seconds', 'Age of the oldest runnable queued job')
+JOB_QUEUE_WORKERS = metrics.gauge('job_queue_workers', 'Live job worker threads in this process')
+
+def collect_job_queue():
+    stats = job_queue.stats()
+    for row in stats['depth']:
+        JOB_QUEUE_DEPTH.set(row['count'], kind=row['kind'], status=row['status'])
+    JOB_QUEUE_LAG.set(stats['lag_seconds'])
+    JOB_QUEUE_WORKERS.set(stats['workers'])
+
+metrics.add_collector(collect_job_queue)
+
+@metrics_bp.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint for this worker process"""
+    if Config.METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {Config.METRICS_TOKEN}":
+        abort(403)
+    return Response(metrics.expose(), mimetype='text/plain; version=0.0.4')
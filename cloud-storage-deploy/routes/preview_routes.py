@@ -1,12 +1,17 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, send_file, jsonify
-from werkzeug.utils import secure_filename
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
 from models.file_model import File
 from models.db import db
-from utils.s3_service import s3_service
+from utils.storage import backend_for_key
+from utils.codec import read_decoded_prefix
+from utils.tiering import ensure_available, restoring_message
 from routes.auth_routes import login_required
+from routes.analytics_routes import record_file_action
 import os
 import mimetypes
 from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
 
 preview_bp = Blueprint('preview', __name__)
 
@@ -55,156 +60,83 @@ def get_file_type(filename):
     
     return 'unknown'
 
-def get_file_content(file_path, file_type):
-    """Get file content for preview"""
-    try:
-        if file_type in ['text', 'code']:
-            # For text and code files, read the content
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-                return content
-        elif file_type == 'image':
-            # For images, we'll handle in the template
-            return None
-        else:
-            return None
-    except Exception as e:
-        print(f"Error reading file content: {e}")
-        return None
+def get_file_content(data):
+    """Decode the leading bytes of a text or code file for preview"""
+    content = data.decode('utf-8', errors='ignore')
+    if len(data) >= Config.PREVIEW_MAX_BYTES:
+        content += "\n\n[Preview truncated - download the file to see the rest]"
+    return content
 
 @preview_bp.route('/preview/<int:file_id>')
 @login_required
 def preview_file(file_id):
     user_id = session['user_id']
     
-    # Verify file ownership
-    file_owner = File.get_file_owner(file_id)
-    if file_owner != user_id:
-        flash('Unauthorized access', 'error')
-        return redirect(url_for('file.dashboard'))
-    
-    # Get file details
-    file_details = File.get_by_id(file_id)
+    # Load the file with ownership verified
+    file_details = File.get_owned(file_id, user_id)
     if not file_details:
-        flash('File not found', 'error')
+        flash('Unauthorized access', 'error')
         return redirect(url_for('file.dashboard'))
     
     file_type = get_file_type(file_details['file_name'])
     file_size = file_details.get('file_size', 0)
     
-    # Debug information
-    print(f"Debug: Preview request for file_id={file_id}")
-    print(f"Debug: File details: {file_details}")
-    print(f"Debug: File type: {file_type}")
-    print(f"Debug: S3 key: {file_details['s3_key']}")
+    logger.debug("Preview request for file_id=%s type=%s key=%s", file_id, file_type, file_details['s3_key'])
     
-    # Handle different file types
-    if file_type == 'image':
-        # For images, render the preview template with image path
-        if file_details['s3_key'].startswith('local/'):
-            # Local file
-            local_filename = file_details['s3_key'].replace('local/', '')
-            file_path = f"/static/uploads/{local_filename}"
-            full_path = os.path.join('static/uploads', local_filename)
-            print(f"Debug: Image file path: {full_path}")
-            print(f"Debug: Image file exists: {os.path.exists(full_path)}")
-            if os.path.exists(full_path):
-                file_size_actual = os.path.getsize(full_path)
-                print(f"Debug: Image file size: {file_size_actual} bytes")
-                if file_size_actual > 0:
-                    return render_template('preview.html', 
-                                         file=file_details,
-                                         file_path=file_path,
-                                         file_type=file_type,
-                                         file_size=file_size)
-                else:
-                    flash('Image file is empty', 'error')
-                    return redirect(url_for('file.dashboard'))
-            else:
-                flash('File not found', 'error')
-                return redirect(url_for('file.dashboard'))
-        else:
-            # S3 file - generate presigned URL for embedding
-            try:
-                s3_result = s3_service.generate_presigned_url(file_details['s3_key'])
-                if s3_result['success']:
-                    return render_template('preview.html', 
-                                         file=file_details,
-                                         file_url=s3_result['url'],
-                                         file_type=file_type,
-                                         file_size=file_size)
-                else:
-                    flash('Failed to generate preview URL', 'error')
-                    return redirect(url_for('file.dashboard'))
-            except Exception as e:
-                flash(f'Preview failed: {str(e)}', 'error')
-                return redirect(url_for('file.dashboard'))
+    backend = backend_for_key(file_details['s3_key'])
     
-    elif file_type in ['text', 'code']:
-        # For text and code files, read content
-        if file_details['s3_key'].startswith('local/'):
-            # Local file
-            local_filename = file_details['s3_key'].replace('local/', '')
-            file_path = os.path.join('static/uploads', local_filename)
-            if os.path.exists(file_path):
-                content = get_file_content(file_path, file_type)
-                if content is not None:
-                    # Ensure content is not empty
-                    if not content.strip():
-                        content = "[File is empty or contains no readable content]"
-                    return render_template('preview.html', 
-                                         file=file_details,
-                                         content=content,
-                                         file_type=file_type,
-                                         file_size=file_size)
-                else:
-                    flash('Failed to read file content', 'error')
-                    return redirect(url_for('file.dashboard'))
-            else:
-                flash('File not found', 'error')
-                return redirect(url_for('file.dashboard'))
-        else:
-            # S3 file - download temporarily for preview
-            try:
-                # This would require downloading from S3 first
-                # For now, suggest download
-                flash('Text files from S3 cannot be previewed directly. Please download to view.', 'info')
-                return redirect(url_for('file.download_file', file_id=file_id))
-            except Exception as e:
-                flash(f'Preview failed: {str(e)}', 'error')
-                return redirect(url_for('file.dashboard'))
+    if file_type in ['image', 'pdf', 'text', 'code']:
+        record_file_action(file_id, 'preview', user_id, request.remote_addr)
+        try:
+            retry_after = ensure_available(file_details)
+        except Exception as e:
+            # Storage errors other than a missing object (access denied, throttling) surface here
+            flash(f'Preview failed: {str(e)}', 'error')
+            return redirect(url_for('file.dashboard'))
+        if retry_after is not None:
+            flash(restoring_message(retry_after), 'info')
+            return redirect(url_for('file.dashboard'))
     
-    elif file_type == 'pdf':
-        # For PDF files, we'll embed them
-        if file_details['s3_key'].startswith('local/'):
-            # Local file
-            local_filename = file_details['s3_key'].replace('local/', '')
-            file_path = os.path.join('static/uploads', local_filename)
-            if os.path.exists(file_path):
+    # Handle different file types
+    if file_type in ['image', 'pdf']:
+        # Embed through a time-limited URL from the owning backend
+        try:
+            result = backend.presign(file_details['s3_key'], Config.PRESIGNED_URL_EXPIRY,
+                                     content_encoding=file_details.get('codec'))
+            if result['success']:
                 return render_template('preview.html', 
                                      file=file_details,
-                                     file_path=f"/static/uploads/{local_filename}",
+                                     file_url=result['url'],
                                      file_type=file_type,
                                      file_size=file_size)
             else:
-                flash('File not found', 'error')
-                return redirect(url_for('file.dashboard'))
-        else:
-            # S3 file - generate presigned URL for embedding
-            try:
-                s3_result = s3_service.generate_presigned_url(file_details['s3_key'])
-                if s3_result['success']:
-                    return render_template('preview.html', 
-                                         file=file_details,
-                                         file_url=s3_result['url'],
-                                         file_type=file_type,
-                                         file_size=file_size)
-                else:
-                    flash('Failed to generate preview URL', 'error')
-                    return redirect(url_for('file.dashboard'))
-            except Exception as e:
-                flash(f'Preview failed: {str(e)}', 'error')
+                flash('Failed to generate preview URL', 'error')
                 return redirect(url_for('file.dashboard'))
+        except Exception as e:
+            flash(f'Preview failed: {str(e)}', 'error')
+            return redirect(url_for('file.dashboard'))
+    
+    elif file_type in ['text', 'code']:
+        # Only the leading bytes are fetched (and decompressed), so large files preview cheaply
+        try:
+            data = read_decoded_prefix(backend, file_details['s3_key'], file_details.get('codec'),
+                                       Config.PREVIEW_MAX_BYTES)
+        except Exception as e:
+            flash(f'Preview failed: {str(e)}', 'error')
+            return redirect(url_for('file.dashboard'))
+        if data is None:
+            flash('File not found', 'error')
+            return redirect(url_for('file.dashboard'))
+        
+        content = get_file_content(data)
+        # Ensure content is not empty
+        if not content.strip():
+            content = "[File is empty or contains no readable content]"
+        return render_template('preview.html', 
+                             file=file_details,
+                             content=content,
+                             file_type=file_type,
+                             file_size=file_size)
     
     else:
         # For other file types, show download suggestion
@@ -218,27 +150,17 @@ def preview_file(file_id):
 def test_files():
     """Test route to check available files"""
     user_id = session['user_id']
-    files = File.get_by_user(user_id)
+    files = File.get_by_user(user_id, columns=('id', 'file_name', 's3_key'))
 
     file_info = []
     for file in files:
-        file_path = None
-        exists = False
-        file_size = 0
-        if file['s3_key'].startswith('local/'):
-            local_filename = file['s3_key'].replace('local/', '')
-            file_path = os.path.join('static/uploads', local_filename)
-            exists = os.path.exists(file_path)
-            if exists:
-                file_size = os.path.getsize(file_path)
-
+        head = backend_for_key(file['s3_key']).head(file['s3_key'])
         file_info.append({
             'id': file['id'],
             'name': file['file_name'],
             's3_key': file['s3_key'],
-            'file_path': file_path,
-            'exists': exists,
-            'file_size': file_size,
+            'exists': head is not None,
+            'file_size': head['size'] if head else 0,
             'type': get_file_type(file['file_name'])
         })
 
@@ -248,8 +170,8 @@ def test_files():
 def test_image(filename):
     """Test route to serve images directly"""
     from flask import send_from_directory, current_app
-    print(f"Debug: Serving image: {filename}")
-    print(f"Debug: Upload folder: {current_app.static_folder}")
+    logger.debug("Serving image: %s", filename)
+    logger.debug("Upload folder: %s", current_app.static_folder)
     return send_from_directory('static/uploads', filename)
 
 @preview_bp.route('/test-static')
@@ -267,29 +189,27 @@ def preview_info(file_id):
     """API endpoint to get file preview information"""
     user_id = session['user_id']
     
-    # Verify file ownership
-    file_owner = File.get_file_owner(file_id)
-    if file_owner != user_id:
-        return jsonify({'error': 'Unauthorized access'}), 403
-    
-    # Get file details
-    file_details = File.get_by_id(file_id)
+    # Load the file with ownership verified
+    file_details = File.get_owned(file_id, user_id)
     if not file_details:
-        return jsonify({'error': 'File not found'}), 404
+        return jsonify({'error': 'Unauthorized access'}), 403
     
+    return jsonify(preview_info_payload(file_details))
+
+def preview_info_payload(file_details):
+    """Preview metadata for a file row, shared with the async serving mode"""
     file_type = get_file_type(file_details['file_name'])
     file_size = file_details.get('file_size', 0)
     
     # Determine if preview is available
     preview_available = file_type in ['image', 'text', 'code', 'pdf']
     
-    response_data = {
-        'file_id': file_id,
+    return {
+        'file_id': file_details['id'],
         'file_name': file_details['file_name'],
         'file_type': file_type,
         'file_size': file_size,
         'preview_available': preview_available,
+        'storage_tier': file_details.get('storage_tier') or 'standard',
         'created_at': file_details['created_at'].isoformat() if file_details['created_at'] else None
     }
-    
-    return jsonify(response_data)
@@ -1,32 +1,34 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from models.share_model import ShareLink
 from models.file_model import File
+from models.change_model import ChangeLog
 from models.db import db
-from utils.s3_service import s3_service
+from utils.codec import presign_download, decoded_response
+from utils.tiering import ensure_available, restoring_message
+from utils.change_feed import event_bus
 from routes.auth_routes import login_required
+from routes.analytics_routes import record_share_access
+from utils.rate_limit import rate_limiter, by_ip, by_user, by_view_arg
 from config import Config
 
 share_bp = Blueprint('share', __name__)
 
 @share_bp.route('/generate-share/<int:file_id>')
 @login_required
+@rate_limiter.limit('share-create-user', Config.SHARE_CREATE_RATE_LIMIT_PER_USER, by_user)
 def generate_share(file_id):
     user_id = session['user_id']
     
-    # Verify file ownership
-    file_owner = File.get_file_owner(file_id)
-    if file_owner != user_id:
+    # Verify the file exists and is owned by the user in one query
+    file_details = File.get_owned(file_id, user_id)
+    if not file_details:
         flash('Unauthorized access', 'error')
         return redirect(url_for('file.dashboard'))
     
-    # Check if file exists
-    if not File.file_exists(file_id):
-        flash('File not found', 'error')
-        return redirect(url_for('file.dashboard'))
-    
     # Generate share link
     share_link = ShareLink(file_id=file_id)
     if share_link.create(Config.DEFAULT_SHARE_EXPIRY_HOURS):
+        ChangeLog.record(user_id, 'share', share_link.id, 'created', file_id, file_details['file_name'])
         share_url = url_for('share.access_shared_file', token=share_link.token, _external=True)
         flash(f'Share link generated! Link expires in {Config.DEFAULT_SHARE_EXPIRY_HOURS} hours.', 'success')
         return render_template('share.html', share_url=share_url, expiry_date=share_link.expiry_date)
@@ -35,47 +37,64 @@ def generate_share(file_id):
         return redirect(url_for('file.dashboard'))
 
 @share_bp.route('/share/<token>')
+@rate_limiter.limit('share-ip', Config.SHARE_RATE_LIMIT_PER_IP, by_ip)
+@rate_limiter.limit('share-token', Config.SHARE_RATE_LIMIT_PER_TOKEN, by_view_arg('token'))
 def access_shared_file(token):
     # Validate token
-    file_info = ShareLink.get_file_info(token)
-    
+    return render_shared_file(ShareLink.get_file_info(token), token)
+
+def render_shared_file(file_info, token):
+    """Share page for a row from ShareLink.get_file_info (None if invalid or expired)"""
     if not file_info:
         flash('Invalid or expired share link', 'error')
         return render_template('error.html', message='The share link you accessed is invalid or has expired.')
     
-    # Check if it's a local file or S3 file
-    if file_info['s3_key'].startswith('local/'):
-        # Local file download
-        local_filename = file_info['s3_key'].replace('local/', '')
-        download_url = f"/static/uploads/{local_filename}"
-        return render_template('share.html', 
-                             file_info=file_info, 
-                             download_url=download_url,
-                             is_shared_access=True)
-    else:
-        # S3 file download
-        try:
-            s3_result = s3_service.generate_presigned_url(file_info['s3_key'])
-            
-            if s3_result['success']:
-                download_url = s3_result['url']
-                return render_template('share.html', 
-                                     file_info=file_info, 
-                                     download_url=download_url,
-                                     is_shared_access=True)
-            else:
-                flash('Failed to generate download link', 'error')
-                return render_template('error.html', message='Unable to generate download link for this file.')
-        except Exception as e:
+    record_share_access(file_info['share_link_id'], request.remote_addr, request.headers.get('User-Agent'))
+    # Live notice only: visits are not mutations, so they stay out of the sync journal
+    event_bus.notify(file_info['user_id'], 'share_accessed',
+                     {'share_link_id': file_info['share_link_id'], 'file_id': file_info['id'],
+                      'name': file_info['file_name']})
+    try:
+        retry_after = ensure_available(file_info)
+        if retry_after is not None:
+            return restoring_response(retry_after)
+        
+        decoded_url = url_for('share.download_shared_decoded', token=token)
+        result = presign_download(file_info, decoded_url, Config.PRESIGNED_URL_EXPIRY)
+        
+        if result['success']:
+            return render_template('share.html', 
+                                 file_info=file_info, 
+                                 download_url=result['url'],
+                                 is_shared_access=True)
+        else:
             flash('Failed to generate download link', 'error')
             return render_template('error.html', message='Unable to generate download link for this file.')
+    except Exception as e:
+        flash('Failed to generate download link', 'error')
+        return render_template('error.html', message='Unable to generate download link for this file.')
+
+@share_bp.route('/share/<token>/download')
+@rate_limiter.limit('share-ip', Config.SHARE_RATE_LIMIT_PER_IP, by_ip)
+@rate_limiter.limit('share-token', Config.SHARE_RATE_LIMIT_PER_TOKEN, by_view_arg('token'))
+def download_shared_decoded(token):
+    """Serve a shared compressed file decompressed, for clients that cannot decode it themselves"""
+    file_info = ShareLink.get_file_info(token)
+    retry_after = ensure_available(file_info) if file_info else None
+    if retry_after is not None:
+        return restoring_response(retry_after)
+    response = decoded_response(file_info) if file_info else None
+    if response is None:
+        return render_template('error.html', message='The share link you accessed is invalid or has expired.'), 404
+    return response
+
+def restoring_response(retry_after):
+    """Error page telling a share visitor to come back once an archived file is restored"""
+    return (render_template('error.html', message=restoring_message(retry_after)), 503,
+            {'Retry-After': str(retry_after)})
 
 @share_bp.route('/share')
 @login_required
 def share_page():
     # This can be used to display all shared links for the user
     return render_template('share.html')
-
-# Helper function to clean expired links
-def cleanup_expired_links():
-    ShareLink.delete_expired()
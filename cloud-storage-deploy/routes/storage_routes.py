@@ -0,0 +1,31 @@
+from flask import Blueprint, request, send_file, abort
+from utils.storage import get_backend
+import os
+
+storage_bp = Blueprint('storage', __name__)
+
+@storage_bp.route('/blob/<path:key>')
+def serve_blob(key):
+    """Serve a local-storage object through a URL signed by LocalBackend.presign"""
+    backend = get_backend('local')
+    download_name = request.args.get('name')
+    content_encoding = request.args.get('enc')
+    if not backend.verify(key, request.args.get('expires'), download_name, request.args.get('sig'), content_encoding):
+        abort(403)
+    
+    try:
+        path = backend.locate(key)
+    except ValueError:
+        abort(404)
+    if not os.path.isfile(path):
+        abort(404)
+    
+    # conditional=True answers Range and If-None-Match requests
+    response = send_file(path,
+                         as_attachment=bool(download_name),
+                         download_name=download_name or os.path.basename(path),
+                         conditional=True)
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+        response.mimetype = 'application/octet-stream'
+    return response
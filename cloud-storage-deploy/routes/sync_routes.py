@@ -0,0 +1,118 @@
+from flask import Blueprint, Response, request, session, jsonify, stream_with_context
+from models.change_model import ChangeLog
+from routes.auth_routes import login_required
+from utils.change_feed import event_bus, compact
+from config import Config
+import json
+import time
+
+sync_bp = Blueprint('sync', __name__)
+
+def cursor_expired(cursor):
+    """True if journal rows after ``cursor`` may already have been pruned"""
+    oldest = ChangeLog.oldest_retained()
+    return oldest is not None and cursor < oldest - 1
+
+@sync_bp.route('/api/changes')
+@login_required
+def changes_api():
+    """Changes to the user's files and folders after a cursor.
+
+    Without ``since`` only the current cursor is returned: clients list
+    their tree once, then sync from that cursor. ``wait`` (seconds, capped
+    at CHANGES_LONG_POLL_TIMEOUT) holds the request open until something
+    changes. A cursor older than the retained journal gets 410, and the
+    client must list everything again.
+    """
+    user_id = session['user_id']
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({'cursor': ChangeLog.latest_cursor(user_id, Config.CHANGES_SETTLE_SECONDS),
+                        'changes': [], 'has_more': False})
+    if cursor_expired(since):
+        return jsonify({'error': 'Cursor has expired', 'reset': True}), 410
+
+    limit = Config.CHANGES_PAGE_SIZE
+    wait = max(0, min(request.args.get('wait', 0, type=int), Config.CHANGES_LONG_POLL_TIMEOUT))
+    # Over the connection limits the request simply does not wait
+    subscription = event_bus.subscribe(user_id) if wait else None
+    try:
+        deadline = time.monotonic() + wait
+        while True:
+            rows = ChangeLog.get_since(user_id, since, limit + 1, Config.CHANGES_SETTLE_SECONDS)
+            remaining = deadline - time.monotonic()
+            if rows or remaining <= 0 or subscription is None:
+                break
+            subscription.wait(min(remaining, Config.CHANGES_POLL_INTERVAL))
+    finally:
+        if subscription is not None:
+            subscription.close()
+
+    page = rows[:limit]
+    return jsonify({
+        'cursor': page[-1]['id'] if page else since,
+        'changes': compact(page),
+        'has_more': len(rows) > limit
+    })
+
+@sync_bp.route('/api/events')
+@login_required
+def events_stream():
+    """Server-Sent Events stream of the user's changes.
+
+    Each ``changes`` event carries the compacted deltas of a journal page,
+    with the page's last cursor as its event id, so a reconnecting browser
+    resumes from ``Last-Event-ID``. The first connection passes ``since``
+    (the cursor the page was rendered at). A cursor older than the retained
+    journal gets a ``reset`` event instead. Notices from the event bus
+    (``share_accessed``) are sent as their own events, without an id. Idle
+    streams send heartbeat comments, and every stream ends after
+    EVENT_STREAM_MAX_DURATION.
+    """
+    user_id = session['user_id']
+    cursor = request.headers.get('Last-Event-ID', type=int)
+    if cursor is None:
+        cursor = request.args.get('since', type=int)
+
+    subscription = event_bus.subscribe(user_id)
+    if subscription is None:
+        return Response('Too many open event streams', status=503, mimetype='text/plain',
+                        headers={'Retry-After': str(Config.EVENT_STREAM_RETRY_MS // 1000 or 1)})
+
+    def generate(cursor):
+        try:
+            yield f"retry: {Config.EVENT_STREAM_RETRY_MS}\n\n"
+            if cursor is None or cursor_expired(cursor):
+                if cursor is not None:
+                    yield "event: reset\ndata: {}\n\n"
+                cursor = ChangeLog.latest_cursor(user_id, Config.CHANGES_SETTLE_SECONDS)
+
+            deadline = time.monotonic() + Config.EVENT_STREAM_MAX_DURATION
+            last_sent = time.monotonic()
+            while time.monotonic() < deadline:
+                rows = ChangeLog.get_since(user_id, cursor, Config.CHANGES_PAGE_SIZE, Config.CHANGES_SETTLE_SECONDS)
+                if rows:
+                    cursor = rows[-1]['id']
+                    yield f"id: {cursor}\nevent: changes\ndata: {json.dumps({'changes': compact(rows)})}\n\n"
+                    last_sent = time.monotonic()
+                    if len(rows) == Config.CHANGES_PAGE_SIZE:
+                        continue
+                notices = subscription.notices()
+                for name, data in notices:
+                    yield f"event: {name}\ndata: {json.dumps(data)}\n\n"
+                if notices:
+                    last_sent = time.monotonic()
+                elif time.monotonic() - last_sent >= Config.EVENT_STREAM_HEARTBEAT:
+                    yield ": heartbeat\n\n"
+                    last_sent = time.monotonic()
+                subscription.wait(min(Config.CHANGES_POLL_INTERVAL, Config.EVENT_STREAM_HEARTBEAT))
+        finally:
+            subscription.close()
+
+    response = Response(stream_with_context(generate(cursor)), mimetype='text/event-stream')
+    # Also release the slot if the client goes away before the stream starts
+    response.call_on_close(subscription.close)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop proxies (nginx) from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,78 @@
+from flask import Blueprint, redirect, url_for, flash, session, jsonify
+from models.file_model import File
+from models.version_model import FileVersion
+from routes.auth_routes import login_required
+from utils.upload_service import restore_version
+from utils.versioning import version_response
+from utils.job_queue import job_queue, PRIORITY_LOW
+import logging
+
+logger = logging.getLogger(__name__)
+
+version_bp = Blueprint('version', __name__)
+
+@version_bp.route('/api/files/<int:file_id>/versions')
+@login_required
+def list_versions(file_id):
+    """The current version of a file and its stored older versions, newest first"""
+    file_details = File.get_owned(file_id, session['user_id'])
+    if not file_details:
+        return jsonify({'error': 'File not found'}), 404
+
+    versions = [{
+        'version': row['version'],
+        'file_name': row['file_name'],
+        'file_size': row['file_size'],
+        'replaced_at': row['replaced_at'].isoformat() if row['replaced_at'] else None,
+        'download_url': url_for('version.download_version', file_id=file_id, version=row['version']),
+        'restore_url': url_for('version.restore_file_version', file_id=file_id, version=row['version'])
+    } for row in FileVersion.get_by_file(file_id)]
+    return jsonify({
+        'file_id': file_id,
+        'current': {
+            'version': file_details.get('version') or 1,
+            'file_name': file_details['file_name'],
+            'file_size': file_details['file_size']
+        },
+        'versions': versions
+    })
+
+@version_bp.route('/download/<int:file_id>/versions/<int:version>')
+@login_required
+def download_version(file_id, version):
+    """Stream an older version of a file, reassembled from the chunk store"""
+    version_row = None
+    if File.get_owned(file_id, session['user_id']):
+        version_row = FileVersion.get(file_id, version)
+    if not version_row:
+        flash('Version not found', 'error')
+        return redirect(url_for('file.dashboard'))
+
+    response = version_response(version_row)
+    if response is None:
+        flash('Version not found', 'error')
+        return redirect(url_for('file.dashboard'))
+    return response
+
+@version_bp.route('/api/files/<int:file_id>/versions/<int:version>/restore', methods=['POST'])
+@login_required
+def restore_file_version(file_id, version):
+    """Make an older version current again; the content it replaces is kept as a version"""
+    user_id = session['user_id']
+    file_details = File.get_owned(file_id, user_id)
+    version_row = FileVersion.get(file_id, version) if file_details else None
+    if not version_row:
+        return jsonify({'error': 'Version not found'}), 404
+
+    try:
+        restored = restore_version(file_details, version_row)
+    except Exception as e:
+        logger.error("Restoring file %s version %s failed: %s", file_id, version, e)
+        restored = None
+    if restored is None:
+        return jsonify({'error': 'Failed to restore version'}), 409
+
+    job_queue.enqueue('reconcile_storage', {'user_id': user_id}, priority=PRIORITY_LOW,
+                      delay=30, dedupe_key=f"reconcile:{user_id}")
+    return jsonify({'file_id': file_id, 'version': (file_details.get('version') or 1) + 1,
+                    'restored_from': version})
@@ -4,6 +4,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Initialize theme
     initializeTheme();
     
+    // Apply changes made elsewhere (other tabs, background uploads, share visits) as they happen
+    initializeLiveUpdates();
+    
     // Initialize tooltips
     var tooltipTriggerList = [].slice.call(document.querySelectorAll('[data-bs-toggle="tooltip"]'));
     var tooltipList = tooltipTriggerList.map(function (tooltipTriggerEl) {
@@ -108,10 +111,11 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function validateFile(file) {
-        // Check file size (16MB limit)
-        const maxSize = 16 * 1024 * 1024; // 16MB in bytes
+        // Check file size (the upload form states the limit for its mode)
+        const uploadForm = document.getElementById('uploadForm');
+        const maxSize = (uploadForm && parseInt(uploadForm.dataset.maxSize, 10)) || 16 * 1024 * 1024;
         if (file.size > maxSize) {
-            showNotification('File size exceeds 16MB limit. Please choose a smaller file.', 'error');
+            showNotification(`File size exceeds the ${formatFileSize(maxSize)} limit. Please choose a smaller file.`, 'error');
             return false;
         }
 
@@ -127,8 +131,8 @@ document.addEventListener('DOMContentLoaded', function() {
         return true;
     }
 
-    // Progress bar simulation
-    function simulateUploadProgress() {
+    // Upload progress: request transfer first, then server-side processing
+    function showUploadProgress(percent, status) {
         const progressDiv = document.getElementById('uploadProgress');
         const progressBar = document.getElementById('progressBar');
         const progressText = document.getElementById('progressText');
@@ -136,21 +140,244 @@ document.addEventListener('DOMContentLoaded', function() {
         
         if (progressDiv && progressBar && progressText) {
             progressDiv.classList.remove('d-none');
-            let progress = 0;
-            
-            const interval = setInterval(() => {
-                progress += Math.random() * 15;
-                if (progress > 90) {
-                    progress = 90;
-                    clearInterval(interval);
-                    uploadStatus.textContent = 'Finalizing upload...';
-                } else {
-                    uploadStatus.textContent = `Uploading... ${Math.round(progress)}%`;
+            progressBar.style.width = percent + '%';
+            progressText.textContent = Math.round(percent) + '%';
+            if (uploadStatus) {
+                uploadStatus.textContent = status;
+            }
+        }
+    }
+    
+    function renderFileStates(files) {
+        const fileProgressList = document.getElementById('fileProgressList');
+        if (!fileProgressList) return;
+        
+        const stateClass = {
+            'queued': 'bg-secondary',
+            'processing': 'progress-bar-striped progress-bar-animated',
+            'done': 'bg-success',
+            'failed': 'bg-danger'
+        };
+        fileProgressList.innerHTML = files.map(file => `
+            <div class="mb-2">
+                <small class="text-muted">${file.file_name}</small>
+                <div class="progress" style="height: 20px;">
+                    <div class="progress-bar ${stateClass[file.status] || ''}" role="progressbar" style="width: 100%">
+                        ${file.status === 'failed' ? (file.error || 'failed') : file.status}
+                    </div>
+                </div>
+            </div>
+        `).join('');
+    }
+    
+    function pollUploadStatus(statusUrl, onFinished) {
+        fetch(statusUrl)
+            .then(response => response.json())
+            .then(data => {
+                if (data.error) {
+                    throw new Error(data.error);
                 }
+                renderFileStates(data.files);
+                const finished = data.done + data.failed;
+                const percent = 50 + (data.total ? (finished / data.total) * 50 : 50);
+                showUploadProgress(percent, `Storing files... ${finished} of ${data.total} processed`);
                 
-                progressBar.style.width = progress + '%';
-                progressText.textContent = Math.round(progress) + '%';
-            }, 200);
+                if (data.complete) {
+                    onFinished(data);
+                } else {
+                    setTimeout(() => pollUploadStatus(statusUrl, onFinished), 1000);
+                }
+            })
+            .catch(error => {
+                console.error('Error checking upload status:', error);
+                setTimeout(() => pollUploadStatus(statusUrl, onFinished), 3000);
+            });
+    }
+    
+    // Send the form in async mode and follow the batch until every file is stored
+    function submitUploadAsync(form, onDone) {
+        const formData = new FormData(form);
+        formData.append('async', '1');
+        
+        const xhr = new XMLHttpRequest();
+        xhr.open('POST', form.action || window.location.href);
+        xhr.responseType = 'json';
+        
+        xhr.upload.addEventListener('progress', function(e) {
+            if (e.lengthComputable) {
+                const percent = (e.loaded / e.total) * 50;
+                showUploadProgress(percent, `Uploading... ${Math.round(percent * 2)}%`);
+            }
+        });
+        
+        xhr.addEventListener('load', function() {
+            const data = xhr.response || {};
+            if (xhr.status !== 202 || !data.status_url) {
+                showNotification(data.error || 'Upload failed', 'danger');
+                onDone();
+                return;
+            }
+            showUploadProgress(50, 'Upload received, storing files...');
+            pollUploadStatus(data.status_url, function(result) {
+                showUploadProgress(100, `${result.done} stored, ${result.failed} failed`);
+                if (result.failed > 0) {
+                    showNotification(`${result.failed} files failed to upload`, 'danger');
+                    onDone();
+                } else {
+                    window.location.href = result.redirect_url;
+                }
+            });
+        });
+        
+        xhr.addEventListener('error', function() {
+            showNotification('Upload failed. Please check your connection.', 'danger');
+            onDone();
+        });
+        
+        xhr.send(formData);
+    }
+    
+    function postJson(url, payload) {
+        return fetch(url, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(payload)
+        }).then(response => response.json().then(data => {
+            if (!response.ok) {
+                throw new Error(data.error || `Request failed (HTTP ${response.status})`);
+            }
+            return data;
+        }));
+    }
+    
+    // XHR rather than fetch, as only XHR reports upload progress
+    function sendWithProgress(method, url, body, onProgress) {
+        return new Promise((resolve, reject) => {
+            const xhr = new XMLHttpRequest();
+            xhr.open(method, url);
+            xhr.upload.addEventListener('progress', function(e) {
+                if (e.lengthComputable) {
+                    onProgress(e.loaded);
+                }
+            });
+            xhr.addEventListener('load', function() {
+                if (xhr.status >= 200 && xhr.status < 300) {
+                    resolve(xhr);
+                } else {
+                    reject(new Error(`Storage rejected the upload (HTTP ${xhr.status})`));
+                }
+            });
+            xhr.addEventListener('error', () => reject(new Error('Network error during upload')));
+            xhr.send(body);
+        });
+    }
+    
+    // Send multipart parts straight to the bucket, a few at a time, fetching
+    // presigned part URLs from the server in batches of 100 as they are needed
+    async function uploadParts(file, upload, onProgress) {
+        const loaded = new Array(upload.part_count).fill(0);
+        const batches = {};
+        let next = 1;
+        
+        function urlFor(number) {
+            const batch = Math.floor((number - 1) / 100);
+            if (!batches[batch]) {
+                const numbers = [];
+                for (let n = batch * 100 + 1; n <= Math.min((batch + 1) * 100, upload.part_count); n++) {
+                    numbers.push(n);
+                }
+                batches[batch] = postJson(upload.parts_url, {part_numbers: numbers}).then(data => data.urls);
+            }
+            return batches[batch].then(urls => urls[number]);
+        }
+        
+        async function worker() {
+            while (next <= upload.part_count) {
+                const number = next++;
+                const part = file.slice((number - 1) * upload.part_size, number * upload.part_size);
+                const url = await urlFor(number);
+                for (let attempt = 1; ; attempt++) {
+                    try {
+                        await sendWithProgress('PUT', url, part, bytes => {
+                            loaded[number - 1] = bytes;
+                            onProgress(loaded.reduce((sum, value) => sum + value, 0));
+                        });
+                        break;
+                    } catch (error) {
+                        loaded[number - 1] = 0;
+                        if (attempt >= 3) {
+                            throw error;
+                        }
+                    }
+                }
+            }
+        }
+        
+        const workers = [];
+        for (let i = 0; i < Math.min(upload.concurrency, upload.part_count); i++) {
+            workers.push(worker());
+        }
+        await Promise.all(workers);
+    }
+    
+    async function directUploadFile(file, folderId, onProgress) {
+        const upload = await postJson('/api/direct-uploads', {
+            file_name: file.name,
+            file_size: file.size,
+            content_type: file.type || 'application/octet-stream',
+            folder_id: folderId ? parseInt(folderId, 10) : null
+        });
+        try {
+            if (upload.method === 'post') {
+                const body = new FormData();
+                Object.entries(upload.fields).forEach(([name, value]) => body.append(name, value));
+                body.append('file', file);  // S3 requires the file to be the last field
+                await sendWithProgress('POST', upload.url, body, bytes => onProgress(Math.min(bytes, file.size)));
+            } else {
+                await uploadParts(file, upload, onProgress);
+            }
+            return await postJson(upload.complete_url, {});
+        } catch (error) {
+            fetch(upload.abort_url, {method: 'DELETE'}).catch(() => {});
+            throw error;
+        }
+    }
+    
+    // Direct mode: the server only signs requests; file bytes go straight to the bucket
+    async function submitDirectUploads(form, onDone) {
+        const files = Array.from(form.querySelector('input[type="file"]').files).filter(validateFile);
+        const folderId = form.querySelector('input[name="folder_id"]').value;
+        const totalBytes = files.reduce((sum, file) => sum + file.size, 0) || 1;
+        const states = files.map(file => ({file_name: file.name, status: 'queued'}));
+        let finishedBytes = 0;
+        let failed = 0;
+        let redirectUrl = null;
+        
+        for (let i = 0; i < files.length; i++) {
+            states[i].status = 'processing';
+            renderFileStates(states);
+            try {
+                const result = await directUploadFile(files[i], folderId, bytes => {
+                    const percent = ((finishedBytes + bytes) / totalBytes) * 100;
+                    showUploadProgress(percent, `Uploading ${files[i].name}... ${Math.round(percent)}%`);
+                });
+                states[i].status = 'done';
+                redirectUrl = result.redirect_url;
+            } catch (error) {
+                states[i].status = 'failed';
+                states[i].error = error.message;
+                failed++;
+            }
+            finishedBytes += files[i].size;
+            renderFileStates(states);
+        }
+        
+        showUploadProgress(100, `${files.length - failed} stored, ${failed} failed`);
+        if (failed > 0 || !redirectUrl) {
+            showNotification(`${failed} files failed to upload`, 'danger');
+            onDone();
+        } else {
+            window.location.href = redirectUrl;
         }
     }
 
@@ -343,19 +570,11 @@ document.addEventListener('DOMContentLoaded', function() {
                 submitButton.innerHTML = '<span class="spinner-border spinner-border-sm me-2"></span>Uploading...';
                 submitButton.disabled = true;
                 
-                // Start progress simulation
-                simulateUploadProgress();
-                
-                // Submit form after a short delay
-                setTimeout(() => {
-                    form.submit();
-                }, 500);
-                
-                // Re-enable after 10 seconds (fallback)
-                setTimeout(() => {
+                const submit = form.dataset.directUploads === '1' ? submitDirectUploads : submitUploadAsync;
+                submit(form, () => {
                     submitButton.innerHTML = originalText;
                     submitButton.disabled = false;
-                }, 10000);
+                });
             } else if (submitButton) {
                 const originalText = submitButton.innerHTML;
                 submitButton.innerHTML = '<span class="spinner-border spinner-border-sm me-2"></span>Loading...';
@@ -373,12 +592,154 @@ document.addEventListener('DOMContentLoaded', function() {
     function validateSelectedFile() {
         const fileInput = document.getElementById('file');
         if (fileInput && fileInput.files.length > 0) {
-            return validateFile(fileInput.files[0]);
+            return Array.from(fileInput.files).some(file => validateFile(file));
         }
         return false;
     }
 });
 
+// Live Dashboard Updates
+function initializeLiveUpdates() {
+    const live = document.getElementById('dashboardLive');
+    if (!live || !window.EventSource) {
+        return;
+    }
+    // '' is the root folder; parent ids from the server are null there
+    const folderId = live.dataset.folderId === '' ? null : parseInt(live.dataset.folderId, 10);
+    const params = live.dataset.since === '' ? '' : `?since=${live.dataset.since}`;
+    const source = new EventSource(live.dataset.eventsUrl + params);
+    
+    source.addEventListener('changes', function(e) {
+        const data = JSON.parse(e.data);
+        data.changes.forEach(change => applyChange(change, folderId));
+    });
+    source.addEventListener('share_accessed', function(e) {
+        const data = JSON.parse(e.data);
+        showNotification(`Your shared file "${escapeHtml(data.name)}" was just opened`, 'info');
+    });
+    // The cursor was older than the retained journal: the listing may be stale
+    source.addEventListener('reset', function() {
+        source.close();
+        window.location.reload();
+    });
+}
+
+function applyChange(change, folderId) {
+    const here = change.action !== 'deleted' && change.parent_id === folderId;
+    if (change.entity === 'file') {
+        const row = document.querySelector(`#fileTableBody tr[data-file-id="${change.entity_id}"]`);
+        if (row && !here) {
+            row.remove();
+        } else if (here) {
+            if (row) {
+                row.querySelector('.file-name').textContent = change.name;
+                if (change.size !== null) {
+                    row.querySelector('.file-size').textContent = change.size;
+                }
+            } else if (!insertFileRow(change)) {
+                // No table on the page yet (empty folder): render it server-side
+                window.location.reload();
+                return;
+            }
+        }
+        updateFileCount();
+    } else if (change.entity === 'folder') {
+        if (change.entity_id === folderId && change.action === 'deleted') {
+            window.location.href = '/dashboard';
+            return;
+        }
+        const card = document.querySelector(`#folderGrid [data-folder-id="${change.entity_id}"]`);
+        if (card && !here) {
+            card.remove();
+        } else if (here && !card && !insertFolderCard(change)) {
+            window.location.reload();
+        }
+    }
+}
+
+function insertFileRow(change) {
+    const tbody = document.getElementById('fileTableBody');
+    if (!tbody) {
+        return false;
+    }
+    const id = change.entity_id;
+    const now = new Date();
+    const pad = n => String(n).padStart(2, '0');
+    const date = change.action === 'created'
+        ? `${now.getFullYear()}-${pad(now.getMonth() + 1)}-${pad(now.getDate())} ${pad(now.getHours())}:${pad(now.getMinutes())}`
+        : '';
+    const row = document.createElement('tr');
+    row.dataset.fileId = id;
+    row.innerHTML = `
+        <td>
+            <i class="bi-file-earmark text-muted" style="font-size: 1.2rem;"></i>
+            <span class="file-name"></span>
+        </td>
+        <td><span class="file-size">${change.size || 0}</span></td>
+        <td><span class="file-date">${date}</span></td>
+        <td>
+            <div class="btn-group" role="group">
+                <button class="btn btn-sm btn-outline-info" onclick="previewFile(${id})" title="Preview">
+                    <i class="bi bi-eye"></i>
+                </button>
+                <a href="/download/${id}" class="btn btn-sm btn-outline-primary" title="Download">
+                    <i class="bi bi-download"></i>
+                </a>
+                <button class="btn btn-sm btn-outline-secondary move-button" title="Move to folder">
+                    <i class="bi bi-folder-symlink"></i>
+                </button>
+                <a href="/generate-share/${id}" class="btn btn-sm btn-outline-info" title="Share">
+                    <i class="bi bi-share"></i>
+                </a>
+                <a href="/delete/${id}" class="btn btn-sm btn-outline-danger" title="Delete"
+                   onclick="return confirm('Move this file to the trash?')">
+                    <i class="bi bi-trash"></i>
+                </a>
+            </div>
+        </td>
+    `;
+    row.querySelector('.file-name').textContent = change.name;
+    row.querySelector('.move-button').addEventListener('click', () => showMoveModal(id, change.name));
+    tbody.prepend(row);
+    return true;
+}
+
+function insertFolderCard(change) {
+    const grid = document.getElementById('folderGrid');
+    if (!grid) {
+        return false;
+    }
+    const column = document.createElement('div');
+    column.className = 'col-md-3 col-sm-6 mb-3';
+    column.dataset.folderId = change.entity_id;
+    column.innerHTML = `
+        <div class="card h-100 folder-card" style="cursor: pointer;">
+            <div class="card-body text-center">
+                <i class="bi bi-folder-fill text-warning" style="font-size: 2.5rem;"></i>
+                <h6 class="card-title mt-2"></h6>
+                <small class="text-muted">Just now</small>
+            </div>
+        </div>
+    `;
+    column.querySelector('.card-title').textContent = change.name;
+    column.querySelector('.folder-card').addEventListener('click', () => navigateToFolder(change.entity_id));
+    grid.appendChild(column);
+    return true;
+}
+
+function updateFileCount() {
+    const total = document.getElementById('totalFiles');
+    if (total) {
+        total.textContent = document.querySelectorAll('#fileTableBody tr[data-file-id]').length;
+    }
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text || '';
+    return div.innerHTML;
+}
+
 // Theme Management
 function initializeTheme() {
     // Check for saved theme preference or system preference
@@ -0,0 +1,98 @@
+import datetime
+import time
+from config import Config
+from models.analytics_model import AnalyticsPartitions, UserAnalytics, FileAnalytics, ShareAnalytics, add_months
+from utils.instrumentation import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Models of the raw, append-only analytics tables
+RAW_MODELS = (UserAnalytics, FileAnalytics, ShareAnalytics)
+
+PARTITION_CHANGES = metrics.counter('analytics_partitions_total',
+                                    'Monthly analytics partitions changed by maintenance', ('table', 'action'))
+ROLLUPS_PRUNED = metrics.counter('analytics_rollup_rows_pruned_total',
+                                 'Daily analytics totals deleted past ANALYTICS_ROLLUP_RETENTION_MONTHS', ('table',))
+
+def _months(first, last):
+    """Month starts from ``first`` through ``last``"""
+    month = first
+    while month <= last:
+        yield month
+        month = add_months(month, 1)
+
+def maintain_analytics(time_budget=None):
+    """Partition, compact and expire the raw analytics tables.
+
+    Each table is partitioned by month on its first run, and months up to
+    ANALYTICS_PARTITIONS_AHEAD ahead are kept ready. Months older than
+    ANALYTICS_RAW_MONTHS are folded into the daily rollup table one day at
+    a time and then dropped whole. Reports only read a month's rollups once
+    its partition is gone (``analytics_compaction``), so a run that stops in
+    between never counts it twice. Rollups older than
+    ANALYTICS_ROLLUP_RETENTION_MONTHS are deleted. Returns True if
+    ``time_budget`` seconds ran out before every table was done.
+    """
+    if not AnalyticsPartitions.lock():
+        logger.info("Analytics maintenance is already running in another worker")
+        return False
+    try:
+        return _maintain(time.monotonic() + time_budget if time_budget else None)
+    finally:
+        AnalyticsPartitions.unlock()
+
+def _maintain(deadline):
+    this_month = datetime.date.today().replace(day=1)
+    newest = add_months(this_month, Config.ANALYTICS_PARTITIONS_AHEAD)
+    raw_cutoff = add_months(this_month, -Config.ANALYTICS_RAW_MONTHS)
+    rollup_cutoff = None
+    if Config.ANALYTICS_ROLLUP_RETENTION_MONTHS:
+        rollup_cutoff = add_months(this_month, -Config.ANALYTICS_ROLLUP_RETENTION_MONTHS)
+
+    for model in RAW_MODELS:
+        table = model.TABLE
+        months = AnalyticsPartitions.get_months(table)
+        if months is None:
+            oldest = AnalyticsPartitions.get_oldest(table, model.TIME_COLUMN)
+            first = min(oldest.date().replace(day=1), this_month) if oldest else this_month
+            months = list(_months(first, newest))
+            if not AnalyticsPartitions.partition(table, model.TIME_COLUMN, months):
+                raise RuntimeError(f"Failed to partition {table}")
+            PARTITION_CHANGES.inc(len(months), table=table, action='created')
+            logger.info("Partitioned %s into %d monthly partitions", table, len(months))
+        else:
+            missing = list(_months(add_months(months[-1], 1) if months else this_month, newest))
+            if not AnalyticsPartitions.extend(table, missing):
+                raise RuntimeError(f"Failed to add partitions to {table}")
+            PARTITION_CHANGES.inc(len(missing), table=table, action='created')
+            months += missing
+
+        if not AnalyticsPartitions.set_raw_since(table, months[0]):
+            raise RuntimeError(f"Failed to record the oldest raw month of {table}")
+        for month in months:
+            if month >= raw_cutoff:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                return True
+            # Months already past rollup retention are dropped without being totalled
+            if rollup_cutoff is None or month >= rollup_cutoff:
+                day = month
+                while day < add_months(month, 1):
+                    if not model.compact_day(day):
+                        raise RuntimeError(f"Failed to compact {table} for {day}")
+                    day += datetime.timedelta(days=1)
+                PARTITION_CHANGES.inc(table=table, action='compacted')
+            if not AnalyticsPartitions.drop_month(table, month):
+                raise RuntimeError(f"Failed to drop {table} partition for {month:%Y-%m}")
+            # Until this lands the month's rollups stay hidden; the next run records it again
+            if not AnalyticsPartitions.set_raw_since(table, add_months(month, 1)):
+                raise RuntimeError(f"Failed to record the oldest raw month of {table}")
+            PARTITION_CHANGES.inc(table=table, action='dropped')
+            logger.info("Compacted and dropped %s partition for %s", table, f"{month:%Y-%m}")
+
+        if rollup_cutoff is not None:
+            pruned = AnalyticsPartitions.prune_rollups(model.ROLLUP_TABLE, rollup_cutoff,
+                                                       Config.ANALYTICS_ROLLUP_PRUNE_BATCH_SIZE)
+            ROLLUPS_PRUNED.inc(pruned, table=model.ROLLUP_TABLE)
+    return False
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import mimetypes
+import os
+import uuid
+from flask import url_for
+from utils.compression import brotli, compress
+
+ASSET_DIRECTORIES = ('css', 'js')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+class AssetManifest:
+    """Content-hash fingerprinted copies of the static CSS and JS.
+
+    ``build`` copies every asset to ``<build_dir>/<name>.<hash><ext>`` along
+    with precompressed .gz (and .br when brotli is installed) variants, and
+    writes manifest.json mapping logical names to fingerprinted ones. A new
+    hash means a new URL, so fingerprinted files can be cached forever.
+    """
+
+    def __init__(self):
+        self.build_dir = None
+        self.entries = {}  # logical name -> fingerprinted name
+        self.files = {}    # fingerprinted name -> {'mimetype', 'variants': {encoding: path}}
+
+    def build(self, static_folder, build_dir, directories=ASSET_DIRECTORIES):
+        self.build_dir = os.path.abspath(build_dir)
+        entries, files = {}, {}
+        for directory in directories:
+            root = os.path.join(static_folder, directory)
+            for dirpath, _, filenames in os.walk(root):
+                for filename in sorted(filenames):
+                    source = os.path.join(dirpath, filename)
+                    logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+                    fingerprinted, info = self._build_one(source, logical)
+                    entries[logical] = fingerprinted
+                    files[fingerprinted] = info
+        self.entries, self.files = entries, files
+        self._write(os.path.join(self.build_dir, 'manifest.json'),
+                    json.dumps(entries, indent=2, sort_keys=True).encode('utf-8'))
+        return entries
+
+    def _build_one(self, source, logical):
+        with open(source, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(logical)
+        fingerprinted = f"{stem}.{digest}{ext}"
+        path = os.path.join(self.build_dir, fingerprinted)
+
+        variants = {None: path}
+        encodings = ['gzip'] + (['br'] if brotli is not None else [])
+        for encoding in encodings:
+            variant = path + ('.br' if encoding == 'br' else '.gz')
+            if not os.path.exists(variant):
+                encoded = compress(data, encoding, gzip_level=9, brotli_quality=11)
+                if len(encoded) >= len(data):
+                    continue
+                self._write(variant, encoded)
+            variants[encoding] = variant
+        if not os.path.exists(path):
+            self._write(path, data)
+
+        mimetype = mimetypes.guess_type(logical)[0] or 'application/octet-stream'
+        return fingerprinted, {'mimetype': mimetype, 'variants': variants}
+
+    @staticmethod
+    def _write(path, data):
+        # Several workers may build at once; rename so nobody reads a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def url(self, logical):
+        """URL for a static asset, fingerprinted when it is in the manifest"""
+        fingerprinted = self.entries.get(logical)
+        if fingerprinted is None:
+            return url_for('static', filename=logical)
+        return url_for('assets.asset', filename=fingerprinted)
+
+# Asset manifest instance
+asset_manifest = AssetManifest()
+
+def init_app(app):
+    """Build the manifest at startup and expose ``asset_url`` to templates"""
+    asset_manifest.build(app.static_folder, app.config.get('ASSET_BUILD_DIR', 'build/assets'))
+
+    @app.context_processor
+    def inject_asset_url():
+        return dict(asset_url=asset_manifest.url)
@@ -0,0 +1,310 @@
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from config import Config
+from utils.instrumentation import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_REQUESTS = metrics.counter('blob_cache_blocks_total', 'Block lookups by result', ('result',))
+CACHE_BYTES = metrics.counter('blob_cache_read_bytes_total', 'Bytes served by source', ('source',))
+CACHE_SIZE = metrics.gauge('blob_cache_size_bytes', 'Bytes of blocks held on disk')
+CACHE_EVICTIONS = metrics.counter('blob_cache_evictions_total', 'Blocks evicted to stay within the byte budget')
+
+class _Fill:
+    """A block download in progress that other readers can wait for"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+class BlockCache:
+    """Read-through disk cache of fixed-size blocks of stored objects.
+
+    Objects are cached block by block, so a range read only downloads the
+    blocks it is missing, with adjacent missing blocks merged into one
+    ranged GET. Readers wanting a block another thread is already fetching
+    wait for that download instead of starting their own.
+
+    Eviction is a segmented LRU. New blocks enter a probation segment and
+    move to a protected segment on their second hit, so one large scan
+    cannot flush blocks that are read repeatedly. The byte budget applies
+    per process; workers sharing a directory should split it. Object keys
+    are never reused, so cached blocks never go stale. Known object sizes
+    are kept in a bounded LRU of their own.
+    """
+
+    def __init__(self, root, max_bytes, block_size=1024 * 1024, protected_ratio=0.8, wait_timeout=60):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.protected_max = int(max_bytes * protected_ratio)
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._probation = OrderedDict()
+        self._protected = OrderedDict()
+        self._protected_bytes = 0
+        self._bytes = 0
+        self._sizes = OrderedDict()
+        # Enough sizes for every object that could have a block cached
+        self.max_sizes = max(1024, max_bytes // block_size)
+        self._inflight = {}
+        self._loaded = False
+
+    def _dir(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _load(self):
+        """Index blocks left on disk by a previous run, oldest first"""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            entries = []
+            for shard in os.scandir(self.root) if os.path.isdir(self.root) else ():
+                for key_dir in os.scandir(shard.path):
+                    key_file = os.path.join(key_dir.path, 'key')
+                    try:
+                        with open(key_file, encoding='utf-8') as f:
+                            key = f.read()
+                        for block in os.scandir(key_dir.path):
+                            if block.name.isdigit():
+                                stat = block.stat()
+                                entries.append((stat.st_mtime, key, int(block.name), stat.st_size))
+                    except OSError:
+                        continue
+            for _, key, index, size in sorted(entries):
+                self._probation[(key, index)] = size
+                self._bytes += size
+                if size < self.block_size:
+                    self._put_size(key, index * self.block_size + size)
+            CACHE_SIZE.set(self._bytes)
+        self._evict()
+
+    def _size_of(self, key):
+        with self._lock:
+            size = self._sizes.get(key)
+            if size is not None:
+                self._sizes.move_to_end(key)
+            return size
+
+    def _remember_size(self, key, size):
+        with self._lock:
+            self._put_size(key, size)
+
+    def _put_size(self, key, size):
+        # Caller holds the lock
+        self._sizes[key] = size
+        self._sizes.move_to_end(key)
+        while len(self._sizes) > self.max_sizes:
+            self._sizes.popitem(last=False)
+
+    def read(self, backend, key, start=0, end=None):
+        """Bytes ``start`` through ``end`` (inclusive, None for EOF) of ``key``, or None if missing.
+
+        ``backend`` supplies ``fetch_range(key, start, end)`` and ``head(key)``
+        for reading the origin.
+        """
+        if not self._loaded:
+            self._load()
+        size = self._size_of(key)
+        if end is None:
+            if size is None:
+                head = backend.head(key)
+                if head is None:
+                    return None
+                size = head['size']
+                self._remember_size(key, size)
+            end = size - 1
+        if size is not None:
+            end = min(end, size - 1)
+        if end < start:
+            return b''
+
+        first, last = start // self.block_size, end // self.block_size
+        blocks = self._blocks(backend, key, first, last)
+        if blocks is None:
+            return None
+        offset = start - first * self.block_size
+        return b''.join(blocks)[offset:offset + end - start + 1]
+
+    def _blocks(self, backend, key, first, last):
+        found, owned, waiting = {}, [], []
+        with self._lock:
+            for index in range(first, last + 1):
+                if (key, index) in self._probation or (key, index) in self._protected:
+                    found[index] = None  # read from disk below
+                elif (key, index) in self._inflight:
+                    waiting.append((index, self._inflight[(key, index)]))
+                else:
+                    fill = self._inflight[(key, index)] = _Fill()
+                    owned.append((index, fill))
+
+        try:
+            for run in _runs([index for index, _ in owned]):
+                data = self._fetch_run(backend, key, run)
+                if data is None:
+                    return None
+                found.update(data)
+        finally:
+            with self._lock:
+                for index, fill in owned:
+                    self._inflight.pop((key, index), None)
+                    fill.done.set()
+
+        for index, fill in waiting:
+            fill.done.wait(self.wait_timeout)
+            CACHE_REQUESTS.inc(result='coalesced')
+            found[index] = None
+
+        blocks = []
+        for index in range(first, last + 1):
+            block = found[index]
+            if block is None:
+                block = self._read_block(key, index)
+            if block is None:
+                # Evicted meanwhile, or the filling reader failed: fetch it directly
+                data = self._fetch_run(backend, key, [index])
+                if data is None:
+                    return None
+                block = data[index]
+            blocks.append(block)
+            if len(block) < self.block_size:
+                break
+        return blocks
+
+    def _fetch_run(self, backend, key, run):
+        """Download consecutive blocks with one ranged read and cache them"""
+        start = run[0] * self.block_size
+        data = backend.fetch_range(key, start, (run[-1] + 1) * self.block_size - 1)
+        if data is None:
+            head = None if start == 0 else backend.head(key)
+            if head is None:
+                return None
+            # The run lies past the end of the object
+            self._remember_size(key, head['size'])
+            return {index: b'' for index in run}
+        CACHE_REQUESTS.inc(len(run), result='miss')
+        CACHE_BYTES.inc(len(data), source='origin')
+
+        blocks = {}
+        for i, index in enumerate(run):
+            block = data[i * self.block_size:(i + 1) * self.block_size]
+            blocks[index] = block
+            if block or index == 0:
+                self._store(key, index, block)
+            if len(block) < self.block_size:
+                self._remember_size(key, index * self.block_size + len(block))
+                break
+        return blocks
+
+    def _read_block(self, key, index):
+        try:
+            with open(os.path.join(self._dir(key), str(index)), 'rb') as f:
+                block = f.read()
+        except FileNotFoundError:
+            self.discard(key, index)
+            return None
+        self._touch(key, index)
+        CACHE_REQUESTS.inc(result='hit')
+        CACHE_BYTES.inc(len(block), source='cache')
+        return block
+
+    def _store(self, key, index, block):
+        directory = self._dir(key)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            key_file = os.path.join(directory, 'key')
+            if not os.path.exists(key_file):
+                with open(key_file, 'w', encoding='utf-8') as f:
+                    f.write(key)
+            # Write then rename, so readers never see a partial block
+            temp_path = os.path.join(directory, f".{index}.{uuid.uuid4().hex}")
+            with open(temp_path, 'wb') as f:
+                f.write(block)
+            os.replace(temp_path, os.path.join(directory, str(index)))
+        except OSError as e:
+            logger.warning("Could not cache block %s of %s: %s", index, key, e)
+            return
+        with self._lock:
+            if (key, index) not in self._probation and (key, index) not in self._protected:
+                self._probation[(key, index)] = len(block)
+                self._bytes += len(block)
+                CACHE_SIZE.set(self._bytes)
+        self._evict()
+
+    def _touch(self, key, index):
+        """Record a hit: promote probation blocks and demote the protected overflow"""
+        entry = (key, index)
+        with self._lock:
+            if entry in self._protected:
+                self._protected.move_to_end(entry)
+                return
+            size = self._probation.pop(entry, None)
+            if size is None:
+                return
+            self._protected[entry] = size
+            self._protected_bytes += size
+            while self._protected_bytes > self.protected_max and len(self._protected) > 1:
+                demoted, demoted_size = self._protected.popitem(last=False)
+                self._protected_bytes -= demoted_size
+                self._probation[demoted] = demoted_size
+
+    def _evict(self):
+        victims = []
+        with self._lock:
+            while self._bytes > self.max_bytes and (self._probation or self._protected):
+                if self._probation:
+                    entry, size = self._probation.popitem(last=False)
+                else:
+                    entry, size = self._protected.popitem(last=False)
+                    self._protected_bytes -= size
+                self._bytes -= size
+                victims.append(entry)
+            CACHE_SIZE.set(self._bytes)
+        for key, index in victims:
+            CACHE_EVICTIONS.inc()
+            try:
+                os.remove(os.path.join(self._dir(key), str(index)))
+            except FileNotFoundError:
+                pass
+
+    def discard(self, key, index=None):
+        """Forget one block of ``key``, or all of them (e.g. after the object is deleted)"""
+        victims = []
+        with self._lock:
+            for segment in (self._probation, self._protected):
+                if index is None:
+                    entries = [e for e in segment if e[0] == key]
+                else:
+                    entries = [(key, index)] if (key, index) in segment else []
+                for entry in entries:
+                    size = segment.pop(entry)
+                    self._bytes -= size
+                    if segment is self._protected:
+                        self._protected_bytes -= size
+                    victims.append(entry)
+            if index is None:
+                self._sizes.pop(key, None)
+            CACHE_SIZE.set(self._bytes)
+        for entry_key, entry_index in victims:
+            try:
+                os.remove(os.path.join(self._dir(entry_key), str(entry_index)))
+            except FileNotFoundError:
+                pass
+
+def _runs(indexes):
+    """Split sorted block indexes into runs of consecutive numbers"""
+    runs = []
+    for index in indexes:
+        if runs and runs[-1][-1] == index - 1:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+    return runs
+
+# Blob cache instance
+blob_cache = BlockCache(Config.BLOB_CACHE_DIR, Config.BLOB_CACHE_MAX_BYTES, Config.BLOB_CACHE_BLOCK_SIZE)
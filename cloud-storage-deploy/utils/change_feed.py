@@ -0,0 +1,122 @@
+import collections
+import threading
+from config import Config
+
+# Notices a subscription keeps while its stream is busy; older ones are dropped
+NOTICE_BACKLOG = 20
+
+class Subscription:
+    """One waiter on a user's channel; ``wait`` returns early once something is published"""
+
+    def __init__(self, bus, user_id):
+        self.bus = bus
+        self.user_id = user_id
+        self._event = threading.Event()
+        self._notices = collections.deque(maxlen=NOTICE_BACKLOG)
+
+    def wait(self, timeout):
+        """Block up to ``timeout`` seconds; True if woken by a publish"""
+        fired = self._event.wait(timeout)
+        self._event.clear()
+        return fired
+
+    def notices(self):
+        """Take the (name, data) notices received since the last call"""
+        taken = []
+        while self._notices:
+            taken.append(self._notices.popleft())
+        return taken
+
+    def close(self):
+        self.bus._unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class EventBus:
+    """In-process pub/sub of "this user's journal grew" signals.
+
+    Publishers (``ChangeLog`` writes) signal a user's channel; subscribers
+    (event streams and long-polls) wake and read the journal from their own
+    cursor, so nothing is lost while they are busy and a publish landing
+    between a read and the next wait still wakes them. Only this process's
+    writes are signalled, so waiters also recheck the journal every
+    CHANGES_POLL_INTERVAL. Subscriptions are capped per process and per
+    user, since each one holds a worker thread.
+
+    ``notify`` carries events that are not journal mutations (a share link
+    being opened) straight to this process's open streams. They are not
+    stored, so they are best effort.
+    """
+
+    def __init__(self, max_subscribers=100, max_per_user=4):
+        self.max_subscribers = max_subscribers
+        self.max_per_user = max_per_user
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._count = 0
+
+    def subscribe(self, user_id):
+        """A new Subscription, or None when the connection limits are reached"""
+        with self._lock:
+            channel = self._channels.setdefault(user_id, set())
+            if self._count >= self.max_subscribers or len(channel) >= self.max_per_user:
+                if not channel:
+                    del self._channels[user_id]
+                return None
+            subscription = Subscription(self, user_id)
+            channel.add(subscription)
+            self._count += 1
+            return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            channel = self._channels.get(subscription.user_id)
+            if channel and subscription in channel:
+                channel.remove(subscription)
+                self._count -= 1
+                if not channel:
+                    del self._channels[subscription.user_id]
+
+    def publish(self, user_id):
+        with self._lock:
+            subscribers = list(self._channels.get(user_id, ()))
+        for subscription in subscribers:
+            subscription._event.set()
+
+    def notify(self, user_id, name, data):
+        """Hand an unjournaled event to the user's open subscriptions"""
+        with self._lock:
+            subscribers = list(self._channels.get(user_id, ()))
+        for subscription in subscribers:
+            subscription._notices.append((name, data))
+            subscription._event.set()
+
+    def subscriber_count(self):
+        with self._lock:
+            return self._count
+
+def compact(rows):
+    """Collapse journal rows to one delta per entity, in order of each entity's last change.
+
+    A 'created' followed by later changes stays 'created' with the latest
+    state, unless the entity was deleted, so clients never see an update
+    for something they have not been told exists.
+    """
+    latest = {}
+    for row in rows:
+        key = (row['entity'], row['entity_id'])
+        previous = latest.pop(key, None)
+        delta = {column: row[column] for column in ('entity', 'entity_id', 'action', 'parent_id', 'name', 'size')}
+        if previous and previous['action'] == 'created' and delta['action'] != 'deleted':
+            delta['action'] = 'created'
+            if delta['size'] is None:
+                delta['size'] = previous['size']
+        latest[key] = delta
+    return list(latest.values())
+
+# Event bus instance
+event_bus = EventBus(Config.EVENT_STREAMS_MAX, Config.EVENT_STREAMS_PER_USER)
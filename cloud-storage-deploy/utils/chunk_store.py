@@ -0,0 +1,192 @@
+import collections
+import hashlib
+import io
+import random
+import struct
+from config import Config
+from models.version_model import Chunk
+from utils.codec import encode_block, decode_block
+from utils.instrumentation import metrics
+from utils.storage import get_backend, backend_for_key
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Manifest entry: SHA-256 digest and original chunk length
+ENTRY = struct.Struct('>32sI')
+
+# Chunks looked up, uploaded and referenced per round trip
+STORE_BATCH = 64
+
+MASK_64 = (1 << 64) - 1
+
+def _gear_table():
+    # Fixed seed: a different table moves every boundary and stops old chunks from matching
+    rng = random.Random(0x6765617263646321)
+    return tuple(rng.getrandbits(64) for _ in range(256))
+
+GEAR = _gear_table()
+
+CHUNK_BYTES = metrics.counter('chunk_store_bytes_total', 'Bytes written to the chunk store by whether they were new',
+                              ('result',))
+CHUNKS_COLLECTED = metrics.counter('chunk_store_collected_total', 'Unreferenced chunks deleted')
+
+def _top_bits(bits):
+    return ((1 << bits) - 1) << (64 - bits)
+
+def cut_point(data, min_size, avg_size, max_size):
+    """Length of the first content-defined chunk of ``data``.
+
+    Gear hashing with normalized chunking (as in FastCDC): nothing is cut
+    before ``min_size``, a stricter mask applies up to ``avg_size`` and a
+    looser one after it, and ``max_size`` forces a cut. The hash depends
+    only on the last 64 bytes, so an insert early in a file moves the
+    boundaries near it and leaves the later ones, and their chunks, alone.
+    """
+    end = min(len(data), max_size)
+    if end <= min_size:
+        return end
+    normal = min(end, avg_size)
+    bits = avg_size.bit_length() - 1
+    strict, loose = _top_bits(bits + 1), _top_bits(bits - 1)
+    gear = GEAR
+    h = 0
+    for i in range(min_size, normal):
+        h = ((h << 1) + gear[data[i]]) & MASK_64
+        if not h & strict:
+            return i + 1
+    for i in range(normal, end):
+        h = ((h << 1) + gear[data[i]]) & MASK_64
+        if not h & loose:
+            return i + 1
+    return end
+
+def iter_chunks(blocks, min_size=None, avg_size=None, max_size=None):
+    """Split a stream of byte blocks into content-defined chunks"""
+    min_size = min_size or Config.CHUNK_MIN_SIZE
+    avg_size = avg_size or Config.CHUNK_AVG_SIZE
+    max_size = max_size or Config.CHUNK_MAX_SIZE
+    buffer = bytearray()
+    for block in blocks:
+        buffer += block
+        while len(buffer) >= max_size:
+            cut = cut_point(buffer, min_size, avg_size, max_size)
+            yield bytes(buffer[:cut])
+            del buffer[:cut]
+    while buffer:
+        cut = cut_point(buffer, min_size, avg_size, max_size)
+        yield bytes(buffer[:cut])
+        del buffer[:cut]
+
+def parse_manifest(manifest):
+    """[(hex digest, length), ...] for a manifest"""
+    return [(digest.hex(), length) for digest, length in ENTRY.iter_unpack(manifest)]
+
+def _store_batch(batch):
+    """Upload the new chunks of [(digest, data), ...] and reference them all; returns manifest bytes"""
+    backend = get_backend()
+    live = Chunk.get_live({digest.hex() for digest, _ in batch})
+    entries = {}
+    written = {}
+    try:
+        for digest, data in batch:
+            h = digest.hex()
+            if h in entries:
+                entries[h][4] += 1
+            elif h in live:
+                entries[h] = [h, len(data), live[h]['s3_key'], live[h]['codec'], 1]
+            else:
+                codec, payload = encode_block(data)
+                key = backend.make_chunk_key(h)
+                result = backend.put_stream(key, io.BytesIO(payload))
+                if not result['success']:
+                    raise RuntimeError(f"Chunk upload failed: {result['error']}")
+                written[h] = key
+                entries[h] = [h, len(data), key, codec, 1]
+                CHUNK_BYTES.inc(len(data), result='stored')
+                continue
+            CHUNK_BYTES.inc(len(data), result='deduplicated')
+        if not Chunk.add_refs([tuple(entry) for entry in entries.values()]):
+            raise RuntimeError('Failed to reference chunks')
+    except Exception:
+        if written:
+            backend.delete_many(written.values())
+        raise
+
+    # A concurrent writer may have stored the same new chunk first; drop the losing copies
+    if written:
+        kept = Chunk.get_locations(set(written))
+        orphans = [key for h, key in written.items() if kept.get(h, {}).get('s3_key') != key]
+        if orphans:
+            backend.delete_many(orphans)
+    return b''.join(ENTRY.pack(digest, len(data)) for digest, data in batch)
+
+def store(blocks, progress=None):
+    """Write a stream of byte blocks into the chunk store and return its manifest.
+
+    Chunks that are already stored and referenced are not uploaded again;
+    every manifest entry adds one reference to its chunk. ``progress`` is
+    called after each batch. If anything raises, the references already
+    added are released before the error propagates.
+    """
+    manifest = bytearray()
+    batch = []
+    try:
+        for data in iter_chunks(blocks):
+            batch.append((hashlib.sha256(data).digest(), data))
+            if len(batch) == STORE_BATCH:
+                manifest += _store_batch(batch)
+                batch = []
+                if progress is not None:
+                    progress()
+        if batch:
+            manifest += _store_batch(batch)
+    except Exception:
+        if manifest:
+            release([bytes(manifest)])
+        raise
+    return bytes(manifest)
+
+def release(manifests):
+    """Drop the chunk references held by ``manifests``"""
+    counts = collections.Counter(h for manifest in manifests for h, _ in parse_manifest(manifest))
+    return Chunk.release(counts)
+
+def iter_manifest(manifest):
+    """Yield the original bytes a manifest describes, in order"""
+    entries = parse_manifest(manifest)
+    for i in range(0, len(entries), STORE_BATCH):
+        batch = entries[i:i + STORE_BATCH]
+        locations = Chunk.get_locations({h for h, _ in batch})
+        for h, _ in batch:
+            location = locations.get(h)
+            data = None
+            if location is not None:
+                data = backend_for_key(location['s3_key']).get_range(location['s3_key'])
+            if data is None:
+                raise RuntimeError(f'Chunk {h} is missing from the store')
+            yield decode_block(location['codec'], data)
+
+def collect_garbage(grace_hours, batch_size=1000):
+    """Delete up to ``batch_size`` chunks unreferenced for over ``grace_hours``; returns how many were examined.
+
+    Rows go first, and only while still unreferenced and pointing at the
+    same blob, so a chunk revived by a concurrent upload keeps its blob.
+    """
+    rows = Chunk.get_garbage(grace_hours, batch_size)
+    if not rows:
+        return 0
+    if not Chunk.delete_unreferenced(rows):
+        raise RuntimeError('Failed to delete unreferenced chunks')
+    remaining = Chunk.get_locations({row['hash'] for row in rows})
+
+    doomed = {}
+    for row in rows:
+        if remaining.get(row['hash'], {}).get('s3_key') != row['s3_key']:
+            doomed.setdefault(backend_for_key(row['s3_key']), []).append(row['s3_key'])
+    for backend, keys in doomed.items():
+        result = backend.delete_many(keys)
+        CHUNKS_COLLECTED.inc(len(result['deleted']))
+        for error in result['errors']:
+            logger.warning("Failed to delete chunk blob %s: %s", error['key'], error['error'])
+    return len(rows)
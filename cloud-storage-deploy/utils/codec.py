@@ -0,0 +1,147 @@
+import os
+import uuid
+from urllib.parse import quote
+from flask import Response, request
+from config import Config
+from utils.instrumentation import metrics
+from utils.storage import backend_for_key
+import logging
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; without it blobs are stored as uploaded
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ZSTD = 'zstd'
+
+# Formats that are already compressed, or are embedded straight from storage by previews
+INCOMPRESSIBLE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'zip', 'rar', 'docx', 'xlsx', 'pptx', 'pdf'}
+
+ENCODED_BYTES = metrics.counter('blob_codec_bytes_total', 'Bytes before and after the storage codec',
+                                ('codec', 'stage'))
+
+def compression_enabled():
+    return zstandard is not None and Config.BLOB_COMPRESSION
+
+def choose_codec(path, file_name):
+    """Return the codec to store a file with, or None to store it as uploaded.
+
+    Only the first block is compressed as a sample; files whose sample does
+    not shrink below BLOB_COMPRESS_MAX_RATIO are left alone.
+    """
+    if not compression_enabled():
+        return None
+    extension = os.path.splitext(file_name)[1].lstrip('.').lower()
+    if extension in INCOMPRESSIBLE_EXTENSIONS:
+        return None
+    with open(path, 'rb') as f:
+        sample = f.read(Config.BLOB_COMPRESS_SAMPLE_BYTES)
+    if len(sample) < Config.BLOB_COMPRESS_MIN_SIZE:
+        return None
+    compressed = zstandard.ZstdCompressor(level=Config.BLOB_COMPRESS_LEVEL).compress(sample)
+    return ZSTD if len(compressed) <= len(sample) * Config.BLOB_COMPRESS_MAX_RATIO else None
+
+def encode_file(path, codec):
+    """Stream-compress ``path`` into a sibling temp file and return its path"""
+    encoded_path = os.path.join(os.path.dirname(path), f".{uuid.uuid4().hex}.{codec}")
+    compressor = zstandard.ZstdCompressor(level=Config.BLOB_COMPRESS_LEVEL, write_content_size=True)
+    try:
+        with open(path, 'rb') as src, open(encoded_path, 'wb') as dst:
+            read, written = compressor.copy_stream(src, dst, size=os.fstat(src.fileno()).st_size)
+    except Exception:
+        if os.path.exists(encoded_path):
+            os.remove(encoded_path)
+        raise
+    ENCODED_BYTES.inc(read, codec=codec, stage='original')
+    ENCODED_BYTES.inc(written, codec=codec, stage='stored')
+    return encoded_path
+
+def encode_block(data):
+    """(codec, payload) for storing an in-memory block, compressed only when that pays off"""
+    if compression_enabled() and len(data) >= Config.BLOB_COMPRESS_MIN_SIZE:
+        compressed = zstandard.ZstdCompressor(level=Config.BLOB_COMPRESS_LEVEL).compress(data)
+        if len(compressed) <= len(data) * Config.BLOB_COMPRESS_MAX_RATIO:
+            ENCODED_BYTES.inc(len(data), codec=ZSTD, stage='original')
+            ENCODED_BYTES.inc(len(compressed), codec=ZSTD, stage='stored')
+            return ZSTD, compressed
+    return None, data
+
+def decode_block(codec, payload):
+    if codec is None:
+        return payload
+    return zstandard.ZstdDecompressor().decompress(payload)
+
+def _stored_chunks(backend, key, chunk_size, cached=True):
+    """Read a stored object front to back in ranged chunks.
+
+    Whole-object reads pass ``cached=False``: each block would be read once,
+    so caching them only writes to disk and pushes out blocks read often.
+    """
+    read = backend.get_range if cached else backend.fetch_range
+    start = 0
+    while True:
+        chunk = read(key, start, start + chunk_size - 1)
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        start += len(chunk)
+
+def iter_decoded(backend, key, codec, chunk_size=1024 * 1024):
+    """Yield the original bytes of a stored object"""
+    if codec is None:
+        yield from _stored_chunks(backend, key, chunk_size, cached=False)
+        return
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    for chunk in _stored_chunks(backend, key, chunk_size, cached=False):
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+
+def read_decoded_prefix(backend, key, codec, limit):
+    """Up to ``limit`` leading bytes of the original file, or None if the object is missing.
+
+    Compressed objects are read in small pieces so only about as much as
+    the prefix needs is fetched and decompressed.
+    """
+    if codec is None:
+        return backend.get_range(key, 0, limit - 1)
+    chunks = _stored_chunks(backend, key, 64 * 1024)
+    first = next(chunks, None)
+    if first is None:
+        return None
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    out = bytearray(decompressor.decompress(first))
+    for chunk in chunks:
+        if len(out) >= limit:
+            break
+        out += decompressor.decompress(chunk)
+    return bytes(out[:limit])
+
+def presign_download(file_row, decoded_url, expiration=3600):
+    """Result dict with the URL a client should download a stored file from.
+
+    Files stored as uploaded, and compressed ones the client can decode
+    itself, get a presigned URL (declaring the codec as Content-Encoding).
+    Other clients are sent to ``decoded_url``, an app route that serves
+    ``decoded_response``.
+    """
+    codec = file_row.get('codec')
+    if codec and not request.accept_encodings[codec]:
+        return {'success': True, 'url': decoded_url}
+    return backend_for_key(file_row['s3_key']).presign(
+        file_row['s3_key'], expiration, download_name=file_row['file_name'], content_encoding=codec)
+
+def decoded_response(file_row):
+    """Stream a stored file's original bytes as a download, or None if the blob is missing"""
+    backend = backend_for_key(file_row['s3_key'])
+    if backend.head(file_row['s3_key']) is None:
+        return None
+    response = Response(iter_decoded(backend, file_row['s3_key'], file_row.get('codec')),
+                        mimetype='application/octet-stream')
+    response.headers['Content-Length'] = str(file_row['file_size'])
+    response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(file_row['file_name'])}"
+    return response
@@ -0,0 +1,157 @@
+import hashlib
+import math
+from config import Config
+from models.file_model import File
+from models.upload_model import DirectUpload
+from utils.s3_service import s3_service
+from utils.storage import get_backend
+from utils.versioning import find_replaced, replace_content
+import logging
+
+logger = logging.getLogger(__name__)
+
+# S3 limits for multipart uploads
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+def direct_uploads_enabled():
+    return Config.DIRECT_UPLOADS and Config.STORAGE_BACKEND == 's3'
+
+def part_size_for(file_size):
+    """Configured part size, raised when needed to stay within S3's part count"""
+    part_size = max(Config.DIRECT_UPLOAD_PART_SIZE, MIN_PART_SIZE)
+    return max(part_size, math.ceil(file_size / MAX_PARTS))
+
+def part_count(upload):
+    return max(1, math.ceil(upload['file_size'] / upload['part_size']))
+
+def multipart_etag(parts):
+    """The ETag S3 gives an object assembled from ``parts``: MD5 of the part MD5s, then the count"""
+    digests = b''.join(bytes.fromhex(part['ETag'].strip('"')) for part in parts)
+    return f'"{hashlib.md5(digests).hexdigest()}-{len(parts)}"'
+
+def start_direct_upload(user_id, folder_id, file_name, file_size, content_type):
+    """Reserve a key and presign the browser's upload.
+
+    Files up to one part go as a single presigned POST whose policy pins the
+    exact size; larger ones become a multipart upload whose part URLs are
+    issued in batches by ``presign_parts``. Returns a result dict.
+    """
+    backend = get_backend('s3')
+    key = backend.make_key(user_id, file_name)
+    part_size = part_size_for(file_size)
+    expiry = Config.DIRECT_UPLOAD_URL_EXPIRY
+
+    if file_size <= part_size:
+        result = s3_service.generate_presigned_post(key, file_size, content_type, expiry)
+        if not result['success']:
+            return result
+        upload = DirectUpload.create(user_id, folder_id, file_name, file_size, key)
+        if not upload:
+            return {'success': False, 'error': 'Failed to record upload'}
+        return {'success': True, 'upload': upload, 'method': 'post', 'url': result['url'], 'fields': result['fields']}
+
+    result = s3_service.create_multipart_upload(key, content_type)
+    if not result['success']:
+        return result
+    upload = DirectUpload.create(user_id, folder_id, file_name, file_size, key, result['upload_id'], part_size)
+    if not upload:
+        s3_service.abort_multipart_upload(key, result['upload_id'])
+        return {'success': False, 'error': 'Failed to record upload'}
+    return {'success': True, 'upload': upload, 'method': 'multipart', 'part_size': part_size,
+            'part_count': math.ceil(file_size / part_size), 'concurrency': Config.DIRECT_UPLOAD_CONCURRENCY}
+
+def presign_parts(upload, part_numbers):
+    if not upload['upload_id']:
+        return {'success': False, 'error': 'Upload is not multipart'}
+    count = part_count(upload)
+    if any(not 1 <= number <= count for number in part_numbers):
+        return {'success': False, 'error': f'Part numbers must be between 1 and {count}'}
+    return s3_service.presign_upload_parts(upload['s3_key'], upload['upload_id'], part_numbers,
+                                           Config.DIRECT_UPLOAD_URL_EXPIRY)
+
+def _assemble(upload):
+    """Complete a multipart upload after checking S3 holds every part at the expected sizes"""
+    listed = s3_service.list_parts(upload['s3_key'], upload['upload_id'])
+    if not listed['success']:
+        return listed
+    parts = listed['parts']
+    count = part_count(upload)
+    if [p['PartNumber'] for p in parts] != list(range(1, count + 1)):
+        return {'success': False, 'error': f'Expected {count} parts, storage has {len(parts)}'}
+    if sum(p['Size'] for p in parts) != upload['file_size']:
+        return {'success': False, 'error': 'Uploaded size does not match the declared size'}
+
+    completed = s3_service.complete_multipart_upload(upload['s3_key'], upload['upload_id'], parts)
+    if not completed['success']:
+        return completed
+    return {'success': True, 'etag': multipart_etag(parts)}
+
+def complete_direct_upload(upload):
+    """Verify the object the browser uploaded and record it as a file.
+
+    The object must exist with exactly the declared size; multipart objects
+    must also carry the ETag derived from the parts' own MD5s, proving S3
+    assembled precisely the parts that were checked. On any mismatch the
+    object is deleted and nothing is recorded.
+
+    A retry after an attempt that assembled the object but failed later
+    finds it already in place and skips assembly. The upload row is claimed
+    before the file is recorded, so concurrent calls record it once, and a
+    failed record deletes the object instead of leaving it unreferenced.
+    """
+    expected_etag = None
+    head = s3_service.head_object(upload['s3_key'])
+    if upload['upload_id']:
+        # Only an assembled upload can have this ETag shape at this key
+        assembled = (head['success'] and head['size'] == upload['file_size']
+                     and (head['etag'] or '').endswith(f'-{part_count(upload)}"'))
+        if not assembled:
+            result = _assemble(upload)
+            if not result['success']:
+                return result
+            expected_etag = result['etag']
+            head = s3_service.head_object(upload['s3_key'])
+
+    if not head['success']:
+        return {'success': False, 'error': 'Uploaded object not found'}
+    if head['size'] != upload['file_size'] or (expected_etag and head['etag'] != expected_etag):
+        logger.warning("Direct upload %s failed verification (size %s, etag %s)", upload['id'], head['size'], head['etag'])
+        s3_service.delete_file(upload['s3_key'])
+        DirectUpload.delete(upload['id'])
+        return {'success': False, 'error': 'Uploaded object failed verification'}
+
+    if not DirectUpload.claim(upload['id']):
+        return {'success': False, 'error': 'Upload is already being completed'}
+
+    s3_url = get_backend('s3').public_url(upload['s3_key'])
+    replaces = find_replaced(upload['user_id'], upload['folder_id'], upload['file_name'])
+    if replaces is not None:
+        new_file = replace_content(replaces, upload['s3_key'], s3_url, None, upload['file_size'])
+        error = 'Failed to record new version'
+    else:
+        new_file = File(
+            user_id=upload['user_id'],
+            file_name=upload['file_name'],
+            file_size=upload['file_size'],
+            folder_id=upload['folder_id'],
+            s3_key=upload['s3_key'],
+            s3_url=s3_url
+        )
+        error = 'Failed to record file'
+        if not new_file.create():
+            new_file = None
+    if new_file is None:
+        s3_service.delete_file(upload['s3_key'])
+        return {'success': False, 'error': error}
+    return {'success': True, 'file': new_file}
+
+def abort_direct_upload(upload):
+    """Drop an unfinished upload and whatever part of it reached the bucket"""
+    if upload['upload_id']:
+        result = s3_service.abort_multipart_upload(upload['s3_key'], upload['upload_id'])
+        if not result['success']:
+            logger.warning("Abort of direct upload %s failed: %s", upload['id'], result['error'])
+    else:
+        s3_service.delete_file(upload['s3_key'])
+    DirectUpload.delete(upload['id'])
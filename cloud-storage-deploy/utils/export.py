@@ -0,0 +1,59 @@
+import csv
+import datetime
+import decimal
+import io
+import json
+import zlib
+
+FLUSH_BYTES = 64 * 1024
+
+def _plain(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', errors='replace')
+    return value
+
+def csv_chunks(rows, columns):
+    """Encode rows as CSV with a header line, yielding ~64 KB chunks of bytes"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_plain(row[column]) for column in columns])
+        if buffer.tell() >= FLUSH_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def ndjson_chunks(rows, columns):
+    """Encode rows as newline-delimited JSON objects, yielding ~64 KB chunks of bytes"""
+    parts = []
+    size = 0
+    for row in rows:
+        line = json.dumps({column: _plain(row[column]) for column in columns}, default=str) + '\n'
+        parts.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            yield ''.join(parts).encode('utf-8')
+            parts = []
+            size = 0
+    yield ''.join(parts).encode('utf-8')
+
+def gzip_chunks(chunks, level=6):
+    """Compress a byte stream into a gzip member on the fly"""
+    # wbits=31 writes the gzip header and trailer rather than a raw zlib stream
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+FORMATS = {
+    'csv': (csv_chunks, 'text/csv'),
+    'ndjson': (ndjson_chunks, 'application/x-ndjson'),
+}
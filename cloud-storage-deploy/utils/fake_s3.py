@@ -0,0 +1,257 @@
+import datetime
+import hashlib
+import io
+import random
+import re
+import threading
+import time
+import uuid
+from urllib.parse import quote, urlencode
+from botocore.exceptions import ClientError
+
+def _client_error(code, message, operation):
+    status = {'NoSuchKey': 404, '404': 404, 'NoSuchBucket': 404, 'NoSuchUpload': 404,
+              'InvalidPart': 400, 'InvalidRange': 416}.get(code, 500)
+    return ClientError({'Error': {'Code': code, 'Message': message},
+                        'ResponseMetadata': {'HTTPStatusCode': status}}, operation)
+
+class _Body:
+    """Minimal stand-in for botocore's StreamingBody"""
+
+    def __init__(self, data):
+        self._stream = io.BytesIO(data)
+
+    def read(self, amt=None):
+        return self._stream.read() if amt is None else self._stream.read(amt)
+
+    def iter_chunks(self, chunk_size=1024 * 1024):
+        while True:
+            chunk = self._stream.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        pass
+
+class InMemoryS3Client:
+    """In-process S3 stand-in implementing the client calls the app makes.
+
+    ``latency`` is the mean delay per call in seconds (uniformly jittered by
+    ``jitter``) and ``failure_rate`` the probability that a data-plane call
+    fails with a ClientError, so slow or flaky regions can be simulated
+    offline. Presigning is local and never delayed, as with boto3.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, endpoint='http://s3.local'):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.endpoint = endpoint
+        self.buckets = {}
+        self.uploads = {}
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def _call(self, operation):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise _client_error('InternalError', 'Injected failure', operation)
+
+    def _bucket(self, bucket, operation):
+        if bucket not in self.buckets:
+            # Buckets spring into existence so the stand-in needs no setup
+            self.buckets[bucket] = {}
+        return self.buckets[bucket]
+
+    def _object(self, bucket, key, operation):
+        obj = self._bucket(bucket, operation).get(key)
+        if obj is None:
+            raise _client_error('NoSuchKey', 'The specified key does not exist.', operation)
+        return obj
+
+    def _store(self, bucket, key, data, extra=None):
+        extra = extra or {}
+        obj = {
+            'Body': data,
+            'ContentLength': len(data),
+            'ContentType': extra.get('ContentType', 'binary/octet-stream'),
+            'ETag': f'"{hashlib.md5(data).hexdigest()}"',
+            'LastModified': datetime.datetime.now(datetime.timezone.utc),
+            'StorageClass': extra.get('StorageClass', 'STANDARD'),
+            'Metadata': dict(extra.get('Metadata', {})),
+        }
+        if 'ContentEncoding' in extra:
+            obj['ContentEncoding'] = extra['ContentEncoding']
+        with self._lock:
+            self._bucket(bucket, 'PutObject')[key] = obj
+        return obj
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, **kwargs):
+        self._call('PutObject')
+        with open(Filename, 'rb') as f:
+            self._store(Bucket, Key, f.read(), ExtraArgs)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, **kwargs):
+        self._call('PutObject')
+        self._store(Bucket, Key, Fileobj.read(), ExtraArgs)
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        self._call('PutObject')
+        data = Body.read() if hasattr(Body, 'read') else bytes(Body)
+        obj = self._store(Bucket, Key, data, kwargs)
+        return {'ETag': obj['ETag']}
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        self._call('GetObject')
+        obj = self._object(Bucket, Key, 'GetObject')
+        if obj['StorageClass'] in ('GLACIER', 'DEEP_ARCHIVE') and 'Restore' not in obj:
+            raise _client_error('InvalidObjectState', 'The operation is not valid for the object\'s storage class',
+                                'GetObject')
+        data = obj['Body']
+        if Range:
+            match = re.match(r'bytes=(\d+)-(\d*)$', Range)
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(data) - 1
+            if start >= len(data) and len(data) > 0:
+                raise _client_error('InvalidRange', 'The requested range is not satisfiable', 'GetObject')
+            data = data[start:end + 1]
+        response = {key: value for key, value in obj.items() if key != 'Body'}
+        response['ContentLength'] = len(data)
+        response['Body'] = _Body(data)
+        return response
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._call('HeadObject')
+        obj = self._bucket(Bucket, 'HeadObject').get(Key)
+        if obj is None:
+            raise _client_error('404', 'Not Found', 'HeadObject')
+        return {key: value for key, value in obj.items() if key != 'Body'}
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        self._call('CopyObject')
+        source = self._object(CopySource['Bucket'], CopySource['Key'], 'CopyObject')
+        extra = {'ContentType': source['ContentType'], 'Metadata': source['Metadata']}
+        if 'ContentEncoding' in source:
+            extra['ContentEncoding'] = source['ContentEncoding']
+        extra.update(kwargs)
+        obj = self._store(Bucket, Key, source['Body'], extra)
+        return {'CopyObjectResult': {'ETag': obj['ETag']}}
+
+    def restore_object(self, Bucket, Key, RestoreRequest=None, **kwargs):
+        """Restores complete immediately: the object is readable right away"""
+        self._call('RestoreObject')
+        obj = self._object(Bucket, Key, 'RestoreObject')
+        days = (RestoreRequest or {}).get('Days', 1)
+        expiry = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=days)
+        with self._lock:
+            obj['Restore'] = f'ongoing-request="false", expiry-date="{expiry:%a, %d %b %Y %H:%M:%S GMT}"'
+        return {}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._call('DeleteObject')
+        with self._lock:
+            self._bucket(Bucket, 'DeleteObject').pop(Key, None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        self._call('DeleteObjects')
+        with self._lock:
+            bucket = self._bucket(Bucket, 'DeleteObjects')
+            for entry in Delete['Objects']:
+                bucket.pop(entry['Key'], None)
+        return {'Deleted': [] if Delete.get('Quiet') else [{'Key': e['Key']} for e in Delete['Objects']]}
+
+    def list_objects_v2(self, Bucket, Prefix='', **kwargs):
+        self._call('ListObjectsV2')
+        contents = [{'Key': key, 'Size': obj['ContentLength'], 'LastModified': obj['LastModified'],
+                     'StorageClass': obj['StorageClass']}
+                    for key, obj in sorted(self._bucket(Bucket, 'ListObjectsV2').items())
+                    if key.startswith(Prefix)]
+        response = {'KeyCount': len(contents)}
+        if contents:
+            response['Contents'] = contents
+        return response
+
+    def head_bucket(self, Bucket, **kwargs):
+        self._call('HeadBucket')
+        self._bucket(Bucket, 'HeadBucket')
+        return {}
+
+    def create_bucket(self, Bucket, **kwargs):
+        self._call('CreateBucket')
+        self._bucket(Bucket, 'CreateBucket')
+        return {}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self._call('CreateMultipartUpload')
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self.uploads[upload_id] = {'Bucket': Bucket, 'Key': Key, 'extra': kwargs, 'parts': {}}
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': upload_id}
+
+    def _upload(self, upload_id, operation):
+        upload = self.uploads.get(upload_id)
+        if upload is None:
+            raise _client_error('NoSuchUpload', 'The specified upload does not exist.', operation)
+        return upload
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body=b'', **kwargs):
+        self._call('UploadPart')
+        data = Body.read() if hasattr(Body, 'read') else bytes(Body)
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        with self._lock:
+            self._upload(UploadId, 'UploadPart')['parts'][PartNumber] = (data, etag)
+        return {'ETag': etag}
+
+    def list_parts(self, Bucket, Key, UploadId, PartNumberMarker=0, MaxParts=1000, **kwargs):
+        self._call('ListParts')
+        parts = sorted(self._upload(UploadId, 'ListParts')['parts'].items())
+        parts = [(n, part) for n, part in parts if n > PartNumberMarker]
+        page = parts[:MaxParts]
+        response = {'Parts': [{'PartNumber': n, 'ETag': etag, 'Size': len(data)} for n, (data, etag) in page],
+                    'IsTruncated': len(parts) > MaxParts}
+        if response['IsTruncated']:
+            response['NextPartNumberMarker'] = page[-1][0]
+        return response
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        self._call('CompleteMultipartUpload')
+        with self._lock:
+            upload = self._upload(UploadId, 'CompleteMultipartUpload')
+            received = upload['parts']
+            for part in MultipartUpload['Parts']:
+                if received.get(part['PartNumber'], (None, None))[1] != part['ETag']:
+                    raise _client_error('InvalidPart', 'One or more of the specified parts could not be found.',
+                                        'CompleteMultipartUpload')
+            del self.uploads[UploadId]
+        chunks = [received[p['PartNumber']] for p in MultipartUpload['Parts']]
+        obj = self._store(Bucket, Key, b''.join(data for data, _ in chunks), upload['extra'])
+        # S3's multipart ETag: MD5 of the concatenated part digests, then the part count
+        digest = hashlib.md5(b''.join(bytes.fromhex(etag.strip('"')) for _, etag in chunks)).hexdigest()
+        obj['ETag'] = f'"{digest}-{len(chunks)}"'
+        return {'Bucket': Bucket, 'Key': Key, 'ETag': obj['ETag']}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._call('AbortMultipartUpload')
+        with self._lock:
+            self._upload(UploadId, 'AbortMultipartUpload')
+            del self.uploads[UploadId]
+        return {}
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, **kwargs):
+        params = dict(Params or {})
+        bucket = params.pop('Bucket', '')
+        key = params.pop('Key', '')
+        query = {'X-Amz-Expires': ExpiresIn, 'X-Amz-Signature': 'stand-in'}
+        query.update({k: v for k, v in params.items() if isinstance(v, (str, int))})
+        return f"{self.endpoint}/{bucket}/{quote(key)}?{urlencode(query)}"
+
+    def generate_presigned_post(self, Bucket, Key, Fields=None, Conditions=None, ExpiresIn=3600, **kwargs):
+        fields = dict(Fields or {})
+        fields.update({'key': Key, 'policy': 'stand-in', 'x-amz-signature': 'stand-in'})
+        return {'url': f"{self.endpoint}/{Bucket}", 'fields': fields}
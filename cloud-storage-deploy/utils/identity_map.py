@@ -0,0 +1,38 @@
+from flask import g, has_request_context
+
+class IdentityMap:
+    """Request-scoped cache of rows loaded by primary key.
+
+    Within one request a given file or folder row is fetched from the
+    database at most once. Outside a request context (job workers, scripts)
+    every lookup misses, so callers always fall through to the query.
+    """
+
+    def _rows(self):
+        if not has_request_context():
+            return None
+        rows = getattr(g, '_identity_map', None)
+        if rows is None:
+            rows = g._identity_map = {}
+        return rows
+
+    def get(self, kind, key):
+        rows = self._rows()
+        if rows is None:
+            return None
+        return rows.get((kind, str(key)))
+
+    def put(self, kind, key, row):
+        """Remember ``row`` for the rest of the request and return it"""
+        rows = self._rows()
+        if rows is not None and row is not None:
+            rows[(kind, str(key))] = row
+        return row
+
+    def discard(self, kind, key):
+        rows = self._rows()
+        if rows is not None:
+            rows.pop((kind, str(key)), None)
+
+# Identity map instance
+identity_map = IdentityMap()
@@ -0,0 +1,292 @@
+import contextvars
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from flask import g, has_request_context, request, before_render_template, template_rendered
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('%s="%s"' % (n, str(v).replace('\\', '\\\\').replace('"', '\\"')) for n, v in zip(names, values))
+    return '{' + pairs + '}'
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, '') for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+class Gauge(Counter):
+    def set(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+    def expose(self):
+        lines = super().expose()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series['counts']):
+                    labels = _format_labels(self.labels + ('le',), key + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labels + ('le',), key + ('+Inf',))
+                lines.append(f"{self.name}_bucket{labels} {series['count']}")
+                base = _format_labels(self.labels, key)
+                lines.append(f"{self.name}_sum{base} {series['sum']}")
+                lines.append(f"{self.name}_count{base} {series['count']}")
+        return lines
+
+class MetricsRegistry:
+    """Process-local metrics rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._register(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def add_collector(self, func):
+        """Register a callable run before each scrape to refresh gauges"""
+        self._collectors.append(func)
+
+    def expose(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning("Metrics collector %s failed: %s", getattr(collector, '__name__', collector), e)
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+# Metrics registry instance
+metrics = MetricsRegistry()
+
+REQUEST_SECONDS = metrics.histogram('http_request_duration_seconds', 'Request latency',
+                                    ('endpoint', 'method', 'status'))
+DB_QUERY_SECONDS = metrics.histogram('db_query_duration_seconds', 'Latency of individual SQL statements',
+                                     ('operation',))
+DB_QUERIES_PER_REQUEST = metrics.histogram('db_queries_per_request', 'SQL statements issued per request',
+                                           ('endpoint',), buckets=(1, 2, 5, 10, 20, 50, 100, 250))
+S3_CALL_SECONDS = metrics.histogram('s3_call_duration_seconds', 'Latency of S3 API calls', ('operation',))
+RENDER_SECONDS = metrics.histogram('template_render_duration_seconds', 'Template render time', ('template',))
+N_PLUS_ONE = metrics.counter('db_n_plus_one_total', 'Requests repeating one statement past the threshold',
+                             ('endpoint',))
+
+_WHITESPACE = re.compile(r'\s+')
+
+# Stats for requests served by asgi.py before they enter a Flask request context
+_async_stats = contextvars.ContextVar('async_request_stats', default=None)
+
+def _new_stats():
+    return {'start': time.perf_counter(), 'db_time': 0.0, 'db_count': 0, 'statements': {},
+            's3_time': 0.0, 's3_count': 0, 'render_time': 0.0, 'render_started': None}
+
+def _request_stats():
+    if not has_request_context():
+        return _async_stats.get()
+    stats = getattr(g, '_perf', None)
+    if stats is None:
+        stats = g._perf = _async_stats.get() or _new_stats()
+    return stats
+
+def begin_async_request():
+    """Start collecting stats for an ASGI request in the current context.
+
+    Queries awaited on the event loop are counted here, and the Flask
+    request context that later finishes the response picks the same stats
+    up, so timings and Server-Timing cover the whole request.
+    """
+    _async_stats.set(_new_stats())
+
+def record_query(query, seconds, operation):
+    """Called by Database for every statement it runs"""
+    DB_QUERY_SECONDS.observe(seconds, operation=operation)
+    stats = _request_stats()
+    if stats is None:
+        return
+    stats['db_time'] += seconds
+    stats['db_count'] += 1
+    statement = _WHITESPACE.sub(' ', query).strip()
+    stats['statements'][statement] = stats['statements'].get(statement, 0) + 1
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("SQL %.2f ms: %s", seconds * 1000, statement)
+
+def record_s3(operation, seconds):
+    S3_CALL_SECONDS.observe(seconds, operation=operation)
+    stats = _request_stats()
+    if stats is not None:
+        stats['s3_time'] += seconds
+        stats['s3_count'] += 1
+
+class TimedClient:
+    """Proxy that times every method call made on a boto3-style client"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                record_s3(name, time.perf_counter() - start)
+        return timed
+
+_profile_lock = threading.Lock()
+
+def _on_before_render(sender, template, context, **extra):
+    stats = _request_stats()
+    if stats is not None:
+        stats['render_started'] = time.perf_counter()
+
+def _on_rendered(sender, template, context, **extra):
+    stats = _request_stats()
+    if stats is not None and stats['render_started'] is not None:
+        elapsed = time.perf_counter() - stats['render_started']
+        stats['render_time'] += elapsed
+        stats['render_started'] = None
+        RENDER_SECONDS.observe(elapsed, template=template.name or 'string')
+
+def init_app(app):
+    """Attach per-request timing, N+1 detection and the sampling profiler"""
+    threshold = app.config.get('N_PLUS_ONE_THRESHOLD', 5)
+    sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+    profile_dir = app.config.get('PROFILE_DIR', 'profiles')
+
+    before_render_template.connect(_on_before_render, app)
+    template_rendered.connect(_on_rendered, app)
+
+    @app.before_request
+    def start_request_timer():
+        _request_stats()
+        # Profile a random sample of requests; one at a time, as cProfile is process-wide
+        if sample_rate and random.random() < sample_rate and _profile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                _profile_lock.release()
+                return
+            g._profiler = profiler
+
+    @app.teardown_request
+    def stop_profiler(exc):
+        # Teardown runs even when the view or an after_request hook raised,
+        # so the process-wide profiler and its lock are always given back
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            _profile_lock.release()
+            _save_profile(profiler, profile_dir)
+
+    @app.after_request
+    def finish_request_timer(response):
+        stats = _request_stats()
+        if stats is None:
+            return response
+
+        total = time.perf_counter() - stats['start']
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_SECONDS.observe(total, endpoint=endpoint, method=request.method, status=response.status_code)
+        DB_QUERIES_PER_REQUEST.observe(stats['db_count'], endpoint=endpoint)
+
+        repeated = [(s, n) for s, n in stats['statements'].items() if n > threshold]
+        if repeated:
+            N_PLUS_ONE.inc(endpoint=endpoint)
+            for statement, count in repeated:
+                logger.warning("Possible N+1 in %s: %d executions of %s", endpoint, count, statement[:200])
+
+        response.headers['Server-Timing'] = (
+            f'db;dur={stats["db_time"] * 1000:.1f};desc="{stats["db_count"]} queries", '
+            f's3;dur={stats["s3_time"] * 1000:.1f};desc="{stats["s3_count"]} calls", '
+            f'render;dur={stats["render_time"] * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}'
+        )
+        logger.debug("%s %s %s in %.1f ms (db %.1f ms/%d, s3 %.1f ms/%d, render %.1f ms)",
+                     request.method, request.path, response.status_code, total * 1000,
+                     stats['db_time'] * 1000, stats['db_count'], stats['s3_time'] * 1000,
+                     stats['s3_count'], stats['render_time'] * 1000)
+        return response
+
+def _save_profile(profiler, profile_dir):
+    try:
+        os.makedirs(profile_dir, exist_ok=True)
+        name = f"{int(time.time() * 1000)}_{(request.endpoint or 'unmatched').replace('.', '_')}.prof"
+        profiler.dump_stats(os.path.join(profile_dir, name))
+        if logger.isEnabledFor(logging.INFO):
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(15)
+            logger.info("Profile for %s %s saved to %s\n%s", request.method, request.path, name, summary.getvalue())
+    except Exception as e:
+        logger.warning("Failed to save profile: %s", e)
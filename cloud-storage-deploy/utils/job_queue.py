@@ -0,0 +1,338 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+import traceback
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT,
+    priority INTEGER NOT NULL DEFAULT 100,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    dedupe_key TEXT,
+    run_at REAL NOT NULL,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, priority, run_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs (dedupe_key, status);
+"""
+
+# Priorities: lower numbers run first
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 100
+PRIORITY_LOW = 1000
+
+class JobQueue:
+    """Durable in-process job queue stored in a local SQLite database.
+
+    Jobs are claimed atomically with a lease (visibility timeout): a job whose
+    worker dies is picked up again once its lease expires. Handlers that can
+    outlast the lease call ``extend_lease`` as they make progress. Failed jobs are
+    retried with exponential backoff until ``max_attempts`` is reached.
+    Several worker processes on the same host can share one queue file.
+    """
+
+    def __init__(self, path=None, workers=2, visibility_timeout=300, poll_interval=1.0):
+        self.path = path or Config.JOB_QUEUE_DB
+        self.worker_count = workers
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.handlers = {}
+        self.schedules = {}
+        self.app = None
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._started = False
+        self._initialized = False
+
+    def init_app(self, app):
+        self.app = app
+        self.path = app.config.get('JOB_QUEUE_DB', self.path)
+        self.worker_count = app.config.get('JOB_QUEUE_WORKERS', self.worker_count)
+        self.visibility_timeout = app.config.get('JOB_QUEUE_VISIBILITY_TIMEOUT', self.visibility_timeout)
+
+        # Workers start with the first request so the reloader's parent process never runs them
+        @app.before_request
+        def start_job_workers():
+            if not self._started:
+                self.start()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._initialized:
+                conn.executescript(SCHEMA)
+                self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def handler(self, kind, max_attempts=5):
+        """Decorator registering the function that processes jobs of ``kind``"""
+        def decorator(func):
+            self.handlers[kind] = (func, max_attempts)
+            return func
+        return decorator
+
+    def schedule(self, kind, interval, payload=None, priority=PRIORITY_LOW):
+        """Enqueue ``kind`` every ``interval`` seconds unless one is already pending.
+
+        One schedule per kind: registering a kind again (the app is created
+        more than once in a process) replaces its settings.
+        """
+        previous = self.schedules.get(kind)
+        self.schedules[kind] = {'kind': kind, 'interval': interval, 'payload': payload,
+                                'priority': priority, 'next_run': previous['next_run'] if previous else 0}
+
+    def enqueue(self, kind, payload=None, priority=PRIORITY_NORMAL, delay=0, dedupe_key=None):
+        """Add a job. Returns its id, or None when ``dedupe_key`` is already pending."""
+        _, max_attempts = self.handlers.get(kind, (None, 5))
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if dedupe_key is not None:
+                pending = conn.execute(
+                    "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN ('queued', 'running') LIMIT 1",
+                    (dedupe_key,)
+                ).fetchone()
+                if pending:
+                    conn.execute("COMMIT")
+                    return None
+            cursor = conn.execute(
+                """INSERT INTO jobs (kind, payload, priority, max_attempts, dedupe_key, run_at, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (kind, json.dumps(payload), priority, max_attempts, dedupe_key, now + delay, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._wakeup.set()
+        return cursor.lastrowid
+
+    def claim(self):
+        """Lease the most urgent runnable job, including ones whose lease expired"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                """SELECT * FROM jobs
+                WHERE (status = 'queued' AND run_at <= ?)
+                   OR (status = 'running' AND lease_until < ?)
+                ORDER BY priority, run_at
+                LIMIT 1""",
+                (now, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                """UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                lease_until = ?, started_at = ? WHERE id = ?""",
+                (now + self.visibility_timeout, now, row['id'])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        job = dict(row)
+        job['attempts'] += 1
+        job['lease_until'] = now + self.visibility_timeout
+        job['payload'] = json.loads(job['payload']) if job['payload'] else None
+        return job
+
+    # Matches the job only while this claim still holds it: every claim bumps
+    # attempts, so a worker whose lease expired and was re-claimed no longer matches
+    LEASE_HELD = "id = ? AND status = 'running' AND attempts = ?"
+
+    def _finish(self, job, query, params):
+        """Run an UPDATE guarded by LEASE_HELD; False (and logged) if the lease was lost"""
+        cursor = self._conn().execute(f"{query} WHERE {self.LEASE_HELD}", (*params, job['id'], job['attempts']))
+        if cursor.rowcount == 0:
+            logger.warning("Job %s (%s) lost its lease before finishing; its later claim decides the outcome",
+                           job['id'], job['kind'])
+            return False
+        return True
+
+    def extend_lease(self):
+        """Renew the lease of the job running on this thread; False if it was lost.
+
+        Cheap enough to call per unit of work: the lease is only written once
+        a third of it has gone by. Outside a job this does nothing.
+        """
+        job = getattr(self._local, 'job', None)
+        if job is None:
+            return True
+        now = time.time()
+        if job['lease_until'] - now > self.visibility_timeout * 2 / 3:
+            return True
+        cursor = self._conn().execute(f"UPDATE jobs SET lease_until = ? WHERE {self.LEASE_HELD}",
+                                      (now + self.visibility_timeout, job['id'], job['attempts']))
+        if cursor.rowcount == 0:
+            return False
+        job['lease_until'] = now + self.visibility_timeout
+        return True
+
+    def complete(self, job):
+        return self._finish(job, "UPDATE jobs SET status = 'done', finished_at = ?, lease_until = NULL",
+                            (time.time(),))
+
+    def fail(self, job, error):
+        now = time.time()
+        if job['attempts'] >= job['max_attempts']:
+            return self._finish(
+                job, "UPDATE jobs SET status = 'failed', finished_at = ?, lease_until = NULL, last_error = ?",
+                (now, error)
+            )
+        # Exponential backoff with jitter, capped at one hour
+        backoff = min(Config.JOB_QUEUE_RETRY_BASE * (2 ** (job['attempts'] - 1)), 3600)
+        backoff *= random.uniform(0.8, 1.2)
+        return self._finish(
+            job, "UPDATE jobs SET status = 'queued', run_at = ?, lease_until = NULL, last_error = ?",
+            (now + backoff, error)
+        )
+
+    def run_job(self, job):
+        entry = self.handlers.get(job['kind'])
+        if entry is None:
+            self.fail(job, f"No handler registered for {job['kind']}")
+            return
+        func, _ = entry
+        self._local.job = job
+        try:
+            if self.app is not None:
+                with self.app.app_context():
+                    func(job['payload'])
+            else:
+                func(job['payload'])
+            self.complete(job)
+        except Exception as e:
+            logger.warning("Job %s (%s) failed: %s", job['id'], job['kind'], e)
+            self.fail(job, ''.join(traceback.format_exception_only(type(e), e)).strip())
+        finally:
+            self._local.job = None
+
+    def run_pending(self, limit=None):
+        """Process runnable jobs on the calling thread (used by scripts and tests)"""
+        processed = 0
+        while limit is None or processed < limit:
+            job = self.claim()
+            if job is None:
+                break
+            self.run_job(job)
+            processed += 1
+        return processed
+
+    def _worker_loop(self):
+        from models.db import db
+        db.use_dedicated_connection()
+        while not self._stop.is_set():
+            try:
+                job = self.claim()
+            except sqlite3.Error as e:
+                logger.warning("Job queue claim failed: %s", e)
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self.run_job(job)
+
+    def _scheduler_loop(self):
+        while not self._stop.is_set():
+            now = time.time()
+            for entry in list(self.schedules.values()):
+                if now >= entry['next_run']:
+                    try:
+                        self.enqueue(entry['kind'], entry['payload'], priority=entry['priority'],
+                                     dedupe_key=f"schedule:{entry['kind']}")
+                    except sqlite3.Error as e:
+                        logger.error("Failed to schedule %s: %s", entry['kind'], e)
+                    entry['next_run'] = now + entry['interval']
+            self._stop.wait(1.0)
+
+    def start(self):
+        with self._start_lock:
+            if self._started or self.worker_count <= 0:
+                self._started = True
+                return
+            self._started = True
+            for i in range(self.worker_count):
+                thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            if self.schedules:
+                thread = threading.Thread(target=self._scheduler_loop, name="job-scheduler", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def prune(self, older_than):
+        """Delete finished jobs older than ``older_than`` seconds"""
+        cursor = self._conn().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+            (time.time() - older_than,)
+        )
+        return cursor.rowcount
+
+    def stats(self, window=3600):
+        """Queue depth per kind and status, plus wait and run latency over ``window`` seconds"""
+        conn = self._conn()
+        now = time.time()
+        depth = [dict(row) for row in conn.execute(
+            "SELECT kind, status, COUNT(*) AS count FROM jobs GROUP BY kind, status ORDER BY kind, status"
+        )]
+        oldest = conn.execute(
+            "SELECT MIN(run_at) AS oldest FROM jobs WHERE status = 'queued' AND run_at <= ?", (now,)
+        ).fetchone()['oldest']
+        latency = [dict(row) for row in conn.execute(
+            """SELECT kind, COUNT(*) AS completed,
+                      AVG(started_at - run_at) AS avg_wait,
+                      MAX(started_at - run_at) AS max_wait,
+                      AVG(finished_at - started_at) AS avg_runtime,
+                      MAX(finished_at - started_at) AS max_runtime
+            FROM jobs WHERE status = 'done' AND finished_at >= ?
+            GROUP BY kind ORDER BY kind""",
+            (now - window,)
+        )]
+        recent_failures = [dict(row) for row in conn.execute(
+            """SELECT id, kind, attempts, last_error, finished_at FROM jobs
+            WHERE status = 'failed' ORDER BY finished_at DESC LIMIT 20"""
+        )]
+        return {
+            'depth': depth,
+            'lag_seconds': now - oldest if oldest else 0,
+            'latency': latency,
+            'recent_failures': recent_failures,
+            'workers': sum(1 for t in self._threads if t.is_alive())
+        }
+
+# Job queue instance
+job_queue = JobQueue(workers=Config.JOB_QUEUE_WORKERS,
+                     visibility_timeout=Config.JOB_QUEUE_VISIBILITY_TIMEOUT)
@@ -0,0 +1,74 @@
+import secrets
+import sqlite3
+import threading
+from collections import OrderedDict
+from config import Config
+
+class ListingCache:
+    """Per-process cache of folder listings keyed by (user, folder).
+
+    Every user has a generation token that any mutation of their files or
+    folders replaces. Tokens live in a WAL-mode SQLite file shared by the
+    host's workers, so a bump in one worker invalidates the entries and
+    ETags of all of them; a check is one primary-key read. Cached entries
+    remember the generation they were built from and are ignored once it
+    moves on.
+    """
+
+    def __init__(self, path, max_entries=1024):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS generations (
+                user_id INTEGER PRIMARY KEY, generation TEXT NOT NULL)""")
+            self._local.conn = conn
+        return conn
+
+    def generation(self, user_id):
+        row = self._conn().execute("SELECT generation FROM generations WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else '0'
+
+    def bump(self, user_id):
+        # A random token rather than a counter, so a lost or recreated file
+        # can never hand out a generation an old ETag was built from
+        self._conn().execute("INSERT OR REPLACE INTO generations (user_id, generation) VALUES (?, ?)",
+                             (user_id, secrets.token_hex(8)))
+
+    def etag(self, user_id, key):
+        return f"{user_id}-{key}-{self.generation(user_id)}"
+
+    def get(self, user_id, key):
+        generation = self.generation(user_id)
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is None:
+                return None
+            if entry[0] != generation:
+                del self._entries[(user_id, key)]
+                return None
+            self._entries.move_to_end((user_id, key))
+            return entry[1]
+
+    def put(self, user_id, key, generation, value):
+        """Store a value built while the user was at ``generation``.
+
+        The generation must be read before the data is queried, so a mutation
+        that lands in between leaves the entry already stale.
+        """
+        with self._lock:
+            self._entries[(user_id, key)] = (generation, value)
+            self._entries.move_to_end((user_id, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+# Listing cache instance
+listing_cache = ListingCache(Config.LISTING_CACHE_DB, Config.LISTING_CACHE_MAX_ENTRIES)
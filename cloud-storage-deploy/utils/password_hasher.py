@@ -0,0 +1,112 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash
+from config import Config
+from utils.instrumentation import metrics
+
+HASH_SECONDS = metrics.histogram('password_hash_duration_seconds',
+                                 'Password hash/verify time including queue wait', ('operation',))
+HASH_PENDING = metrics.gauge('password_hash_pending', 'Hash operations queued or running')
+HASH_REJECTED = metrics.counter('password_hash_rejected_total', 'Hash operations refused because the queue was full')
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full, an operation timed out or a worker
+    crashed; callers should answer 503"""
+
+class PasswordHasher:
+    """Runs password hashing in a bounded pool of worker processes.
+
+    Hashing is deliberately slow, so doing it in request threads lets a
+    login storm starve everything else. At most ``max_pending`` operations
+    may be queued or running; beyond that ``HasherBusy`` is raised at once
+    instead of piling up requests. A slot is freed when its operation
+    actually finishes, not when the caller stops waiting after ``timeout``,
+    so the bound holds even for abandoned work. With ``workers=0`` hashing
+    runs inline.
+    """
+
+    def __init__(self, workers=2, max_pending=32, method='pbkdf2:sha256:600000', timeout=10):
+        self.workers = workers
+        self.method = method
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the app process has DB and worker threads that must not be copied
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _adjust_pending(self, delta):
+        with self._lock:
+            self._pending += delta
+            HASH_PENDING.set(self._pending)
+
+    def _release(self, future=None):
+        self._adjust_pending(-1)
+        self._slots.release()
+
+    def _discard_pool(self, executor):
+        """Drop a broken pool so the next operation starts a fresh one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, operation, func, *args):
+        start = time.perf_counter()
+        try:
+            if self.workers <= 0:
+                return func(*args)
+            if not self._slots.acquire(blocking=False):
+                HASH_REJECTED.inc()
+                raise HasherBusy('Password hashing queue is full')
+            self._adjust_pending(1)
+            executor = self._pool()
+            try:
+                future = executor.submit(func, *args)
+            except BrokenProcessPool:
+                self._release()
+                self._discard_pool(executor)
+                raise HasherBusy('Password hashing worker crashed')
+            future.add_done_callback(self._release)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeout:
+                raise HasherBusy('Password hashing timed out')
+            except BrokenProcessPool:
+                self._discard_pool(executor)
+                raise HasherBusy('Password hashing worker crashed')
+        finally:
+            HASH_SECONDS.observe(time.perf_counter() - start, operation=operation)
+
+    def hash(self, password):
+        return self._run('hash', generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run('verify', check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when a stored hash was made with a different method or cost than configured"""
+        return password_hash.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+# Password hasher instance
+password_hasher = PasswordHasher(workers=Config.PASSWORD_HASH_WORKERS,
+                                 max_pending=Config.PASSWORD_HASH_MAX_PENDING,
+                                 method=Config.PASSWORD_HASH_METHOD,
+                                 timeout=Config.PASSWORD_HASH_TIMEOUT)
@@ -0,0 +1,152 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, jsonify, render_template, request, session
+from utils.instrumentation import metrics
+
+RATE_LIMITED = metrics.counter('rate_limited_total', 'Requests rejected by the rate limiter', ('rule',))
+
+class MemoryBucketStore:
+    """Token buckets in this process's memory.
+
+    Each bucket is a (tokens, updated_at) pair refilled lazily on access,
+    so a check is a dict lookup and a little arithmetic. The least recently
+    used buckets are dropped beyond ``max_entries``; an evicted bucket
+    simply starts full again.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1.0, now=None):
+        """Spend ``cost`` tokens; return (allowed, seconds until enough tokens)"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+class SQLiteBucketStore:
+    """Token buckets shared by every worker process on the host.
+
+    Uses the same WAL-mode SQLite approach as the job queue; each check is
+    one short write transaction on a primary-key row.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)""")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst, cost=1.0, now=None):
+        # Wall-clock time, as monotonic clocks are not comparable across processes
+        now = time.time() if now is None else now
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                         (key, tokens, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    def prune(self, idle_seconds=3600):
+        """Delete buckets untouched for ``idle_seconds``; they would be full anyway"""
+        self._conn().execute("DELETE FROM buckets WHERE updated_at < ?", (time.time() - idle_seconds,))
+
+def by_ip():
+    return request.remote_addr or 'unknown'
+
+def by_user():
+    return session.get('user_id')
+
+def by_view_arg(name):
+    return lambda: (request.view_args or {}).get(name)
+
+def by_form(name):
+    def key():
+        value = request.form.get(name)
+        return value.strip().lower() if value else None
+    return key
+
+class RateLimiter:
+    """Token-bucket limits applied to views with the ``limit`` decorator"""
+
+    def __init__(self, store=None):
+        self.store = store or MemoryBucketStore()
+
+    def init_app(self, app):
+        if app.config.get('RATE_LIMIT_STORE') == 'sqlite':
+            self.store = SQLiteBucketStore(app.config.get('RATE_LIMIT_DB', 'ratelimit.db'))
+
+    def limit(self, rule, limit, key, methods=None):
+        """Allow ``limit`` = (tokens per second, burst) requests per value of ``key()``.
+
+        Requests whose key is None (e.g. no email submitted) are not counted.
+        Rejected requests get a 429 with Retry-After.
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if (current_app.config.get('RATE_LIMIT_ENABLED', True)
+                        and (methods is None or request.method in methods)):
+                    value = key()
+                    if value is not None:
+                        retry_after = self.check(rule, limit, value)
+                        if retry_after is not None:
+                            return too_many_requests(retry_after)
+                return f(*args, **kwargs)
+            return decorated_function
+        return decorator
+
+    def check(self, rule, limit, value):
+        """Spend a token from ``value``'s bucket; None if allowed, else seconds to wait"""
+        rate, burst = limit
+        allowed, retry_after = self.store.take(f"{rule}:{value}", rate, burst)
+        if allowed:
+            return None
+        RATE_LIMITED.inc(rule=rule)
+        return retry_after
+
+def too_many_requests(retry_after):
+    retry_after = max(1, int(retry_after + 0.999))
+    message = f'Too many requests. Please try again in {retry_after} seconds.'
+    if request.accept_mimetypes.best == 'application/json' or request.path.startswith('/api/'):
+        response = jsonify({'error': message})
+    else:
+        response = current_app.make_response(render_template('error.html', message=message))
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+# Rate limiter instance
+rate_limiter = RateLimiter()
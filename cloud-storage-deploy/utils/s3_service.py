@@ -2,19 +2,41 @@ import boto3
 import os
 from botocore.exceptions import NoCredentialsError, ClientError
 from config import Config
+from utils.instrumentation import TimedClient
 import uuid
+import logging
+
+logger = logging.getLogger(__name__)
 
 class S3Service:
-    def __init__(self):
+    def __init__(self, client=None):
         self.config = Config()
-        self.s3_client = boto3.client(
-            's3',
-            aws_access_key_id=self.config.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=self.config.AWS_SECRET_ACCESS_KEY,
-            region_name=self.config.AWS_REGION
-        )
+        self._s3_client = TimedClient(client) if client is not None else None
         self.bucket_name = self.config.S3_BUCKET_NAME
     
+    @property
+    def s3_client(self):
+        # Created on first use so importing the app never needs AWS access
+        if self._s3_client is None:
+            if self.config.S3_STANDIN:
+                from utils.fake_s3 import InMemoryS3Client
+                client = InMemoryS3Client(latency=self.config.S3_STANDIN_LATENCY,
+                                          failure_rate=self.config.S3_STANDIN_FAILURE_RATE)
+            else:
+                client = boto3.client(
+                    's3',
+                    aws_access_key_id=self.config.AWS_ACCESS_KEY_ID,
+                    aws_secret_access_key=self.config.AWS_SECRET_ACCESS_KEY,
+                    region_name=self.config.AWS_REGION,
+                    endpoint_url=self.config.S3_ENDPOINT_URL
+                )
+            self._s3_client = TimedClient(client)
+        return self._s3_client
+    
+    @s3_client.setter
+    def s3_client(self, client):
+        self._s3_client = TimedClient(client)
+    
     def upload_file(self, file_path, file_name, user_id):
         try:
             # Generate unique S3 key
@@ -55,17 +77,91 @@ class S3Service:
         except Exception as e:
             return {'success': False, 'error': f'Delete failed: {str(e)}'}
     
-    def generate_presigned_url(self, s3_key, expiration=3600):
+    def generate_presigned_url(self, s3_key, expiration=3600, client_method='get_object', params=None):
+        """Presign ``client_method`` on ``s3_key``; ``params`` adds e.g. UploadId and PartNumber"""
         try:
             url = self.s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': self.bucket_name, 'Key': s3_key},
+                client_method,
+                Params={'Bucket': self.bucket_name, 'Key': s3_key, **(params or {})},
                 ExpiresIn=expiration
             )
             return {'success': True, 'url': url}
         except ClientError as e:
             return {'success': False, 'error': f'URL generation failed: {str(e)}'}
     
+    def generate_presigned_post(self, s3_key, file_size, content_type='application/octet-stream', expiration=3600):
+        """Presigned POST policy that only accepts exactly ``file_size`` bytes at ``s3_key``"""
+        try:
+            post = self.s3_client.generate_presigned_post(
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                Fields={'Content-Type': content_type},
+                Conditions=[{'Content-Type': content_type}, ['content-length-range', file_size, file_size]],
+                ExpiresIn=expiration
+            )
+            return {'success': True, 'url': post['url'], 'fields': post['fields']}
+        except ClientError as e:
+            return {'success': False, 'error': f'URL generation failed: {str(e)}'}
+    
+    def create_multipart_upload(self, s3_key, content_type='application/octet-stream'):
+        try:
+            response = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket_name, Key=s3_key, ContentType=content_type)
+            return {'success': True, 'upload_id': response['UploadId']}
+        except ClientError as e:
+            return {'success': False, 'error': f'Multipart upload failed: {str(e)}'}
+    
+    def presign_upload_parts(self, s3_key, upload_id, part_numbers, expiration=3600):
+        """Presigned PUT URLs for the given parts, keyed by part number"""
+        urls = {}
+        for number in part_numbers:
+            result = self.generate_presigned_url(s3_key, expiration, 'upload_part',
+                                                 {'UploadId': upload_id, 'PartNumber': number})
+            if not result['success']:
+                return result
+            urls[number] = result['url']
+        return {'success': True, 'urls': urls}
+    
+    def list_parts(self, s3_key, upload_id):
+        """All parts S3 has received for a multipart upload, in part-number order"""
+        try:
+            parts = []
+            kwargs = {'Bucket': self.bucket_name, 'Key': s3_key, 'UploadId': upload_id}
+            while True:
+                response = self.s3_client.list_parts(**kwargs)
+                parts.extend({'PartNumber': p['PartNumber'], 'ETag': p['ETag'], 'Size': p['Size']}
+                             for p in response.get('Parts', []))
+                if not response.get('IsTruncated'):
+                    return {'success': True, 'parts': parts}
+                kwargs['PartNumberMarker'] = response['NextPartNumberMarker']
+        except ClientError as e:
+            return {'success': False, 'error': f'Listing parts failed: {str(e)}'}
+    
+    def complete_multipart_upload(self, s3_key, upload_id, parts):
+        try:
+            response = self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id,
+                MultipartUpload={'Parts': [{'PartNumber': p['PartNumber'], 'ETag': p['ETag']} for p in parts]}
+            )
+            return {'success': True, 'etag': response.get('ETag')}
+        except ClientError as e:
+            return {'success': False, 'error': f'Completing upload failed: {str(e)}'}
+    
+    def abort_multipart_upload(self, s3_key, upload_id):
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id)
+            return {'success': True}
+        except ClientError as e:
+            return {'success': False, 'error': f'Abort failed: {str(e)}'}
+    
+    def head_object(self, s3_key):
+        """Size and ETag of a stored object, or success False if it is missing"""
+        try:
+            response = self.s3_client.head_object(Bucket=self.bucket_name, Key=s3_key)
+            return {'success': True, 'size': response['ContentLength'], 'etag': response.get('ETag')}
+        except ClientError as e:
+            return {'success': False, 'error': f'Object not found: {str(e)}'}
+    
     def check_bucket_exists(self):
         try:
             self.s3_client.head_bucket(Bucket=self.bucket_name)
@@ -88,7 +184,7 @@ class S3Service:
                 )
             return True
         except ClientError as e:
-            print(f"Error creating bucket: {e}")
+            logger.error("Error creating bucket: %s", e)
             return False
     
     def list_files(self, prefix=''):
@@ -104,7 +200,7 @@ class S3Service:
                     })
             return files
         except ClientError as e:
-            print(f"Error listing files: {e}")
+            logger.error("Error listing files: %s", e)
             return []
 
 # S3 service instance
@@ -0,0 +1,237 @@
+import datetime
+import secrets
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+from flask import current_app, session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer, want_bytes
+from config import Config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    sid TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at);
+"""
+
+class LazySession(MutableMapping, SessionMixin):
+    """Session whose row is only read on first access.
+
+    Requests that never touch the session (static assets, blobs, share
+    pages) cost no store I/O at all, and ``modified`` tracks whether the
+    row needs writing back.
+    """
+
+    def __init__(self, store, sid, new=False):
+        self.store = store
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.accessed = False
+        self.expires_at = None
+        self._data = {} if new else None
+
+    def _load(self):
+        self.accessed = True
+        if self._data is None:
+            data, self.expires_at = self.store.load_entry(self.sid)
+            self._data = data or {}
+        return self._data
+
+    def regenerate(self):
+        """Switch to a fresh random id, keeping the data; returns the old id"""
+        self._load()
+        old_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+        return old_sid
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __setitem__(self, key, value):
+        self._load()[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self._load()[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __contains__(self, key):
+        return key in self._load()
+
+    def clear(self):
+        if self._load():
+            self._data.clear()
+            self.modified = True
+
+class SQLiteSessionStore:
+    """Session rows in a WAL-mode SQLite file shared by the host's workers"""
+
+    def __init__(self, path, key_prefix=''):
+        self.path = path
+        self.key_prefix = key_prefix
+        self.serializer = TaggedJSONSerializer()
+        self._local = threading.local()
+        self._initialized = False
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._initialized:
+                conn.executescript(SCHEMA)
+                self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid):
+        return self.load_entry(sid)[0]
+
+    def load_entry(self, sid):
+        """(data, expires_at) of a live session, or (None, None)"""
+        row = self._conn().execute(
+            "SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?",
+            (self.key_prefix + sid, time.time())
+        ).fetchone()
+        return (self.serializer.loads(row[0]), row[1]) if row else (None, None)
+
+    def save(self, sid, data, expires_at):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)",
+            (self.key_prefix + sid, self.serializer.dumps(data), expires_at)
+        )
+
+    def touch(self, sid, expires_at):
+        """Move a session's expiry without rewriting its data"""
+        self._conn().execute("UPDATE sessions SET expires_at = ? WHERE sid = ?", (expires_at, self.key_prefix + sid))
+
+    def delete(self, sid):
+        self._conn().execute("DELETE FROM sessions WHERE sid = ?", (self.key_prefix + sid,))
+
+    def sweep(self, limit=10000):
+        """Delete up to ``limit`` expired sessions; returns the number removed"""
+        cursor = self._conn().execute(
+            "DELETE FROM sessions WHERE sid IN (SELECT sid FROM sessions WHERE expires_at <= ? LIMIT ?)",
+            (time.time(), limit)
+        )
+        return cursor.rowcount
+
+class SQLiteSessionInterface(SessionInterface):
+    """Server-side sessions keyed by a random id kept in the session cookie.
+
+    Rows expire PERMANENT_SESSION_LIFETIME after the last request that used
+    them, whether or not the session is permanent; only permanent sessions
+    (or all, with ``permanent=True``) also get a persistent cookie.
+    Unmodified sessions only have their expiry moved, at most once per
+    REFRESH_INTERVAL, and only with SESSION_REFRESH_EACH_REQUEST.
+    """
+    # Seconds an unmodified session's expiry may lag before it is refreshed
+    REFRESH_INTERVAL = 60
+
+    def __init__(self, store, use_signer=True, permanent=False):
+        self.store = store
+        self.use_signer = use_signer
+        self.permanent = permanent
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='flask-session', key_derivation='hmac')
+
+    def sid_from_cookie(self, app, cookie):
+        """Session id carried by a cookie value, or None if absent or forged"""
+        if not cookie:
+            return None
+        if not self.use_signer:
+            return cookie
+        try:
+            return self._signer(app).unsign(want_bytes(cookie)).decode('utf-8')
+        except BadSignature:
+            return None
+
+    def regenerate(self, session):
+        """Move the session to a new id and delete the old record (see regenerate_session)"""
+        old_sid = session.regenerate()
+        if not session.new:
+            self.store.delete(old_sid)
+
+    def open_session(self, app, request):
+        sid = self.sid_from_cookie(app, request.cookies.get(self.get_cookie_name(app)))
+        if not sid:
+            return LazySession(self.store, secrets.token_urlsafe(32), new=True)
+        return LazySession(self.store, sid)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+        lifetime = app.permanent_session_lifetime
+        expires_at = time.time() + lifetime.total_seconds()
+        if not session.modified:
+            if (session.accessed and session.expires_at is not None
+                    and app.config.get('SESSION_REFRESH_EACH_REQUEST', True)
+                    and session.expires_at < expires_at - self.REFRESH_INTERVAL):
+                self.store.touch(session.sid, expires_at)
+                self._set_cookie(app, session, response, lifetime)
+            return
+
+        if not session:
+            self.store.delete(session.sid)
+            if not session.new:
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app))
+            return
+
+        self.store.save(session.sid, dict(session), expires_at)
+        self._set_cookie(app, session, response, lifetime)
+
+    def _set_cookie(self, app, session, response, lifetime):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        cookie = session.sid
+        if self.use_signer:
+            cookie = self._signer(app).sign(want_bytes(session.sid)).decode('utf-8')
+        expires = self.get_expiration_time(app, session)
+        if self.permanent and expires is None:
+            expires = datetime.datetime.now(datetime.timezone.utc) + lifetime
+        response.set_cookie(name, cookie, expires=expires,
+                            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+# Session store instance
+session_store = SQLiteSessionStore(Config.SESSION_DB, Config.SESSION_KEY_PREFIX)
+
+def regenerate_session():
+    """Give the current session a new id, so an id planted before login never becomes authenticated"""
+    regenerate = getattr(current_app.session_interface, 'regenerate', None)
+    if regenerate is not None:
+        regenerate(session)
+
+def init_app(app):
+    """Install the server-side session backend named by SESSION_TYPE"""
+    session_type = app.config.get('SESSION_TYPE')
+    if session_type == 'sqlite':
+        app.session_interface = SQLiteSessionInterface(session_store,
+                                                       use_signer=app.config.get('SESSION_USE_SIGNER', True),
+                                                       permanent=app.config.get('SESSION_PERMANENT', False))
+    elif session_type:
+        # Any other type ('filesystem', 'redis', ...) is handled by Flask-Session
+        from flask_session import Session
+        Session(app)
@@ -0,0 +1,48 @@
+import time
+from config import Config
+from models.share_model import ShareLink
+from utils.instrumentation import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+SWEPT = metrics.counter('share_sweep_rows_total', 'Rows deleted by the share link expiry sweeper', ('table',))
+SWEEP_LAG = metrics.gauge('share_sweep_lag_seconds',
+                          'How long the oldest share link due for sweeping has been waiting')
+
+def sweep_expired_links(time_budget=None):
+    """Delete share links expired more than SHARE_LINK_RETENTION_DAYS ago, with their analytics.
+
+    Links are taken oldest expiry first along the expiry index,
+    SHARE_SWEEP_BATCH_SIZE at a time. Each link's share_analytics rows go
+    first, in bounded DELETEs, so an interrupted sweep never leaves
+    orphaned analytics. The sweeper pauses SHARE_SWEEP_PAUSE seconds
+    between batches. Returns {'links', 'analytics', 'lag', 'remaining'},
+    where ``remaining`` is True if ``time_budget`` seconds ran out first.
+    """
+    deadline = time.monotonic() + time_budget if time_budget else None
+    swept = {'links': 0, 'analytics': 0, 'remaining': False}
+    while True:
+        link_ids = ShareLink.get_expired_ids(Config.SHARE_LINK_RETENTION_DAYS, Config.SHARE_SWEEP_BATCH_SIZE)
+        if not link_ids:
+            break
+        analytics = ShareLink.delete_analytics(link_ids, Config.SHARE_SWEEP_ANALYTICS_BATCH_SIZE)
+        links = ShareLink.delete_many(link_ids)
+        SWEPT.inc(analytics, table='share_analytics')
+        SWEPT.inc(links, table='shared_links')
+        swept['analytics'] += analytics
+        swept['links'] += links
+
+        if len(link_ids) < Config.SHARE_SWEEP_BATCH_SIZE:
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            swept['remaining'] = True
+            break
+        time.sleep(Config.SHARE_SWEEP_PAUSE)
+
+    swept['lag'] = ShareLink.expiry_lag(Config.SHARE_LINK_RETENTION_DAYS)
+    SWEEP_LAG.set(swept['lag'])
+    if swept['links'] or swept['lag']:
+        logger.info("Swept %d expired share links and %d analytics rows; lag %ss",
+                    swept['links'], swept['analytics'], swept['lag'])
+    return swept
@@ -0,0 +1,404 @@
+import hashlib
+import hmac
+import os
+import shutil
+import time
+import uuid
+from urllib.parse import quote, urlencode
+from botocore.exceptions import ClientError
+from config import Config
+from utils.s3_service import s3_service
+from utils.blob_cache import blob_cache
+
+CHUNK_SIZE = 1024 * 1024
+
+# Storage tiers, warmest first
+TIERS = ('standard', 'infrequent', 'archive')
+
+# S3 objects larger than this cannot be copied with a single CopyObject call
+MAX_COPY_SIZE = 5 * 1024 ** 3
+
+class StorageBackend:
+    """Interface shared by every blob store.
+
+    Keys are opaque strings chosen by ``make_key``; the prefix of a key tells
+    ``backend_for_key`` which backend owns it. Mutating calls return result
+    dicts in the same shape as ``S3Service`` ({'success': ..., 'error': ...}).
+    """
+    name = None
+    tiers = ('standard',)  # Tiers this backend can hold objects in
+    restore_tiers = ()  # Tiers whose objects must be restored before they can be read
+
+    def make_key(self, user_id, file_name):
+        raise NotImplementedError
+
+    def make_chunk_key(self, digest):
+        """Key for a chunk-store block; unique per write so a re-stored chunk never reuses a collected key"""
+        raise NotImplementedError
+
+    def put_stream(self, key, stream, content_type='application/octet-stream'):
+        """Store the contents of a file-like object under ``key``"""
+        raise NotImplementedError
+
+    def put_file(self, key, path, content_type='application/octet-stream'):
+        with open(path, 'rb') as f:
+            return self.put_stream(key, f, content_type)
+
+    def get_range(self, key, start=0, end=None):
+        """Return bytes ``start`` through ``end`` (inclusive, None for EOF), or None if missing"""
+        raise NotImplementedError
+
+    def fetch_range(self, key, start=0, end=None):
+        """Like ``get_range``, but never through a cache; for one-pass reads of a whole object"""
+        return self.get_range(key, start, end)
+
+    def delete_many(self, keys):
+        """Delete keys in as few round trips as possible"""
+        raise NotImplementedError
+
+    def head(self, key):
+        """Return {'size': ..., 'last_modified': ...} or None if the object does not exist"""
+        raise NotImplementedError
+
+    def presign(self, key, expiration=3600, download_name=None, content_encoding=None):
+        """Return a time-limited URL for reading ``key``.
+
+        ``content_encoding`` makes the response declare that encoding, so a
+        client that accepts it decodes a compressed blob itself.
+        """
+        raise NotImplementedError
+
+    def public_url(self, key):
+        """Stable (unsigned) URL recorded in files.s3_url"""
+        raise NotImplementedError
+
+    def set_tier(self, key, tier):
+        """Move an object to another of ``tiers`` without changing its key or bytes"""
+        raise NotImplementedError
+
+    def restore_status(self, key):
+        """'available', 'restoring' or 'archived' (needs ``request_restore``), or None if missing"""
+        return 'available' if self.head(key) is not None else None
+
+    def request_restore(self, key, days):
+        return {'success': True}
+
+class S3Backend(StorageBackend):
+    name = 's3'
+    tiers = TIERS
+
+    def __init__(self, service=None, cache=None):
+        self.service = service or s3_service
+        self.cache = cache
+        self.storage_classes = {
+            'standard': 'STANDARD',
+            'infrequent': Config.TIER_INFREQUENT_CLASS,
+            'archive': Config.TIER_ARCHIVE_CLASS,
+        }
+        # GLACIER_IR is read instantly; the other archive classes need a restore first
+        self.restore_tiers = ('archive',) if Config.TIER_ARCHIVE_CLASS in ('GLACIER', 'DEEP_ARCHIVE') else ()
+
+    @property
+    def client(self):
+        return self.service.s3_client
+
+    @property
+    def bucket(self):
+        return self.service.bucket_name
+
+    def make_key(self, user_id, file_name):
+        file_extension = os.path.splitext(file_name)[1]
+        return f"uploads/{user_id}/{user_id}_{uuid.uuid4().hex}{file_extension}"
+
+    def make_chunk_key(self, digest):
+        return f"chunks/{digest[:2]}/{digest}-{uuid.uuid4().hex[:8]}"
+
+    def put_stream(self, key, stream, content_type='application/octet-stream'):
+        try:
+            self.client.upload_fileobj(stream, self.bucket, key, ExtraArgs={'ContentType': content_type})
+            return {'success': True, 'key': key}
+        except Exception as e:
+            return {'success': False, 'error': f'Upload failed: {str(e)}'}
+
+    def get_range(self, key, start=0, end=None):
+        if self.cache is not None:
+            return self.cache.read(self, key, start, end)
+        return self.fetch_range(key, start, end)
+
+    def fetch_range(self, key, start=0, end=None):
+        """Ranged GET straight from the bucket, bypassing the cache"""
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key, Range=byte_range)
+            return response['Body'].read()
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404', 'InvalidRange'):
+                return None
+            raise
+
+    def delete_many(self, keys):
+        deleted, errors = [], []
+        keys = list(keys)
+        # DeleteObjects accepts at most 1000 keys per request
+        for i in range(0, len(keys), 1000):
+            batch = keys[i:i + 1000]
+            try:
+                response = self.client.delete_objects(
+                    Bucket=self.bucket,
+                    Delete={'Objects': [{'Key': k} for k in batch], 'Quiet': True}
+                )
+                failed = {err['Key']: err.get('Message', err.get('Code')) for err in response.get('Errors', [])}
+                deleted.extend(k for k in batch if k not in failed)
+                errors.extend({'key': k, 'error': msg} for k, msg in failed.items())
+            except Exception as e:
+                errors.extend({'key': k, 'error': str(e)} for k in batch)
+        if self.cache is not None:
+            for key in deleted:
+                self.cache.discard(key)
+        return {'success': not errors, 'deleted': deleted, 'errors': errors}
+
+    def head(self, key):
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404', 'NotFound'):
+                return None
+            raise
+        return {'size': response['ContentLength'], 'last_modified': response.get('LastModified')}
+
+    def presign(self, key, expiration=3600, download_name=None, content_encoding=None):
+        params = {'Bucket': self.bucket, 'Key': key}
+        if download_name:
+            params['ResponseContentDisposition'] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+        if content_encoding:
+            params['ResponseContentEncoding'] = content_encoding
+            params['ResponseContentType'] = 'application/octet-stream'
+        try:
+            url = self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=expiration)
+            return {'success': True, 'url': url}
+        except ClientError as e:
+            return {'success': False, 'error': f'URL generation failed: {str(e)}'}
+
+    def public_url(self, key):
+        return f"https://{self.bucket}.s3.{Config.AWS_REGION}.amazonaws.com/{key}"
+
+    def set_tier(self, key, tier):
+        """Change the object's storage class by copying it onto itself"""
+        storage_class = self.storage_classes[tier]
+        source = {'Bucket': self.bucket, 'Key': key}
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+            if head.get('StorageClass', 'STANDARD') == storage_class:
+                return {'success': True}
+            if head['ContentLength'] <= MAX_COPY_SIZE:
+                self.client.copy_object(Bucket=self.bucket, Key=key, CopySource=source,
+                                        StorageClass=storage_class, MetadataDirective='COPY')
+            else:
+                # Managed multipart copy; it does not carry metadata over by itself
+                extra = {'StorageClass': storage_class, 'ContentType': head.get('ContentType'),
+                         'Metadata': head.get('Metadata', {})}
+                self.client.copy(source, self.bucket, key, ExtraArgs=extra)
+            return {'success': True}
+        except ClientError as e:
+            return {'success': False, 'error': f'Storage class change failed: {str(e)}'}
+
+    def restore_status(self, key):
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404', 'NotFound'):
+                return None
+            raise
+        if head.get('StorageClass') not in ('GLACIER', 'DEEP_ARCHIVE'):
+            return 'available'
+        # Restore is absent until requested, then 'ongoing-request="true"' until the copy is readable
+        restore = head.get('Restore')
+        if restore is None:
+            return 'archived'
+        return 'restoring' if 'ongoing-request="true"' in restore else 'available'
+
+    def request_restore(self, key, days):
+        """Start a temporary restore of an archived object; already-running restores count as success"""
+        try:
+            self.client.restore_object(Bucket=self.bucket, Key=key, RestoreRequest={
+                'Days': days, 'GlacierJobParameters': {'Tier': Config.TIER_RESTORE_SPEED}})
+            return {'success': True}
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'RestoreAlreadyInProgress':
+                return {'success': True}
+            return {'success': False, 'error': f'Restore request failed: {str(e)}'}
+
+class LocalBackend(StorageBackend):
+    """Sharded local-filesystem store.
+
+    New keys look like ``local/<user_id>/ab/cd/<uuid><ext>``: two levels of
+    fan-out keep directories small. Writes go to a temp file in the target
+    directory and are renamed into place, so readers never see partial
+    files. ``fsync`` is one of 'always' (file and directory), 'file' or 'never'.
+    Legacy keys (``local/<filename>``) resolve to the old static/uploads folder.
+
+    With a ``cold_root``, archived objects live under the same relative path
+    there instead; reads look in the main root first, then the cold one.
+    """
+    name = 'local'
+    prefix = 'local/'
+
+    def __init__(self, root=None, legacy_root='static/uploads', fsync='file', url_prefix='/blob/', cold_root=None):
+        self.root = root or Config.LOCAL_STORAGE_ROOT
+        self.legacy_root = legacy_root
+        self.fsync = fsync
+        self.url_prefix = url_prefix
+        self.cold_root = cold_root
+        self.tiers = ('standard', 'archive') if cold_root else ('standard',)
+
+    def make_key(self, user_id, file_name):
+        file_extension = os.path.splitext(file_name)[1]
+        name = uuid.uuid4().hex
+        return f"{self.prefix}{user_id}/{name[:2]}/{name[2:4]}/{name}{file_extension}"
+
+    def make_chunk_key(self, digest):
+        return f"{self.prefix}chunks/{digest[:2]}/{digest[2:4]}/{digest}-{uuid.uuid4().hex[:8]}"
+
+    def path_for(self, key, cold=False):
+        relative = key[len(self.prefix):] if key.startswith(self.prefix) else key
+        if '/' not in relative:
+            root = self.legacy_root
+        else:
+            root = self.cold_root if cold else self.root
+        root = os.path.abspath(root)
+        path = os.path.abspath(os.path.join(root, relative))
+        # Keys must never escape the storage root
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError(f'Invalid storage key: {key}')
+        return path
+
+    def put_stream(self, key, stream, content_type='application/octet-stream'):
+        path = self.path_for(key)
+        directory = os.path.dirname(path)
+        temp_path = os.path.join(directory, f".tmp-{uuid.uuid4().hex}")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(temp_path, 'wb') as out:
+                shutil.copyfileobj(stream, out, CHUNK_SIZE)
+                if self.fsync in ('always', 'file'):
+                    out.flush()
+                    os.fsync(out.fileno())
+            os.replace(temp_path, path)
+            if self.fsync == 'always' and hasattr(os, 'O_DIRECTORY'):
+                dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+            return {'success': True, 'key': key}
+        except Exception as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return {'success': False, 'error': f'Local write failed: {str(e)}'}
+
+    def locate(self, key):
+        """Path currently holding ``key``: the main root, else the cold root if the object is there"""
+        path = self.path_for(key)
+        if self.cold_root and not os.path.exists(path):
+            cold_path = self.path_for(key, cold=True)
+            if os.path.exists(cold_path):
+                return cold_path
+        return path
+
+    def get_range(self, key, start=0, end=None):
+        try:
+            with open(self.locate(key), 'rb') as f:
+                f.seek(start)
+                return f.read() if end is None else f.read(end - start + 1)
+        except FileNotFoundError:
+            return None
+
+    def delete_many(self, keys):
+        deleted, errors = [], []
+        for key in keys:
+            try:
+                os.remove(self.locate(key))
+                deleted.append(key)
+            except FileNotFoundError:
+                deleted.append(key)
+            except Exception as e:
+                errors.append({'key': key, 'error': str(e)})
+        return {'success': not errors, 'deleted': deleted, 'errors': errors}
+
+    def head(self, key):
+        try:
+            stat = os.stat(self.locate(key))
+        except FileNotFoundError:
+            return None
+        return {'size': stat.st_size, 'last_modified': stat.st_mtime}
+
+    def sign(self, key, expires, download_name='', content_encoding=''):
+        message = f"{key}\n{expires}\n{download_name}"
+        if content_encoding:
+            message += f"\n{content_encoding}"
+        return hmac.new(Config.SECRET_KEY.encode('utf-8'), message.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    def verify(self, key, expires, download_name, signature, content_encoding=''):
+        try:
+            if int(expires) < time.time():
+                return False
+        except (TypeError, ValueError):
+            return False
+        expected = self.sign(key, expires, download_name or '', content_encoding or '')
+        return hmac.compare_digest(expected, signature or '')
+
+    def presign(self, key, expiration=3600, download_name=None, content_encoding=None):
+        expires = int(time.time()) + expiration
+        params = {'expires': expires, 'sig': self.sign(key, expires, download_name or '', content_encoding or '')}
+        if download_name:
+            params['name'] = download_name
+        if content_encoding:
+            params['enc'] = content_encoding
+        return {'success': True, 'url': f"{self.url_prefix}{quote(key)}?{urlencode(params)}"}
+
+    def public_url(self, key):
+        return f"{self.url_prefix}{quote(key)}"
+
+    def set_tier(self, key, tier):
+        """Move an object between the main and cold roots"""
+        if tier not in self.tiers:
+            return {'success': False, 'error': f'Unsupported tier: {tier}'}
+        source = self.locate(key)
+        target = self.path_for(key, cold=tier != 'standard')
+        if source == target:
+            return {'success': True}
+        temp_path = os.path.join(os.path.dirname(target), f".tmp-{uuid.uuid4().hex}")
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.rename(source, target)
+            except OSError:
+                # Different filesystems: copy next to the target, rename into place, then drop the source
+                shutil.copyfile(source, temp_path)
+                os.replace(temp_path, target)
+                os.remove(source)
+            return {'success': True}
+        except Exception as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return {'success': False, 'error': f'Local move failed: {str(e)}'}
+
+_backends = {}
+
+def get_backend(name=None):
+    """Return the backend called ``name`` (default: the deployment's STORAGE_BACKEND)"""
+    name = name or Config.STORAGE_BACKEND
+    if name not in _backends:
+        if name == 's3':
+            _backends[name] = S3Backend(cache=blob_cache if Config.BLOB_CACHE_MAX_BYTES > 0 else None)
+        elif name == 'local':
+            _backends[name] = LocalBackend(fsync=Config.LOCAL_STORAGE_FSYNC, cold_root=Config.LOCAL_COLD_STORAGE_ROOT)
+        else:
+            raise ValueError(f'Unknown storage backend: {name}')
+    return _backends[name]
+
+def backend_for_key(key):
+    """Return the backend that owns an existing key"""
+    if key.startswith(LocalBackend.prefix):
+        return get_backend('local')
+    return get_backend('s3')
@@ -0,0 +1,214 @@
+import os
+import time
+from config import Config
+from models.analytics_model import StorageStats
+from models.change_model import ChangeLog
+from models.file_model import File
+from models.folder_model import FolderStats
+from models.user_model import User
+from models.upload_model import UploadBatch, DirectUpload
+from utils.job_queue import job_queue, PRIORITY_LOW
+from utils.upload_service import store_uploaded_file
+from utils.direct_upload import abort_direct_upload, direct_uploads_enabled
+from utils.rate_limit import rate_limiter, SQLiteBucketStore
+from utils.sessions import session_store
+from utils.storage import backend_for_key
+from utils.tiering import run_tiering_pass
+from utils.versioning import snapshot_version
+from utils.chunk_store import collect_garbage
+from utils.trash import run_purge_pass
+from utils.share_expiry import sweep_expired_links
+from utils.analytics_storage import maintain_analytics
+import logging
+
+logger = logging.getLogger(__name__)
+
+@job_queue.handler('sweep_expired_links')
+def sweep_expired_links_job(payload):
+    """Sweep expired share links, continuing in a follow-up job when the time budget runs out"""
+    if sweep_expired_links(Config.SHARE_SWEEP_TIME_BUDGET)['remaining']:
+        # Keyed per hand-off: this job is still running and would dedupe a fixed key
+        handoff = (payload or {}).get('handoff', 0) + 1
+        job_queue.enqueue('sweep_expired_links', {'handoff': handoff}, priority=PRIORITY_LOW,
+                          dedupe_key=f"sweep_expired_links:{handoff}")
+
+@job_queue.handler('cleanup_temp_uploads')
+def cleanup_temp_uploads(payload):
+    """Remove files left behind in the temp upload folder by interrupted uploads"""
+    temp_dir = Config.UPLOAD_FOLDER
+    if not os.path.isdir(temp_dir):
+        return
+    cutoff = time.time() - Config.TEMP_UPLOAD_MAX_AGE
+    for entry in os.scandir(temp_dir):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+@job_queue.handler('reconcile_storage')
+def reconcile_storage(payload):
+    """Recompute storage and folder aggregates for one user, or fan out over all users"""
+    user_id = (payload or {}).get('user_id')
+    if user_id is not None:
+        StorageStats.update_user_storage(user_id)
+        FolderStats.rebuild(user_id)
+        return
+    
+    last_id = 0
+    while True:
+        user_ids = User.get_ids_after(last_id, 500)
+        if not user_ids:
+            break
+        for uid in user_ids:
+            job_queue.enqueue('reconcile_storage', {'user_id': uid},
+                              priority=PRIORITY_LOW, dedupe_key=f"reconcile:{uid}")
+        last_id = user_ids[-1]
+
+@job_queue.handler('process_upload_batch', max_attempts=3)
+def process_upload_batch(payload):
+    """Store the files of an upload accepted in async mode, one item at a time"""
+    batch = UploadBatch.get_by_id(payload['batch_id'])
+    if not batch:
+        return
+    
+    stored = 0
+    for item in UploadBatch.get_items(batch['id']):
+        # Items finished by an earlier attempt are skipped on retry
+        if item['status'] in ('done', 'failed'):
+            continue
+        if item['status'] == 'processing' and item['s3_key']:
+            # An earlier attempt died mid-item: it either recorded the blob or left it orphaned
+            recorded = File.get_by_s3_key(item['s3_key'])
+            if recorded:
+                UploadBatch.set_item_status(item['id'], 'done', file_id=recorded['id'])
+                if os.path.exists(item['temp_path']):
+                    os.remove(item['temp_path'])
+                stored += 1
+                continue
+            backend_for_key(item['s3_key']).delete_many([item['s3_key']])
+        if not os.path.exists(item['temp_path']):
+            UploadBatch.set_item_status(item['id'], 'failed', error='Upload data is no longer available')
+            continue
+        
+        UploadBatch.set_item_status(item['id'], 'processing')
+        try:
+            new_file = store_uploaded_file(item['temp_path'], item['file_name'], item['file_size'],
+                                           batch['user_id'], batch['folder_id'],
+                                           on_stored=lambda key: UploadBatch.set_item_key(item['id'], key))
+        except Exception as e:
+            logger.error("Error processing file %s: %s", item['file_name'], e)
+            new_file = None
+        
+        if new_file:
+            UploadBatch.set_item_status(item['id'], 'done', file_id=new_file.id)
+            stored += 1
+        else:
+            UploadBatch.set_item_status(item['id'], 'failed', error='Failed to store file')
+    
+    if stored:
+        job_queue.enqueue('reconcile_storage', {'user_id': batch['user_id']}, priority=PRIORITY_LOW,
+                          delay=30, dedupe_key=f"reconcile:{batch['user_id']}")
+
+@job_queue.handler('prune_upload_batches')
+def prune_upload_batches(payload):
+    UploadBatch.delete_finished(Config.UPLOAD_BATCH_RETENTION_HOURS)
+
+@job_queue.handler('prune_jobs')
+def prune_jobs(payload):
+    job_queue.prune(Config.JOB_QUEUE_RETENTION)
+
+@job_queue.handler('prune_rate_limits')
+def prune_rate_limits(payload):
+    if isinstance(rate_limiter.store, SQLiteBucketStore):
+        rate_limiter.store.prune()
+
+@job_queue.handler('prune_changes')
+def prune_changes(payload):
+    ChangeLog.prune(Config.CHANGES_RETENTION_DAYS)
+
+@job_queue.handler('sweep_sessions')
+def sweep_sessions(payload):
+    # Delete in bounded batches so one sweep never holds the write lock for long
+    while session_store.sweep(limit=5000) == 5000:
+        pass
+
+@job_queue.handler('abort_abandoned_uploads')
+def abort_abandoned_uploads(payload):
+    """Abort direct uploads the browser never completed, freeing their stored parts"""
+    for upload in DirectUpload.get_abandoned(Config.DIRECT_UPLOAD_ABANDON_HOURS):
+        abort_direct_upload(upload)
+
+@job_queue.handler('tier_storage')
+def tier_storage(payload):
+    """Move cold files to cheaper tiers, continuing in a follow-up job when the time budget runs out"""
+    last_id = run_tiering_pass((payload or {}).get('after_id', 0), Config.TIERING_TIME_BUDGET)
+    if last_id is not None:
+        job_queue.enqueue('tier_storage', {'after_id': last_id}, priority=PRIORITY_LOW,
+                          dedupe_key=f"tier_storage:{last_id}")
+
+@job_queue.handler('complete_restore', max_attempts=48)
+def complete_restore(payload):
+    """Bring a file whose archive restore was requested back to standard once it is readable"""
+    file_row = File.get_by_id(payload['file_id'])
+    if not file_row or file_row['storage_tier'] != 'archive':
+        return
+    backend = backend_for_key(file_row['s3_key'])
+    state = backend.restore_status(file_row['s3_key'])
+    if state == 'restoring':
+        # Retried with the queue's backoff until the restore finishes
+        raise RuntimeError('Restore still in progress')
+    if state != 'available':
+        return
+    result = backend.set_tier(file_row['s3_key'], 'standard')
+    if not result['success']:
+        raise RuntimeError(result['error'])
+    File.set_tier([file_row['id']], 'standard')
+
+@job_queue.handler('purge_trash')
+def purge_trash(payload):
+    """Delete expired trash, continuing in a follow-up job when the time budget runs out"""
+    last_id = run_purge_pass((payload or {}).get('after_id', 0), Config.TRASH_PURGE_TIME_BUDGET)
+    if last_id is not None:
+        job_queue.enqueue('purge_trash', {'after_id': last_id}, priority=PRIORITY_LOW,
+                          dedupe_key=f"purge_trash:{last_id}")
+
+@job_queue.handler('maintain_analytics')
+def maintain_analytics_job(payload):
+    """Partition, compact and expire analytics, continuing in a follow-up job when the time budget runs out"""
+    if maintain_analytics(Config.ANALYTICS_MAINTENANCE_TIME_BUDGET):
+        # Keyed per hand-off: this job is still running and would dedupe a fixed key
+        handoff = (payload or {}).get('handoff', 0) + 1
+        job_queue.enqueue('maintain_analytics', {'handoff': handoff}, priority=PRIORITY_LOW,
+                          dedupe_key=f"maintain_analytics:{handoff}")
+
+@job_queue.handler('snapshot_version', max_attempts=48)
+def snapshot_version_job(payload):
+    """Move a replaced version's blob into the chunk store"""
+    snapshot_version(payload['version_id'])
+
+@job_queue.handler('collect_chunks')
+def collect_chunks(payload):
+    """Delete chunks no version has referenced for CHUNK_GC_GRACE_HOURS"""
+    while collect_garbage(Config.CHUNK_GC_GRACE_HOURS, batch_size=1000) == 1000:
+        pass
+
+def register_schedules():
+    job_queue.schedule('sweep_expired_links', Config.SHARE_SWEEP_INTERVAL)
+    job_queue.schedule('cleanup_temp_uploads', Config.TEMP_UPLOAD_CLEANUP_INTERVAL)
+    job_queue.schedule('reconcile_storage', Config.STORAGE_RECONCILE_INTERVAL)
+    job_queue.schedule('prune_jobs', Config.JOB_QUEUE_RETENTION)
+    job_queue.schedule('prune_upload_batches', 3600)
+    job_queue.schedule('prune_changes', Config.CHANGES_PRUNE_INTERVAL)
+    job_queue.schedule('collect_chunks', Config.CHUNK_GC_INTERVAL)
+    job_queue.schedule('purge_trash', Config.TRASH_PURGE_INTERVAL)
+    if Config.TIERING_ENABLED:
+        job_queue.schedule('tier_storage', Config.TIERING_INTERVAL)
+    if Config.ANALYTICS_PARTITIONING:
+        job_queue.schedule('maintain_analytics', Config.ANALYTICS_MAINTENANCE_INTERVAL)
+    if direct_uploads_enabled():
+        job_queue.schedule('abort_abandoned_uploads', Config.DIRECT_UPLOAD_SWEEP_INTERVAL)
+    if Config.SESSION_TYPE == 'sqlite':
+        job_queue.schedule('sweep_sessions', Config.SESSION_SWEEP_INTERVAL)
+    if Config.RATE_LIMIT_STORE == 'sqlite':
+        job_queue.schedule('prune_rate_limits', 3600)
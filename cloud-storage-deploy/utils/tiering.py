@@ -0,0 +1,109 @@
+import datetime
+import time
+from config import Config
+from models.file_model import File
+from utils.instrumentation import metrics
+from utils.job_queue import job_queue, PRIORITY_LOW
+from utils.storage import TIERS, backend_for_key
+import logging
+
+logger = logging.getLogger(__name__)
+
+TIER_ORDER = {tier: i for i, tier in enumerate(TIERS)}
+
+TIER_MOVES = metrics.counter('storage_tier_moves_total', 'Blobs moved between storage tiers', ('tier', 'result'))
+RESTORES = metrics.counter('storage_tier_restores_total', 'Reads of archived blobs by restore state', ('state',))
+
+def plan_tier(row, backend, now):
+    """Tier a file from ``File.get_tiering_batch`` should move to, or None to leave it.
+
+    Files idle past TIER_INFREQUENT_DAYS or TIER_ARCHIVE_DAYS go colder.
+    A colder file only comes back to standard after TIER_HOT_ACCESSES recent
+    accesses, so a single read does not pay for two moves. Archived objects
+    that need a restore are promoted by ``complete_restore`` instead.
+    """
+    current = row['storage_tier'] or 'standard'
+    if row['tier_changed_at'] and now - row['tier_changed_at'] < datetime.timedelta(days=Config.TIER_MIN_RESIDENCY_DAYS):
+        return None
+    hot = row['recent_accesses'] >= Config.TIER_HOT_ACCESSES
+    if hot:
+        target = 'standard'
+    elif (row['file_size'] or 0) < Config.TIER_MIN_SIZE:
+        return None
+    else:
+        idle = now - row['last_access']
+        if idle >= datetime.timedelta(days=Config.TIER_ARCHIVE_DAYS):
+            target = 'archive'
+        elif idle >= datetime.timedelta(days=Config.TIER_INFREQUENT_DAYS):
+            target = 'infrequent'
+        else:
+            target = 'standard'
+
+    if TIER_ORDER[target] < TIER_ORDER.get(current, 0) and (not hot or current in backend.restore_tiers):
+        return None
+    # Backends without the target tier use the nearest warmer one they have
+    target = max((t for t in backend.tiers if TIER_ORDER[t] <= TIER_ORDER[target]), key=TIER_ORDER.get)
+    return target if target != current else None
+
+def run_tiering_pass(after_id=0, time_budget=None):
+    """Move files after ``after_id`` to the tier their access history calls for.
+
+    Files are examined in id order, TIERING_BATCH_SIZE at a time, and each
+    batch's moves are recorded with one UPDATE per tier. Returns the last id
+    examined if ``time_budget`` seconds ran out first, else None.
+    """
+    deadline = time.monotonic() + time_budget if time_budget else None
+    while True:
+        rows = File.get_tiering_batch(after_id, Config.TIERING_BATCH_SIZE, Config.TIER_INFREQUENT_DAYS)
+        if not rows:
+            return None
+        now = datetime.datetime.now()
+        moved = {}
+        for row in rows:
+            backend = backend_for_key(row['s3_key'])
+            tier = plan_tier(row, backend, now)
+            if tier is None:
+                continue
+            result = backend.set_tier(row['s3_key'], tier)
+            if result['success']:
+                moved.setdefault(tier, []).append(row['id'])
+                TIER_MOVES.inc(tier=tier, result='moved')
+            else:
+                logger.warning("Tiering file %s to %s failed: %s", row['id'], tier, result['error'])
+                TIER_MOVES.inc(tier=tier, result='failed')
+        for tier, file_ids in moved.items():
+            File.set_tier(file_ids, tier)
+
+        after_id = rows[-1]['id']
+        if len(rows) < Config.TIERING_BATCH_SIZE:
+            return None
+        if deadline is not None and time.monotonic() >= deadline:
+            return after_id
+
+def ensure_available(file_row):
+    """None if a file's blob can be read now, else the seconds until it should be.
+
+    Reading an archived object that needs a restore starts one (unless it is
+    already running) and queues ``complete_restore`` to bring the file back
+    to standard once the restored copy is readable.
+    """
+    tier = file_row.get('storage_tier') or 'standard'
+    backend = backend_for_key(file_row['s3_key'])
+    if tier not in backend.restore_tiers:
+        return None
+    state = backend.restore_status(file_row['s3_key'])
+    RESTORES.inc(state=state or 'missing')
+    if state in (None, 'available'):
+        return None
+    if state == 'archived':
+        result = backend.request_restore(file_row['s3_key'], Config.TIER_RESTORE_DAYS)
+        if not result['success']:
+            logger.error("Restore of file %s failed: %s", file_row['id'], result['error'])
+    job_queue.enqueue('complete_restore', {'file_id': file_row['id']}, priority=PRIORITY_LOW,
+                      delay=Config.TIER_RESTORE_POLL_INTERVAL, dedupe_key=f"restore:{file_row['id']}")
+    return Config.TIER_RESTORE_ETA
+
+def restoring_message(retry_after):
+    hours = max(1, round(retry_after / 3600))
+    return (f'This file is being restored from archive storage. '
+            f'Try again in about {hours} hour{"s" if hours != 1 else ""}.')
@@ -0,0 +1,52 @@
+import time
+from config import Config
+from models.file_model import File
+from utils.instrumentation import metrics
+from utils.storage import backend_for_key
+from utils.versioning import discard_versions
+import logging
+
+logger = logging.getLogger(__name__)
+
+PURGED = metrics.counter('trash_purged_total', 'Trashed files purged, by result', ('result',))
+
+def run_purge_pass(after_id=0, time_budget=None):
+    """Permanently delete files trashed more than TRASH_RETENTION_DAYS ago.
+
+    Files are taken in id order, TRASH_PURGE_BATCH_SIZE at a time. Each batch's
+    blobs go in one DeleteObjects call per backend, then the rows whose blobs
+    are gone are deleted in chunks, and the purger pauses TRASH_PURGE_PAUSE
+    seconds before the next batch. Files whose blobs could not be deleted
+    stay in the trash for the next pass. Returns the last id examined if
+    ``time_budget`` seconds ran out first, else None.
+    """
+    deadline = time.monotonic() + time_budget if time_budget else None
+    while True:
+        rows = File.get_purge_batch(after_id, Config.TRASH_RETENTION_DAYS, Config.TRASH_PURGE_BATCH_SIZE)
+        if not rows:
+            return None
+
+        by_backend = {}
+        for row in rows:
+            by_backend.setdefault(backend_for_key(row['s3_key']), []).append(row)
+        purged = []
+        for backend, batch in by_backend.items():
+            result = backend.delete_many([row['s3_key'] for row in batch])
+            deleted = set(result['deleted'])
+            purged.extend(row['id'] for row in batch if row['s3_key'] in deleted)
+            for error in result['errors']:
+                logger.warning("Failed to delete blob %s from the trash: %s", error['key'], error['error'])
+            PURGED.inc(len(result['errors']), result='failed')
+
+        if purged:
+            if not File.purge(purged, Config.TRASH_DELETE_CHUNK_SIZE):
+                raise RuntimeError('Failed to delete purged file rows')
+            discard_versions(purged)
+            PURGED.inc(len(purged), result='purged')
+
+        after_id = rows[-1]['id']
+        if len(rows) < Config.TRASH_PURGE_BATCH_SIZE:
+            return None
+        if deadline is not None and time.monotonic() >= deadline:
+            return after_id
+        time.sleep(Config.TRASH_PURGE_PAUSE)
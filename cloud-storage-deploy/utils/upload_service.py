@@ -0,0 +1,131 @@
+import os
+import uuid
+from werkzeug.utils import secure_filename
+from config import Config
+from models.file_model import File
+from utils.storage import get_backend
+from utils.codec import choose_codec, encode_file
+from utils.versioning import find_replaced, replace_content, iter_version
+import logging
+
+logger = logging.getLogger(__name__)
+
+def save_temp_upload(file):
+    """Save an incoming upload under a unique temp name.
+    
+    Returns (filename, temp_path, file_size). The unique prefix keeps
+    concurrent uploads of the same filename from overwriting each other.
+    """
+    filename = secure_filename(file.filename)
+    temp_dir = Config.UPLOAD_FOLDER
+    if not os.path.exists(temp_dir):
+        os.makedirs(temp_dir)
+        logger.debug("Created temp directory: %s", temp_dir)
+    
+    # Get file size before saving
+    file.seek(0, os.SEEK_END)
+    file_size = file.tell()
+    file.seek(0)  # Reset file pointer
+    
+    temp_path = os.path.join(temp_dir, f"{uuid.uuid4().hex}_{filename}")
+    try:
+        file.save(temp_path)
+    except Exception:
+        discard_temp_upload(temp_path)
+        raise
+    logger.debug("Saved file temporarily to: %s", temp_path)
+    return filename, temp_path, file_size
+
+def discard_temp_upload(temp_path):
+    """Remove a temp upload if it is still there"""
+    try:
+        os.remove(temp_path)
+    except FileNotFoundError:
+        pass
+
+def put_with_fallback(temp_path, filename, user_id, content_type='application/octet-stream'):
+    """Write a file to the deployment's backend, falling back to local storage.
+    
+    Returns (backend, key) or (None, None) when every backend failed.
+    """
+    backends = [get_backend()]
+    if backends[0].name != 'local':
+        backends.append(get_backend('local'))
+    
+    for backend in backends:
+        key = backend.make_key(user_id, filename)
+        logger.debug("Attempting %s upload for %s", backend.name, filename)
+        result = backend.put_file(key, temp_path, content_type)
+        if result['success']:
+            return backend, key
+        logger.warning("%s upload failed for %s: %s", backend.name, filename, result['error'])
+    return None, None
+
+def store_uploaded_file(temp_path, filename, file_size, user_id, folder_id, replaces=None, on_stored=None):
+    """Move a saved temp file into storage and record it in the database.
+    
+    A file with the same name already in the folder (or ``replaces``, a
+    files row) gets the upload as its new version instead of a duplicate.
+    ``on_stored`` is called with the blob's key after the write and before
+    the database entry. The temp file is removed once the file has been
+    recorded. Returns the new or updated File, or None on failure.
+    """
+    # Compressible files are stored zstd-encoded; file_size stays the original size
+    codec = choose_codec(temp_path, filename)
+    if codec is None:
+        backend, key = put_with_fallback(temp_path, filename, user_id)
+    else:
+        encoded_path = encode_file(temp_path, codec)
+        try:
+            backend, key = put_with_fallback(encoded_path, filename, user_id, 'application/zstd')
+        finally:
+            os.remove(encoded_path)
+    if backend is None:
+        return None
+    if on_stored is not None:
+        on_stored(key)
+    
+    if replaces is None:
+        replaces = find_replaced(user_id, folder_id, filename)
+    if replaces is not None:
+        new_file = replace_content(replaces, key, backend.public_url(key), codec, file_size)
+    else:
+        new_file = File(
+            user_id=user_id,
+            file_name=filename,
+            file_size=file_size,
+            folder_id=folder_id,
+            s3_key=key,
+            s3_url=backend.public_url(key),
+            codec=codec
+        )
+        if not new_file.create():
+            new_file = None
+    if new_file is None:
+        logger.error("Failed to create database entry for %s", filename)
+        backend.delete_many([key])
+        return None
+    logger.debug("Database entry created for %s", filename)
+    
+    discard_temp_upload(temp_path)
+    return new_file
+
+def restore_version(file_row, version):
+    """Make a stored version the file's current content again, as a new version.
+    
+    The version is reassembled into a temp file and stored like an upload,
+    so the content it replaces is kept as a version too. Returns the
+    updated File, or None on failure.
+    """
+    temp_dir = Config.UPLOAD_FOLDER
+    os.makedirs(temp_dir, exist_ok=True)
+    temp_path = os.path.join(temp_dir, f"{uuid.uuid4().hex}_{file_row['file_name']}")
+    try:
+        with open(temp_path, 'wb') as out:
+            for data in iter_version(version):
+                out.write(data)
+        return store_uploaded_file(temp_path, file_row['file_name'], version['file_size'],
+                                   file_row['user_id'], file_row['folder_id'], replaces=file_row)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
@@ -0,0 +1,115 @@
+from urllib.parse import quote
+from flask import Response
+from config import Config
+from models.file_model import File
+from models.version_model import FileVersion
+from utils import chunk_store
+from utils.codec import iter_decoded
+from utils.job_queue import job_queue, PRIORITY_LOW
+from utils.storage import backend_for_key
+import logging
+
+logger = logging.getLogger(__name__)
+
+def find_replaced(user_id, folder_id, file_name):
+    """The file an upload called ``file_name`` becomes a new version of, or None for a new file"""
+    if not Config.FILE_VERSIONING:
+        return None
+    return File.get_by_name(user_id, folder_id, file_name)
+
+def replace_content(file_row, s3_key, s3_url, codec, file_size):
+    """Make a stored blob the current content of ``file_row``, keeping the old content as a version.
+
+    Returns a File for the updated row, or None if nothing was recorded, in
+    which case the caller deletes the new blob. The old blob is moved into
+    the chunk store afterwards by the ``snapshot_version`` job.
+    """
+    version_id = FileVersion.create(file_row)
+    if version_id is None:
+        return None
+    if not File.replace_content(file_row, s3_key, s3_url, codec, file_size):
+        FileVersion.delete_unused(version_id)
+        return None
+    job_queue.enqueue('snapshot_version', {'version_id': version_id}, priority=PRIORITY_LOW)
+
+    replaced = File(user_id=file_row['user_id'], file_name=file_row['file_name'], file_size=file_size,
+                    folder_id=file_row['folder_id'], s3_key=s3_key, s3_url=s3_url, codec=codec)
+    replaced.id = file_row['id']
+    return replaced
+
+def snapshot_version(version_id):
+    """Chunk a replaced version's blob into the chunk store, then delete the blob.
+
+    Only chunks the store does not already hold are uploaded, so a small
+    edit to a large file costs the chunks around the edit. Raises while the
+    blob is archived and awaiting a restore, so the job retries until it
+    can be read.
+    """
+    version = FileVersion.get_by_id(version_id)
+    if not version or version['manifest'] is not None:
+        return
+    key = version['s3_key']
+    backend = backend_for_key(key)
+    state = backend.restore_status(key)
+    if state is None:
+        logger.warning("Blob of file %s version %s is missing", version['file_id'], version['version'])
+        FileVersion.delete_many([version_id])
+        return
+    if state == 'archived':
+        result = backend.request_restore(key, Config.TIER_RESTORE_DAYS)
+        if not result['success']:
+            logger.error("Restore of file %s version %s failed: %s",
+                         version['file_id'], version['version'], result['error'])
+    if state != 'available':
+        raise RuntimeError('Version blob is being restored from archive')
+
+    # Chunking runs at a few MB/s, so a large version can outlast the job's lease
+    manifest = chunk_store.store(iter_decoded(backend, key, version['codec']), progress=_keep_lease)
+    if not FileVersion.set_manifest(version_id, manifest):
+        # Discarded, or already snapshotted by an earlier attempt, while we were chunking
+        chunk_store.release([manifest])
+        return
+    backend.delete_many([key])
+    prune_versions(version['file_id'])
+
+def _keep_lease():
+    if not job_queue.extend_lease():
+        raise RuntimeError('Snapshot job lost its lease to another worker')
+
+def _discard(rows):
+    """Delete version rows and give back their chunk references and blobs"""
+    if not rows:
+        return True
+    if not FileVersion.delete_many([row['id'] for row in rows]):
+        return False
+    chunk_store.release([row['manifest'] for row in rows if row['manifest'] is not None])
+    blobs = {}
+    for row in rows:
+        if row['s3_key']:
+            blobs.setdefault(backend_for_key(row['s3_key']), []).append(row['s3_key'])
+    for backend, keys in blobs.items():
+        backend.delete_many(keys)
+    return True
+
+def prune_versions(file_id):
+    """Discard a file's versions beyond the FILE_VERSIONS_KEEP newest"""
+    return _discard(FileVersion.get_beyond(file_id, Config.FILE_VERSIONS_KEEP))
+
+def discard_versions(file_ids):
+    """Discard every stored version of purged files"""
+    return _discard(FileVersion.get_by_files(list(file_ids)))
+
+def iter_version(version):
+    """Yield the original bytes of a stored version"""
+    if version['manifest'] is not None:
+        return chunk_store.iter_manifest(version['manifest'])
+    return iter_decoded(backend_for_key(version['s3_key']), version['s3_key'], version['codec'])
+
+def version_response(version):
+    """Stream a stored version as a download, or None if its blob is missing"""
+    if version['manifest'] is None and backend_for_key(version['s3_key']).head(version['s3_key']) is None:
+        return None
+    response = Response(iter_version(version), mimetype='application/octet-stream')
+    response.headers['Content-Length'] = str(version['file_size'])
+    response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(version['file_name'])}"
+    return response